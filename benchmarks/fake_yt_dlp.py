@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the yt-dlp executable, used by the load tests.
+
+Understands the command lines Media Catcher builds and answers them without touching
+the network:
+  - `--flat-playlist -J URL` prints a playlist listing with FAKE_YTDLP_PLAYLIST_SIZE entries,
+    and `--flat-playlist -j URL` prints it one entry per line, page by page; channel URLs
+    (youtube.com/@name) are listed newest first, so a larger size adds new items at the top
+  - `URL -o TEMPLATE ...` "downloads" a file, printing progress lines at a configurable pace,
+    rendering --progress-template / --print templates the way yt-dlp does (or classic
+    `[download]  42.0% of ...` lines without a template), and creating the output file;
+    --limit-rate caps the speed, and with FAKE_YTDLP_FRAGMENTS the download is a fragmented
+    stream fetched over --concurrent-fragments connections of FAKE_YTDLP_RATE each
+
+URLs on 127.0.0.1/localhost are really fetched over HTTP, so a local (throttled) server
+can stand in for a video site. Point Media Catcher at the stub with:
+
+    MEDIA_CATCHER_YTDLP="python benchmarks/fake_yt_dlp.py" media-catcher-cli urls.txt
+
+Behaviour is tuned through the environment:
+  FAKE_YTDLP_SIZE            bytes per download (default 1048576)
+  FAKE_YTDLP_RATE            bytes per second (per connection), 0 for no delay (default 0)
+  FAKE_YTDLP_FRAGMENTS       fragments of every synthetic download, 0 for a plain file (default 0)
+  FAKE_YTDLP_LINES           progress lines per download (default 20)
+  FAKE_YTDLP_STARTUP         seconds spent "extracting" before the download starts (default 0)
+  FAKE_YTDLP_FAIL            fraction of URLs that fail, picked deterministically (default 0)
+  FAKE_YTDLP_ERROR           error message of those failures, e.g. 'Private video' or
+                             'HTTP Error 429: Too Many Requests' (default 'Simulated failure')
+  FAKE_YTDLP_FLAKY           chance that any one download fails with an HTTP 503 (default 0)
+  FAKE_YTDLP_PLAYLIST_SIZE   entries in a playlist listing (default 10)
+  FAKE_YTDLP_PAGE_SIZE       entries per listing page (default 100)
+  FAKE_YTDLP_PAGE_DELAY      seconds it takes to fetch one listing page (default 0)
+  FAKE_YTDLP_MAX_HEIGHT      tallest video format a video offers (default 1080); requesting a
+                             format that is not offered fails like it does with yt-dlp
+"""
+
+# --- Standard Library Imports ---
+import sys
+import os
+import re
+import json
+import time
+import zlib
+import random
+import argparse
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+
+CHUNK_SIZE = 64 * 1024
+LOCAL_HOSTS = ("127.0.0.1", "localhost")
+
+def env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def settings():
+    """Reads the FAKE_YTDLP_* knobs from the environment."""
+    return {
+        "size": int(env_number("FAKE_YTDLP_SIZE", 1024 * 1024)),
+        "rate": env_number("FAKE_YTDLP_RATE", 0),
+        "fragments": int(env_number("FAKE_YTDLP_FRAGMENTS", 0)),
+        "lines": max(1, int(env_number("FAKE_YTDLP_LINES", 20))),
+        "startup": env_number("FAKE_YTDLP_STARTUP", 0),
+        "fail": env_number("FAKE_YTDLP_FAIL", 0),
+        "error": os.environ.get("FAKE_YTDLP_ERROR") or "Simulated failure",
+        "flaky": env_number("FAKE_YTDLP_FLAKY", 0),
+        "playlist_size": int(env_number("FAKE_YTDLP_PLAYLIST_SIZE", 10)),
+        "page_size": max(1, int(env_number("FAKE_YTDLP_PAGE_SIZE", 100))),
+        "page_delay": env_number("FAKE_YTDLP_PAGE_DELAY", 0),
+        "max_height": int(env_number("FAKE_YTDLP_MAX_HEIGHT", 1080)),
+    }
+
+def video_id(url):
+    """Derives a stable ID from the URL (its v= or list= parameter, else its last path segment)."""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    value = (query.get("v") or query.get("list") or [parsed.path.rstrip("/").rsplit("/", 1)[-1]])[0]
+    return re.sub(r"[^\w-]", "_", value) or f"{zlib.crc32(url.encode()):08x}"
+
+def should_fail(url, fraction):
+    """Picks the same failing URLs on every run."""
+    return fraction > 0 and zlib.crc32(url.encode()) % 10000 < fraction * 10000
+
+def render(template, fields):
+    """Fills a yt-dlp output template, printing 'NA' for unknown fields like yt-dlp does."""
+    def replace(match):
+        value = fields.get(match.group(1))
+        return "NA" if value is None else str(value)
+    return re.sub(r"%\(([^)]+)\)s", replace, template)
+
+def strip_prefix(template, prefix):
+    """Removes a yt-dlp 'type:' prefix (e.g. 'download:' or 'after_move:') from a template."""
+    return template[len(prefix):] if template and template.startswith(prefix) else template
+
+def classic_progress_line(downloaded, total, speed, eta):
+    """Formats progress the way yt-dlp prints it without --progress-template."""
+    return (f"[download] {downloaded * 100.0 / total:5.1f}% of {total / 1048576:.2f}MiB"
+            f" at {speed / 1048576:.2f}MiB/s ETA {int(eta) // 60:02d}:{int(eta) % 60:02d}")
+
+# --- Byte sources ---
+
+def synthetic_chunks(size, rate, lines):
+    """Yields `lines` equal chunk sizes, sleeping so that the stream runs at `rate` bytes/s."""
+    step = size / lines
+    sent = 0
+    for i in range(1, lines + 1):
+        chunk = int(step * i) - sent
+        if rate:
+            time.sleep(chunk / rate)
+        sent += chunk
+        yield chunk
+
+def throttled(chunks, limit):
+    """Passes chunks on no faster than `limit` bytes/s, the way --limit-rate does."""
+    started = time.time()
+    sent = 0
+    for chunk in chunks:
+        sent += chunk
+        wait = sent / limit - (time.time() - started)
+        if wait > 0:
+            time.sleep(wait)
+        yield chunk
+
+def parse_rate(text):
+    """Reads a --limit-rate value like '500K', '2M' or '1048576'."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)", text.strip(), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid rate: {text}")
+    return float(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " ")
+
+def http_chunks(response):
+    """Reads an HTTP response from the local test server, yielding the size of each chunk."""
+    with response:
+        while True:
+            data = response.read(CHUNK_SIZE)
+            if not data:
+                return
+            yield len(data)
+
+# YouTube-like format list: (format_id, ext, height, vcodec, acodec, tbr)
+FORMATS = [
+    ("140", "m4a", None, "none", "mp4a.40.2", 129), ("251", "webm", None, "none", "opus", 135),
+    ("18", "mp4", 360, "avc1.42001E", "mp4a.40.2", 500),
+    ("134", "mp4", 360, "avc1.4d401e", "none", 300), ("135", "mp4", 480, "avc1.4d401f", "none", 600),
+    ("136", "mp4", 720, "avc1.4d401f", "none", 1200), ("247", "webm", 720, "vp9", "none", 1100),
+    ("137", "mp4", 1080, "avc1.640028", "none", 2500), ("248", "webm", 1080, "vp9", "none", 2300),
+    ("399", "mp4", 1080, "av01.0.08M.08", "none", 2000),
+    ("271", "webm", 1440, "vp9", "none", 5000), ("313", "webm", 2160, "vp9", "none", 12000),
+]
+
+def video_formats(config):
+    return [{"format_id": format_id, "ext": ext, "height": height, "vcodec": vcodec, "acodec": acodec, "tbr": tbr}
+            for format_id, ext, height, vcodec, acodec, tbr in FORMATS if (height or 0) <= config["max_height"]]
+
+def resolve_format(format_spec, config):
+    """
+    Picks the first '/'-alternative whose format IDs the video offers (generic selectors like
+    'bestvideo' always match). Returns it, or None if no alternative can be satisfied.
+    """
+    available = {fmt["format_id"] for fmt in video_formats(config)}
+    for alternative in format_spec.split("/"):
+        if all("best" in part or part in available for part in alternative.split("+")):
+            return alternative
+    return None
+
+def format_ext(format_spec, args):
+    """Picks the extension yt-dlp would give one requested format."""
+    if args.extract_audio: # yt-dlp's -x puts AAC into an .m4a container
+        return {"aac": "m4a"}.get(args.audio_format, args.audio_format)
+    if format_spec and "+" not in format_spec and ("audio" in format_spec or format_spec == "140"):
+        return "m4a"
+    return args.merge_output_format or "mp4"
+
+def download(url, args, config):
+    """
+    Simulates (or, for local URLs, performs) one download. Returns the exit code.
+    A format list like '137,140' produces one file per format, as with yt-dlp.
+    """
+    if config["startup"]:
+        time.sleep(config["startup"])
+    if should_fail(url, config["fail"]):
+        sys.stderr.write(f"ERROR: [fake] {video_id(url)}: {config['error']}\n")
+        return 1
+    if config["flaky"] and random.random() < config["flaky"]:
+        sys.stderr.write(f"ERROR: [fake] {video_id(url)}: Unable to download webpage: "
+                         "HTTP Error 503: Service Unavailable\n")
+        return 1
+    format_specs = args.format.split(",") if args.format else [None]
+    for i, format_spec in enumerate(format_specs):
+        format_spec = format_spec and resolve_format(format_spec, config)
+        if format_spec is None and args.format:
+            sys.stderr.write(f"ERROR: [fake] {video_id(url)}: Requested format is not available\n")
+            return 1
+        format_specs[i] = format_spec
+    for format_spec in format_specs:
+        fields = {"id": video_id(url), "title": f"Fake video {video_id(url)}", "ext": format_ext(format_spec, args),
+                  "format_id": re.sub(r"[^\w-]", "_", format_spec or "best"),
+                  "extractor_key": "Fake", "extractor": "fake"}
+        download_file(url, args, config, fields)
+    sys.stdout.flush()
+    return 0
+
+def download_file(url, args, config, fields):
+    write = sys.stdout.write
+    filepath = render(args.output, fields)
+    tmpfilename = filepath + ".part"
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+
+    fragments = None
+    if (urlparse(url).hostname or "") in LOCAL_HOSTS:
+        response = urlopen(url)
+        local, total = True, int(response.headers.get("Content-Length") or 0) or None
+        chunks = http_chunks(response)
+    else:
+        local, total = False, config["size"]
+        rate = config["rate"]
+        if config["fragments"]:
+            fragments = config["fragments"]
+            rate *= min(fragments, int(args.concurrent_fragments or 1)) # One connection per fragment in flight
+        chunks = synthetic_chunks(config["size"], rate, config["lines"])
+    if args.limit_rate:
+        chunks = throttled(chunks, parse_rate(args.limit_rate))
+    progress_template = strip_prefix(args.progress_template, "download:")
+    started = time.time()
+    downloaded = 0
+    with open(tmpfilename, "wb") as f:
+        for chunk in chunks:
+            downloaded += chunk
+            if local:
+                f.write(b"\0" * chunk)
+            elapsed = max(time.time() - started, 1e-6)
+            speed = downloaded / elapsed
+            size = total or downloaded
+            eta = (size - downloaded) / speed if speed else 0
+            if progress_template:
+                write(render(progress_template, {
+                    "progress.status": "downloading", "progress.downloaded_bytes": downloaded,
+                    "progress.total_bytes": total, "progress.total_bytes_estimate": size,
+                    "progress.speed": round(speed, 1), "progress.eta": int(eta),
+                    "progress.fragment_count": fragments, "progress.tmpfilename": tmpfilename}) + "\n")
+            else:
+                write(classic_progress_line(downloaded, size, speed, eta) + "\n")
+        if not local:
+            f.truncate(downloaded) # Sparse file: the size is right without writing the bytes
+    os.replace(tmpfilename, filepath)
+
+    if progress_template:
+        # Like yt-dlp's own "finished" report: the final file name, but no tmpfilename, speed or ETA
+        write(render(progress_template, {
+            "progress.status": "finished", "progress.downloaded_bytes": downloaded,
+            "progress.total_bytes": downloaded, "progress.filename": filepath}) + "\n")
+    for template in args.print:
+        write(render(strip_prefix(template, "after_move:"), dict(fields, filepath=filepath)) + "\n")
+
+def playlist_id(url):
+    """A channel's handle (youtube.com/@name/videos), else the same ID as video_id()."""
+    match = re.search(r"/(@[\w.-]+)", urlparse(url).path)
+    return match.group(1) if match else video_id(url)
+
+def playlist_entries(url, config):
+    """
+    Yields the entries of a playlist, sleeping FAKE_YTDLP_PAGE_DELAY before every page. Items are
+    numbered in upload order; channels list the newest (highest number) first.
+    """
+    list_id = playlist_id(url)
+    numbers = range(1, config["playlist_size"] + 1)
+    if list_id.startswith("@"):
+        numbers = reversed(numbers)
+    for position, i in enumerate(numbers):
+        if position % config["page_size"] == 0 and config["page_delay"]:
+            time.sleep(config["page_delay"])
+        yield {"_type": "url", "ie_key": "Fake", "id": f"{list_id}-{i:04d}", "playlist_index": position + 1,
+               "url": f"https://fake.invalid/watch?v={list_id}-{i:04d}", "title": f"Item {i}"}
+
+def list_playlist(url, config):
+    """Prints a --flat-playlist -J listing."""
+    list_id = playlist_id(url)
+    json.dump({"_type": "playlist", "id": list_id, "title": f"Fake playlist {list_id}",
+               "entries": list(playlist_entries(url, config))}, sys.stdout)
+    sys.stdout.write("\n")
+    return 0
+
+def stream_playlist(url, config):
+    """Prints a --flat-playlist -j listing, one entry per line as its page arrives."""
+    for entry in playlist_entries(url, config):
+        sys.stdout.write(json.dumps(entry) + "\n")
+        sys.stdout.flush()
+    return 0
+
+def dump_video(url, config):
+    """Prints a -J extraction result for a single video, including its formats."""
+    json.dump({"id": video_id(url), "title": f"Fake video {video_id(url)}", "extractor_key": "Fake",
+               "webpage_url": url, "formats": video_formats(config)}, sys.stdout)
+    sys.stdout.write("\n")
+    return 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="fake-yt-dlp")
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("-o", "--output", default="%(title)s.%(ext)s")
+    parser.add_argument("-J", "--dump-single-json", action="store_true")
+    parser.add_argument("-j", "--dump-json", action="store_true")
+    parser.add_argument("--flat-playlist", action="store_true")
+    parser.add_argument("--load-info-json")
+    parser.add_argument("--progress-template")
+    parser.add_argument("--print", action="append", default=[])
+    parser.add_argument("-x", "--extract-audio", action="store_true")
+    parser.add_argument("--audio-format", default="mp3")
+    parser.add_argument("--merge-output-format")
+    parser.add_argument("-f", "--format")
+    # Accepted and ignored, so every command line Media Catcher builds parses
+    for flag in ("--newline", "--ignore-errors", "--progress", "--no-playlist", "--force-overwrites",
+                 "--write-auto-sub", "--lazy-playlist"):
+        parser.add_argument(flag, action="store_true")
+    for option in ("--playlist-items", "--audio-quality", "--sub-lang", "--convert-subs"):
+        parser.add_argument(option)
+    parser.add_argument("--limit-rate")
+    parser.add_argument("--concurrent-fragments")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    config = settings()
+    returncode = 0
+    if args.load_info_json:
+        with open(args.load_info_json, "r", encoding="utf-8") as f:
+            args.urls.append(json.load(f)["webpage_url"])
+    for url in args.urls:
+        if args.dump_single_json and args.flat_playlist:
+            returncode |= list_playlist(url, config)
+        elif args.dump_json and args.flat_playlist:
+            returncode |= stream_playlist(url, config)
+        elif args.dump_single_json:
+            returncode |= dump_video(url, config)
+        else:
+            returncode |= download(url, args, config)
+    return returncode
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Load test for Media Catcher's download pipeline.
+
+Runs batches of 1, 10, 100 and 1000 URLs through DownloadBatch without touching the
+network and reports, per batch size:
+  - wall time and jobs per second of the whole batch
+  - with --gui: the rate of Qt status signals delivered to the GUI thread and how late
+    a 10 ms timer on the GUI thread fires while DownloadThread is running (offscreen)
+It also times parse_progress_line(), the per-line cost paid for every line yt-dlp prints.
+With --limit-rate and/or --adaptive the batch runs under the bandwidth governor, and the
+achieved throughput (mib_per_s) and final concurrency limit are reported; --server-rate caps
+the local HTTP server as a whole, like a shared uplink, so there is a best concurrency to find.
+With --stop-after, every batch is stopped part-way and the time from request_stop() until
+batch.run() returned (stop_ms) and until the last process tree was gone (kill_ms) is reported.
+
+Two engines can be measured:
+  - fake:       an in-process engine that produces progress without spawning processes,
+                isolating the scheduler and progress plumbing
+  - subprocess: the real SubprocessEngine driving benchmarks/fake_yt_dlp.py, which adds
+                process start-up and pipe parsing; with --http it downloads from a local,
+                throttled HTTP server instead of synthesising the bytes
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --engine subprocess --sizes 1 10 100 --gui
+    python benchmarks/load_test.py --engine subprocess --http --rate 2000000 --json
+    python benchmarks/load_test.py --engine subprocess --sizes 20 --rate 100000 --stop-after 1
+    python benchmarks/load_test.py --engine subprocess --http --sizes 60 --rate 500000 --server-rate 2000000 \
+        -j 8 --per-host 8 --adaptive --limit-rate 1.5M
+
+State (download index, journal, output files) is kept in a scratch directory that is
+removed afterwards, so the user's own index and journal are never touched.
+"""
+
+# --- Standard Library Imports ---
+import sys
+import os
+import json
+import time
+import shlex
+import shutil
+import timeit
+import argparse
+import tempfile
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+APP_PATH = os.path.join(REPO_DIR, "media-catcher.py")
+FAKE_YTDLP = os.path.join(BENCHMARK_DIR, "fake_yt_dlp.py")
+
+# The engine resolves its state directories and the yt-dlp command when it is imported,
+# so both are redirected before the import.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="media-catcher-load-")
+os.environ.update(XDG_DATA_HOME=os.path.join(SCRATCH_DIR, "data"), XDG_CACHE_HOME=os.path.join(SCRATCH_DIR, "cache"),
+                  MEDIA_CATCHER_YTDLP=f"{shlex.quote(sys.executable)} {shlex.quote(FAKE_YTDLP)}")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, REPO_DIR)
+
+# --- Local Imports ---
+import media_catcher_engine as engine
+import fake_yt_dlp
+
+GUI_PROBE_INTERVAL_MS = 10
+
+class FakeEngine:
+    """
+    In-process engine with the same contract as the real ones. It renders progress lines
+    with PROGRESS_TEMPLATE and parses them back, so the parsing cost is still paid, but no
+    process is started and no file is written.
+    """
+    name = "fake"
+
+    def __init__(self, config):
+        self.config = config
+        self.template = fake_yt_dlp.strip_prefix(engine.PROGRESS_TEMPLATE, "download:")
+
+    def run(self, job, options, on_progress):
+        config = self.config
+        if config["startup"]:
+            time.sleep(config["startup"])
+        if fake_yt_dlp.should_fail(job.url, config["fail"]):
+            job.log.feed(f"ERROR: [fake] {fake_yt_dlp.video_id(job.url)}: {config['error']}\n")
+            return 1, job.log.last_error()
+
+        tmpfilename = options["outtmpl"] + ".part"
+        downloaded = 0
+        started = time.time()
+        for chunk in fake_yt_dlp.synthetic_chunks(config["size"], config["rate"], config["lines"]):
+            if job.cancel_token.cancelled:
+                return -15, ""
+            downloaded += chunk
+            speed = downloaded / max(time.time() - started, 1e-6)
+            line = fake_yt_dlp.render(self.template, {
+                "progress.status": "downloading", "progress.downloaded_bytes": downloaded,
+                "progress.total_bytes": config["size"], "progress.speed": round(speed, 1),
+                "progress.eta": int((config["size"] - downloaded) / speed), "progress.tmpfilename": tmpfilename})
+            on_progress(engine.parse_progress_line(line))
+        # yt-dlp ends every file with a "finished" report that has no tmpfilename, speed or ETA
+        on_progress(engine.parse_progress_line(fake_yt_dlp.render(self.template, {
+            "progress.status": "finished", "progress.downloaded_bytes": downloaded,
+            "progress.total_bytes": downloaded})))
+        job.outputs.append({"extractor": "Fake", "id": fake_yt_dlp.video_id(job.url),
+                            "filepath": options["outtmpl"]})
+        return 0, ""
+
+    def shutdown(self):
+        pass
+
+# --- Local HTTP server ---
+
+def start_http_server(size, rate, total_rate=0):
+    """
+    Serves `size` bytes of zeros for any path, throttled to `rate` bytes/s per connection and
+    to `total_rate` bytes/s over all connections together.
+    """
+    uplink_lock = threading.Lock()
+    uplink_free_at = [time.monotonic()] # When the shared uplink has sent everything queued so far
+
+    def pace_uplink(length):
+        with uplink_lock:
+            done_at = max(time.monotonic(), uplink_free_at[0]) + length / total_rate
+            uplink_free_at[0] = done_at
+        time.sleep(max(0.0, done_at - time.monotonic()))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            chunk = b"\0" * fake_yt_dlp.CHUNK_SIZE
+            sent = 0
+            while sent < size:
+                part = chunk[:size - sent]
+                if total_rate:
+                    pace_uplink(len(part))
+                self.wfile.write(part)
+                sent += len(part)
+                if rate:
+                    time.sleep(len(part) / rate)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Measurements ---
+
+def make_urls(count, hosts, http_server=None):
+    """Builds `count` distinct URLs spread round-robin over `hosts` fake sites (or the local server)."""
+    if http_server:
+        return [f"http://127.0.0.1:{http_server.server_address[1]}/video/bench{i:05d}" for i in range(count)]
+    return [f"https://host{i % hosts}.example/watch?v=bench{i:05d}" for i in range(count)]
+
+def batch_options(urls, args, download_engine):
+    return {"urls": urls, "mode": "Audio", "download_playlist": False, "download_subs": False,
+            "subtitle_lang": "en", "output_dir": tempfile.mkdtemp(dir=SCRATCH_DIR),
+            "max_workers": args.concurrency, "max_per_host": args.per_host, "engine": download_engine,
+            "skip_downloaded": False, "bandwidth_limit": args.limit_rate, "adaptive_concurrency": args.adaptive,
+            "defer_postprocessing": False} # The stand-in's files are not real media for ffmpeg
+
+def measure_parse_cost(number=200000):
+    """Returns the cost of parse_progress_line() in microseconds for a progress line and an ignored line."""
+    progress_line = ("[mc-progress] downloading|5242880|10485760|NA|2097152.0|2|NA|"
+                     "/home/user/Downloads/Some video title.mp3.part\n")
+    other_line = "[ExtractAudio] Destination: /home/user/Downloads/Some video title.mp3\n"
+    return {name: min(timeit.repeat(lambda: engine.parse_progress_line(line), number=number, repeat=3)) / number * 1e6
+            for name, line in (("progress_line_us", progress_line), ("other_line_us", other_line))}
+
+def run_headless(urls, args, download_engine):
+    """Runs one batch on the calling thread and returns its throughput."""
+    engine.clear_stop()
+    batch = engine.DownloadBatch(**batch_options(urls, args, download_engine))
+    stop_requested_at = []
+    if args.stop_after:
+        def stop():
+            stop_requested_at.append(time.perf_counter())
+            engine.request_stop()
+        stopper = threading.Timer(args.stop_after, stop)
+        stopper.start()
+    started = time.perf_counter()
+    summary = batch.run()
+    finished = time.perf_counter()
+    wall = finished - started
+    result = {"wall_s": wall, "jobs_per_s": summary["total"] / wall if wall else 0.0,
+              "done": summary.get("done", 0), "errors": summary.get("error", 0)}
+    if args.limit_rate or args.adaptive:
+        result["mib_per_s"] = batch.metrics_summary()["bytes"] / wall / 1048576 if wall else 0.0
+        result["limit"] = batch.governor.limit
+    if args.stop_after:
+        stopper.cancel()
+        result["stopped"] = summary.get("stopped", 0)
+        if stop_requested_at:
+            result["stop_ms"] = (finished - stop_requested_at[0]) * 1000
+            time.sleep(engine.STOP_GRACE_SECONDS + 0.5) # The escalation thread may still be reaping
+            result["kill_ms"] = (engine.last_stop_latency or 0.0) * 1000
+    return result
+
+def run_gui(urls, args, download_engine, app, app_module):
+    """
+    Runs one batch through DownloadThread under the Qt event loop, sampling progress the way
+    the main window does, and measures signal delivery and GUI-thread timer lateness.
+    """
+    from PyQt5.QtCore import QTimer
+
+    engine.clear_stop()
+    thread = app_module.DownloadThread(**batch_options(urls, args, download_engine))
+    signals = [0]
+    lateness = []
+    last_tick = [None]
+
+    def count_signal(*args):
+        signals[0] += 1
+
+    def probe():
+        now = time.perf_counter()
+        if last_tick[0] is not None:
+            lateness.append(max(0.0, (now - last_tick[0]) * 1000 - GUI_PROBE_INTERVAL_MS))
+        last_tick[0] = now
+
+    thread.status.connect(count_signal)
+    thread.job_status.connect(count_signal)
+    thread.finished.connect(app.quit)
+    sampler = QTimer()
+    sampler.setInterval(engine.PROGRESS_REFRESH_MS)
+    sampler.timeout.connect(thread.progress_board.aggregate)
+    prober = QTimer()
+    prober.setInterval(GUI_PROBE_INTERVAL_MS)
+    prober.timeout.connect(probe)
+
+    started = time.perf_counter()
+    sampler.start()
+    prober.start()
+    thread.start()
+    app.exec_()
+    wall = time.perf_counter() - started
+    thread.wait()
+    sampler.stop()
+    prober.stop()
+
+    summary = thread.batch.summary()
+    lateness.sort()
+    return {"wall_s": wall, "jobs_per_s": summary["total"] / wall if wall else 0.0,
+            "done": summary.get("done", 0), "errors": summary.get("error", 0),
+            "signals_per_s": signals[0] / wall if wall else 0.0,
+            "lag_p50_ms": statistics.median(lateness) if lateness else 0.0,
+            "lag_p99_ms": lateness[int(len(lateness) * 0.99)] if lateness else 0.0,
+            "lag_max_ms": lateness[-1] if lateness else 0.0}
+
+def load_app_module():
+    """Imports media-catcher.py (its file name is not a valid module name) and creates the QApplication."""
+    import importlib.util
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    spec = importlib.util.spec_from_file_location("media_catcher_app", APP_PATH)
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+    return app, app_module
+
+def print_table(results, parse_cost):
+    print(f"parse_progress_line: {parse_cost['progress_line_us']:.2f} us/progress line, "
+          f"{parse_cost['other_line_us']:.2f} us/other line")
+    columns = [("engine", 10, "s"), ("mode", 8, "s"), ("urls", 6, "d"), ("wall_s", 8, ".2f"),
+               ("jobs_per_s", 10, ".1f"), ("done", 6, "d"), ("errors", 6, "d"), ("signals_per_s", 13, ".1f"),
+               ("lag_p50_ms", 10, ".2f"), ("lag_p99_ms", 10, ".2f"), ("lag_max_ms", 10, ".2f"),
+               ("stopped", 7, "d"), ("stop_ms", 8, ".1f"), ("kill_ms", 8, ".1f"),
+               ("mib_per_s", 9, ".2f"), ("limit", 5, "d")]
+    columns = [column for column in columns if any(column[0] in result for result in results)]
+    print(" ".join(f"{name:>{width}}" for name, width, fmt in columns))
+    for result in results:
+        print(" ".join(f"{result[name]:>{width}{fmt}}" if name in result else " " * width
+                       for name, width, fmt in columns))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Media Catcher's download pipeline against a fake yt-dlp.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000], help="batch sizes in URLs")
+    parser.add_argument("--engine", choices=["fake", "subprocess"], default="fake")
+    parser.add_argument("--gui", action="store_true", help="also run every batch through DownloadThread under Qt")
+    parser.add_argument("--http", action="store_true", help="download from a local HTTP server (subprocess engine)")
+    parser.add_argument("-j", "--concurrency", type=int, default=engine.DEFAULT_MAX_WORKERS)
+    parser.add_argument("--per-host", type=int, default=engine.MAX_JOBS_PER_HOST)
+    parser.add_argument("--hosts", type=int, default=4, help="number of fake sites the URLs are spread over")
+    parser.add_argument("--bytes", type=int, default=1024 * 1024, help="size of every download")
+    parser.add_argument("--rate", type=float, default=0, help="bytes/s per download, 0 for no delay")
+    parser.add_argument("--lines", type=int, default=20, help="progress lines per download")
+    parser.add_argument("--startup", type=float, default=0, help="seconds before each download starts")
+    parser.add_argument("--fail", type=float, default=0, help="fraction of downloads that fail")
+    parser.add_argument("--fragments", type=int, default=0,
+                        help="make every synthetic download a stream of this many fragments (subprocess engine)")
+    parser.add_argument("--server-rate", type=float, default=0,
+                        help="bytes/s the local HTTP server sends over all connections together, 0 for no cap")
+    parser.add_argument("--limit-rate", type=engine.parse_rate, metavar="RATE",
+                        help="bandwidth budget of every batch, e.g. 2M (bytes/s)")
+    parser.add_argument("--adaptive", action="store_true", help="let the governor tune the concurrency (up to -j)")
+    parser.add_argument("--stop-after", type=float, default=0, metavar="SECONDS",
+                        help="stop every (headless) batch after this many seconds and measure the stop latency")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+    if args.http and args.engine != "subprocess":
+        parser.error("--http needs --engine subprocess")
+
+    config = {"size": args.bytes, "rate": args.rate, "lines": max(1, args.lines),
+              "startup": args.startup, "fail": args.fail, "fragments": args.fragments,
+              "error": "Video unavailable"} # A permanent error, so failures are not retried with backoff
+    # The stub reads the same knobs from its environment
+    os.environ.update({f"FAKE_YTDLP_{key.upper()}": str(value) for key, value in config.items()})
+    download_engine = FakeEngine(config) if args.engine == "fake" else engine.SubprocessEngine()
+    http_server = start_http_server(args.bytes, args.rate, args.server_rate) if args.http else None
+    gui = load_app_module() if args.gui else None
+
+    try:
+        parse_cost = measure_parse_cost()
+        results = []
+        for size in args.sizes:
+            urls = make_urls(size, max(1, args.hosts), http_server)
+            results.append(dict(run_headless(urls, args, download_engine),
+                                engine=args.engine, mode="headless", urls=size))
+            if gui:
+                results.append(dict(run_gui(urls, args, download_engine, *gui),
+                                    engine=args.engine, mode="gui", urls=size))
+    finally:
+        if http_server:
+            http_server.shutdown()
+        engine.shutdown_engines()
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"parse_cost": parse_cost, "results": results}, indent=2))
+    else:
+        print_table(results, parse_cost)
+    # Every URL must end up done or failed (or be stopped or still pending after --stop-after);
+    # anything else means the pipeline lost a job
+    if args.stop_after:
+        return 1 if any(result.get("stop_ms", 0) > 1000 for result in results) else 0
+    return 1 if any(result["done"] + result["errors"] != result["urls"] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
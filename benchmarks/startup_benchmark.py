@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for Media Catcher.
+
+Starts the GUI in fresh interpreters under QT_QPA_PLATFORM=offscreen and measures,
+from the moment the process is spawned:
+  - import:      the application module (and PyQt5) has been imported
+  - first_paint: the first paint event reaches one of the application's widgets
+  - ready:       the deferred start-up work queued behind the first paint has run
+
+    python benchmarks/startup_benchmark.py --runs 20
+    python benchmarks/startup_benchmark.py --save baseline.json
+    python benchmarks/startup_benchmark.py --baseline baseline.json --tolerance 0.2
+
+With --baseline the exit code is 1 if the median first_paint regressed by more than
+the tolerance, so the benchmark can guard against start-up regressions in CI.
+"""
+
+# --- Standard Library Imports ---
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "media-catcher.py")
+METRICS = ("import", "first_paint", "ready")
+
+# Runs inside the child interpreter; argv[1] is the parent's spawn timestamp and __app_path__ is
+# replaced with the path of media-catcher.py.
+CHILD_CODE = r"""
+import sys, json, time, importlib.util
+spawned = float(sys.argv[1])
+sys.argv = sys.argv[:1]
+spec = importlib.util.spec_from_file_location("media_catcher_app", __app_path__)
+app_module = importlib.util.module_from_spec(spec)
+sys.modules["media_catcher_app"] = app_module
+spec.loader.exec_module(app_module)
+marks = {"import": time.time()}
+
+from PyQt5.QtCore import QObject, QEvent, QTimer
+from PyQt5.QtWidgets import QApplication
+
+class PaintProbe(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and "first_paint" not in marks:
+            marks["first_paint"] = time.time()
+            # Queued behind any QTimer.singleShot(0, ...) work the window scheduled at start-up
+            QTimer.singleShot(0, finish)
+        return False
+
+def finish():
+    marks["ready"] = time.time()
+    print(json.dumps({name: (stamp - spawned) * 1000 for name, stamp in marks.items()}))
+    QApplication.instance().quit()
+
+probe = PaintProbe()
+original_show = app_module.MediaCatcher.show
+def show(window):
+    QApplication.instance().installEventFilter(probe)
+    original_show(window)
+app_module.MediaCatcher.show = show
+app_module.main()
+"""
+
+def run_once(python):
+    """Starts the app once in a clean environment and returns its timings in milliseconds."""
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen",
+                   XDG_DATA_HOME=os.path.join(home, "data"), XDG_CACHE_HOME=os.path.join(home, "cache"),
+                   XDG_RUNTIME_DIR=home)
+        code = CHILD_CODE.replace("__app_path__", repr(APP_PATH))
+        spawned = time.time()
+        result = subprocess.run([python, "-c", code, repr(spawned)], capture_output=True, text=True,
+                                env=env, timeout=60)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"Benchmark child failed:\n{result.stderr.strip()}")
+
+def summarize(samples):
+    return {metric: {"median": statistics.median(values), "min": min(values), "max": max(values)}
+            for metric, values in ((m, [sample[m] for sample in samples]) for m in METRICS)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Media Catcher's time to first paint.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable, help="interpreter used to start the app")
+    parser.add_argument("--save", metavar="FILE", help="write the summary as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare the median first_paint against a saved summary")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression over the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    run_once(args.python) # Warm-up: fills the OS file cache so the first sample is not an outlier
+    samples = [run_once(args.python) for _ in range(args.runs)]
+    summary = summarize(samples)
+
+    print(f"{'metric':<12} {'median':>9} {'min':>9} {'max':>9}   ({args.runs} runs, ms)")
+    for metric in METRICS:
+        stats = summary[metric]
+        print(f"{metric:<12} {stats['median']:9.1f} {stats['min']:9.1f} {stats['max']:9.1f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["first_paint"]["median"]
+        current = summary["first_paint"]["median"]
+        limit = baseline * (1 + args.tolerance)
+        print(f"first_paint median {current:.1f} ms vs baseline {baseline:.1f} ms (limit {limit:.1f} ms)")
+        if current > limit:
+            print("Start-up time regressed beyond the tolerance")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Headless command-line mode of Media Catcher.
+
+Runs the same download engine as the GUI without importing PyQt5, e.g. from cron:
+
+    media-catcher-cli urls.txt --mode audio --audio-format mp3 -o ~/Music -j 4
+    media-catcher-cli --sync-all -o ~/Music   # fetch what is new in every synced playlist
+    media-catcher-cli --export-archive archive.txt   # for yt-dlp --download-archive
+
+SIGUSR1 pauses all downloads and SIGUSR2 resumes them (e.g. `pkill -USR1 -f media-catcher-cli`).
+
+URLs are read one per line from a file (or from the URL cells of a .csv file), or from stdin
+when the file is '-' or omitted.
+Progress and status are written to stdout as JSON lines.
+"""
+
+# --- Standard Library Imports ---
+import sys
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+
+# Flatpak installs the engine module with the other data files, not next to this script.
+sys.path.append("/app/share/media-catcher")
+
+# --- Local Imports ---
+from media_catcher_engine import (DEFAULT_MAX_WORKERS, MAX_JOBS_PER_HOST, DEFAULT_ENGINE, AUDIO_QUALITY_MAP,
+                                  METRICS_PATH, DownloadBatch, download_index, job_journal, metrics_recorder,
+                                  request_stop, shutdown_engines, iter_url_file, parse_rate)
+
+VIDEO_QUALITIES = ["Best available", "137 (1080p)", "136 (720p)", "135 (480p)", "134 (360p)"]
+# Status colours used by the engine, mapped to log levels for machine consumers
+COLOR_LEVELS = {"green": "success", "red": "error", "orange": "warning", "gray": "skipped"}
+
+_output_lock = threading.Lock()
+
+def emit(event, **fields):
+    """Writes one JSON line to stdout."""
+    with _output_lock:
+        sys.stdout.write(json.dumps(dict(fields, event=event, time=round(time.time(), 3)), ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+def read_urls(source):
+    """Reads URLs from a .txt/.csv file, or one per line from stdin, skipping blank lines and '#' comments."""
+    if source not in (None, "-"):
+        return list(iter_url_file(source))
+    return [line.strip() for line in sys.stdin if line.strip() and not line.lstrip().startswith("#")]
+
+def rate_argument(text):
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="media-catcher-cli",
+                                     description="Download media with yt-dlp without the GUI; progress is printed as JSON lines.")
+    parser.add_argument("url_file", nargs="?", default="-", help="file with one URL per line, or a .csv file ('-' or omitted reads stdin)")
+    parser.add_argument("-m", "--mode", choices=["audio", "video"], default="audio")
+    parser.add_argument("--audio-format", choices=["mp3", "wav", "aac"], default="mp3")
+    parser.add_argument("--audio-quality", choices=list(AUDIO_QUALITY_MAP), default="192K")
+    parser.add_argument("--video-quality", choices=VIDEO_QUALITIES, default="Best available")
+    parser.add_argument("--subs", metavar="LANG", help="download auto subtitles in this language (video mode)")
+    parser.add_argument("-p", "--playlist", action="store_true", help="download entire playlists")
+    parser.add_argument("--sync", action="store_true",
+                        help="subscribe to the given playlists/channels and download only items no earlier sync has handled (implies --playlist)")
+    parser.add_argument("--sync-all", action="store_true", help="sync every playlist/channel synced before, instead of reading URLs")
+    parser.add_argument("-o", "--output-dir", default=os.path.expanduser("~/Downloads"))
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_MAX_WORKERS, help="parallel downloads")
+    parser.add_argument("--per-host", type=int, default=MAX_JOBS_PER_HOST, help="parallel downloads per site")
+    parser.add_argument("--limit-rate", type=rate_argument, metavar="RATE",
+                        help="bandwidth budget of the whole batch, e.g. 2M or 500K (bytes/s), split between the running downloads")
+    parser.add_argument("--adaptive-concurrency", action="store_true",
+                        help="tune the number of parallel downloads (up to -j) to the observed throughput and errors")
+    parser.add_argument("--engine", choices=["subprocess", "inprocess"], default=DEFAULT_ENGINE)
+    parser.add_argument("--no-skip", action="store_true", help="download items again even if the index has them")
+    parser.add_argument("--hardlink-duplicates", action="store_true",
+                        help="replace downloaded files that are byte-identical to an earlier one with hardlinks")
+    parser.add_argument("--inline-postprocessing", action="store_true",
+                        help="let yt-dlp run ffmpeg inside each download instead of in a separate stage")
+    parser.add_argument("--resume", action="store_true", help="continue the latest unfinished batch instead of reading URLs")
+    parser.add_argument("--export-archive", metavar="FILE",
+                        help="write the download index as a yt-dlp --download-archive file and exit")
+    parser.add_argument("--metrics", metavar="FILE", default=METRICS_PATH,
+                        help="JSON-lines file that receives one metrics record per job (default: %(default)s)")
+    parser.add_argument("--prometheus", metavar="FILE",
+                        help="write a batch summary in Prometheus textfile format, e.g. for node_exporter")
+    parser.add_argument("--progress-interval", type=float, default=1.0, metavar="SECONDS",
+                        help="seconds between aggregate progress lines (0 disables them)")
+    return parser.parse_args(argv)
+
+def build_batch(args):
+    """Creates the DownloadBatch described by the command line, or None if there is nothing to do."""
+    callbacks = {
+        "on_status": lambda message, color: emit("status", level=COLOR_LEVELS.get(color, "info"), message=message),
+        "on_job_status": lambda job, message, color: emit("job", job=job.id, url=job.url, title=job.title,
+                                                          state=job.state, level=COLOR_LEVELS.get(color, "info"),
+                                                          message=message),
+    }
+    common = {"max_workers": args.concurrency, "max_per_host": args.per_host, "engine": args.engine,
+              "defer_postprocessing": not args.inline_postprocessing, "prometheus_path": args.prometheus,
+              "bandwidth_limit": args.limit_rate, "adaptive_concurrency": args.adaptive_concurrency}
+    if args.resume:
+        pending = job_journal.pending()
+        if not pending:
+            return None
+        batch = pending[-1]
+        return DownloadBatch(urls=batch["urls"], resume=batch, **batch["settings"], **common, **callbacks)
+
+    if args.sync_all:
+        urls = [subscription["url"] for subscription in download_index.subscriptions()]
+    else:
+        urls = read_urls(args.url_file)
+    if not urls:
+        return None
+    sync = args.sync or args.sync_all
+    return DownloadBatch(urls=urls, mode=args.mode.capitalize(), download_playlist=args.playlist or sync, sync=sync,
+                         download_subs=bool(args.subs), subtitle_lang=args.subs or "en",
+                         output_dir=os.path.abspath(os.path.expanduser(args.output_dir)),
+                         audio_format=args.audio_format, audio_quality=args.audio_quality,
+                         video_quality=args.video_quality, skip_downloaded=not args.no_skip,
+                         hardlink_duplicates=args.hardlink_duplicates,
+                         **common, **callbacks)
+
+def report_progress(batch, interval, done):
+    """Prints the aggregate progress of the batch every `interval` seconds until `done` is set."""
+    while not done.wait(interval):
+        totals = batch.progress_board.aggregate()
+        stage = batch.postprocessing.stats()
+        emit("progress", postprocess_running=stage["running"], postprocess_queued=stage["queued"],
+             **{key: round(value, 2) if isinstance(value, float) else value for key, value in totals.items()})
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    metrics_recorder.path = os.path.abspath(os.path.expanduser(args.metrics))
+    if args.export_archive:
+        try:
+            count = download_index.export_archive(os.path.expanduser(args.export_archive))
+        except OSError as e:
+            emit("status", level="error", message=f"Could not export archive: {e}")
+            return 1
+        emit("status", level="success", message=f"Exported {count} item(s) to {args.export_archive}")
+        return 0
+    batch = build_batch(args)
+    if batch is None:
+        emit("status", level="error", message="No URLs to download")
+        return 2
+
+    # Ctrl+C and SIGTERM stop the batch the same way the GUI's Stop button does
+    signal.signal(signal.SIGINT, lambda signum, frame: request_stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: request_stop())
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: batch.pause_downloads())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: batch.resume_downloads())
+
+    done = threading.Event()
+    if args.progress_interval > 0:
+        threading.Thread(target=report_progress, args=(batch, args.progress_interval, done), daemon=True).start()
+    try:
+        summary = batch.run()
+    finally:
+        done.set()
+        shutdown_engines()
+    emit("finished", stages=batch.stage_stats(), metrics=batch.metrics_summary(), **summary)
+    return 1 if summary.get("error") or summary.get("stopped") else 0
+
+# --- Application Entry Point ---
+if __name__ == "__main__":
+    sys.exit(main())
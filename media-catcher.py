@@ -3,24 +3,33 @@
 # --- Standard Library Imports ---
 import sys
 import os
-import threading
-import re
 import json
-import subprocess
-from urllib.parse import urlparse
+import itertools
+from functools import lru_cache
 
 # --- Third-party Library Imports ---
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
+# Only the names that are used (QIcon is imported with the deferred icon loading).
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPlainTextEdit,
+                             QComboBox, QCheckBox, QSpinBox, QPushButton, QProgressBar, QFileDialog, QMessageBox,
+                             QTableView, QHeaderView, QAbstractItemView, QMenu, QDoubleSpinBox)
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex, QSignalBlocker
+from PyQt5.QtGui import QColor
 
 # --- Global Configuration ---
 # Get the directory where the script is located for relative path access.
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Flatpak installs the engine module with the other data files, not next to this script.
+sys.path.append("/app/share/media-catcher")
 
+# --- Local Imports ---
+from media_catcher_engine import (DEFAULT_MAX_WORKERS, PROGRESS_REFRESH_MS, SubprocessEngine, YoutubeDLEngine,
+                                  TERMINAL_STATES, DownloadBatch, download_index, job_journal, request_stop, clear_stop,
+                                  shutdown_engines, format_bytes, format_eta, iter_url_file)
+
+@lru_cache(maxsize=None)
 def load_themes():
     """
-    Loads theme definitions from a JSON file.
+    Loads theme definitions from a JSON file. The result is cached, so the file is only read once.
     It checks multiple standard locations, making it compatible with
     local execution and Flatpak installations.
     If no themes.json is found, it returns a hardcoded dictionary of fallback themes.
@@ -50,137 +59,167 @@ def load_themes():
         "Sunset": {"appearance": "Dark", "bg_color": "#1a1625", "button_color": "#ff6b6b", "hover_color": "#ee5a6f"}
     }
 
-# Load themes at startup.
-THEMES = load_themes()
-
-# --- Global variables for process and state management ---
-current_process = None
-stop_requested = False
+@lru_cache(maxsize=None)
+def build_stylesheet(theme_name):
+    """Formats the application stylesheet for a theme. Cached, so switching back to a theme is free."""
+    themes = load_themes()
+    theme = themes.get(theme_name, themes["Blueberry"])
+    is_dark = theme["appearance"] == "Dark"
+    
+    # Stylesheet templates for dark and light modes
+    # QSS allows for CSS-like styling of Qt widgets.
+    base_style = """
+        QMainWindow, QWidget {{ background-color: {bg_color}; color: {text_color}; }}
+        QPlainTextEdit {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; padding: 5px; color: {text_color}; }}
+        QComboBox {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; padding: 5px; color: {text_color}; }}
+        QSpinBox {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; padding: 5px; color: {text_color}; }}
+        QComboBox::drop-down {{ border: none; }}
+        QComboBox::down-arrow {{ border-left: 5px solid transparent; border-right: 5px solid transparent; border-top: 5px solid {text_color}; margin-right: 5px; }}
+        QCheckBox::indicator:unchecked {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 3px; }}
+        QCheckBox::indicator:checked {{ background-color: {button_color}; border: 1px solid {button_color}; border-radius: 3px; }}
+        QTableView {{ background-color: {input_bg}; alternate-background-color: {bg_color}; border: 1px solid #555; border-radius: 5px; gridline-color: #555; color: {text_color}; }}
+        QHeaderView::section {{ background-color: {bg_color}; color: {text_color}; border: none; border-bottom: 1px solid #555; padding: 3px; }}
+        QProgressBar {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; text-align: center; }}
+        QProgressBar::chunk {{ background-color: {button_color}; border-radius: 5px; }}
+        QPushButton {{ background-color: {button_color}; color: white; border: none; border-radius: 5px; padding: 8px 16px; font-weight: bold; }}
+        QPushButton:hover {{ background-color: {hover_color}; }}
+        QPushButton:disabled {{ background-color: #555; color: #999; }}
+    """
+    return base_style.format(
+        bg_color=theme["bg_color"],
+        text_color="white" if is_dark else "black",
+        input_bg="#2b2b2b" if is_dark else "white",
+        button_color=theme["button_color"],
+        hover_color=theme["hover_color"]
+    )
+
+# --- Global variables for UI state ---
 output_dir = os.path.expanduser("~/Downloads") # Default output directory
+IMPORT_CHUNK_LINES = 2000 # URLs read from an imported file per event loop turn
+
+class DownloadQueueModel(QAbstractTableModel):
+    """
+    Table model of the download queue, one row per item. Before a download the rows are the
+    imported URLs; during a download they follow the batch's jobs. Rows are only ever appended
+    in blocks and refreshed in place, and the view asks only for the rows it shows, so the
+    queue stays responsive with tens of thousands of items.
+    """
+    COLUMNS = ("#", "Item", "Status", "Progress")
+    STATUS_COLUMN, PROGRESS_COLUMN = 2, 3
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = [] # [job or None, label, message, color]
+        self._row_of_job = {} # job id -> row
+        self.progress_board = None
+
+    # --- Qt model interface ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        job, label, message, color = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return str(job.id if job else index.row() + 1)
+            if column == 1:
+                return label
+            if column == self.STATUS_COLUMN:
+                return message or (job.state if job else "imported")
+            if column == self.PROGRESS_COLUMN and job and self.progress_board:
+                progress = self.progress_board.get(job.id)
+                if progress and progress.get("percent") is not None:
+                    text = f"{progress['percent']:.1f}%"
+                    if progress.get("active") and progress.get("speed"):
+                        text += f"  {format_bytes(progress['speed'])}/s"
+                    return text
+        elif role == Qt.ForegroundRole and column == self.STATUS_COLUMN and color not in (None, "white"):
+            return QColor(color)
+        elif role == Qt.ToolTipRole and column == 1:
+            return job.url if job else label
+        return None
+
+    # --- Incremental updates ---
+
+    def append_urls(self, urls):
+        """Adds imported URLs as rows in one block."""
+        self._append([[None, url, None, None] for url in urls])
+
+    def append_jobs(self, jobs):
+        """Adds the rows of newly queued jobs in one block."""
+        start = len(self._rows)
+        self._append([[job, job.title or job.url, None, None] for job in jobs])
+        for offset, job in enumerate(jobs):
+            self._row_of_job[job.id] = start + offset
+
+    def _append(self, rows):
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def set_job_message(self, job_id, message, color):
+        """Stores the latest status message of a job and repaints only its row."""
+        row = self._row_of_job.get(job_id)
+        if row is None:
+            return
+        self._rows[row][2:] = [message, color]
+        self.dataChanged.emit(self.index(row, self.STATUS_COLUMN), self.index(row, self.STATUS_COLUMN))
+
+    def refresh_rows(self, first, last):
+        """Repaints the progress cells of the given (visible) rows."""
+        if self._rows and first <= last:
+            self.dataChanged.emit(self.index(first, self.PROGRESS_COLUMN), self.index(last, self.PROGRESS_COLUMN))
+
+    def job_count(self):
+        return len(self._row_of_job)
+
+    def job_at(self, row):
+        """Returns the job shown in a row, or None for imported URLs."""
+        return self._rows[row][0] if 0 <= row < len(self._rows) else None
+
+    def reset(self, progress_board=None):
+        """Empties the queue, e.g. when a new batch starts."""
+        self.beginResetModel()
+        self._rows = []
+        self._row_of_job = {}
+        self.progress_board = progress_board
+        self.endResetModel()
 
 class DownloadThread(QThread):
     """
-    Handles the download process in a separate thread to prevent the GUI from freezing.
-    It emits signals to update the main window's progress bar and status labels.
+    Runs a DownloadBatch in a separate thread to prevent the GUI from freezing.
+    The batch's status callbacks are forwarded as signals, while transfer progress
+    stays in `progress_board` for the UI to sample.
     """
     # Signals to communicate with the main UI thread
-    progress = pyqtSignal(float)
     status = pyqtSignal(str, str) # Message and color
+    job_status = pyqtSignal(int, str, str) # Job id, message and color
     finished = pyqtSignal()
-    
-    def __init__(self, urls, mode, download_playlist, download_subs, subtitle_lang, output_dir):
+
+    def __init__(self, **options):
         super().__init__()
-        self.urls = urls
-        self.mode = mode
-        self.download_playlist = download_playlist
-        self.download_subs = download_subs
-        self.subtitle_lang = subtitle_lang
-        self.output_dir = output_dir
-        
+        self.batch = DownloadBatch(on_status=self.status.emit,
+                                   on_job_status=lambda job, message, color: self.job_status.emit(job.id, message, color),
+                                   **options)
+        self.progress_board = self.batch.progress_board
+        self.postprocessing = self.batch.postprocessing
+
     def run(self):
-        """
-        The core worker method. This constructs and executes the yt-dlp command.
-        """
-        global current_process, stop_requested
-        
-        # --- Pre-computation of URLs and video counts ---
-        # This section analyzes the input URLs to provide an accurate total video count.
-        all_urls = []
-        download_info = [] # Stores metadata for each URL (count, type, etc.)
-        
-        for url in self.urls:
-            if is_playlist_url(url) and self.download_playlist:
-                count = get_playlist_count(url)
-                all_urls.append(url)
-                download_info.append({"url": url, "count": count, "type": "full_playlist"})
-            elif is_playlist_url(url) and not self.download_playlist:
-                self.status.emit("⚠️ Playlist detected - downloading first video only", "orange")
-                all_urls.append(url)
-                download_info.append({"url": url, "count": 1, "type": "single"})
-            elif is_video_from_playlist(url) and self.download_playlist:
-                start_index = get_video_index_from_url(url)
-                total_count = get_playlist_count(url)
-                remaining = max(1, total_count - start_index + 1)
-                self.status.emit(f"📋 Downloading playlist from video #{start_index}", "cyan")
-                all_urls.append(url)
-                download_info.append({"url": url, "count": remaining, "type": "partial_playlist"})
-            else: # Standard video URL or single video from a playlist
-                clean_url = url.split('&list=')[0] if '&list=' in url else url
-                all_urls.append(clean_url)
-                download_info.append({"url": clean_url, "count": 1, "type": "single"})
-
-        total_videos = sum(info["count"] for info in download_info)
-        current_video = 0
-        
-        # --- Main Download Loop ---
-        for url, info in zip(all_urls, download_info):
-            if stop_requested: break
-            
-            # --- Construct yt-dlp command ---
-            output_path = os.path.join(self.output_dir, "%(title)s.%(ext)s")
-            cmd = ["yt-dlp", url, "-o", output_path, "--newline", "--ignore-errors"]
-
-            # Add mode-specific and playlist-specific arguments
-            if info["type"] == "single" and is_playlist_url(url):
-                cmd.extend(["--playlist-items", "1"])
-            elif info["type"] == "partial_playlist":
-                cmd.extend(["--playlist-start", str(get_video_index_from_url(url))])
-
-            if self.mode == "Audio":
-                audio_format = window.combo_audio_format.currentText()
-                cmd.extend(["-x", "--audio-format", audio_format, "--force-overwrites"])
-                if audio_format in ["mp3", "aac"]:
-                    quality = window.combo_quality_audio.currentText()
-                    quality_map = {"320K": "0", "192K": "2", "128K": "5", "64K": "9"}
-                    cmd.extend(["--audio-quality", quality_map.get(quality, "2")])
-            else: # Video Mode
-                cmd.extend(["--merge-output-format", "mp4"])
-                if is_youtube_url(url): # YouTube requires specific format codes
-                    if self.download_subs:
-                        cmd.extend(["-f", "bestvideo+bestaudio", "--write-auto-sub", 
-                                    "--sub-lang", self.subtitle_lang, "--convert-subs", "srt"])
-                    else:
-                        quality_id = window.combo_quality_video.currentText()
-                        format_code = f"{quality_id.split()[0]}+140" if quality_id != "Best available" else "bestvideo+bestaudio"
-                        cmd.extend(["-f", format_code])
-                else: # For other sites, 'best' is more reliable
-                    cmd.extend(["-f", "best"])
-
-            # --- Execute and Monitor Process ---
-            try:
-                self.progress.emit(0)
-                if info["type"] != "full_playlist":
-                     current_video += 1
-                self.status.emit(f"⬇️ Downloading ({current_video}/{total_videos})...", "white")
-
-                current_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, 
-                                                   stderr=subprocess.PIPE, text=True,
-                                                   encoding='utf-8', errors='replace')
-                
-                # Parse stdout for progress updates
-                for line in current_process.stdout:
-                    if stop_requested: break
-                    
-                    match = re.search(r'\[download\]\s+(\d{1,3}\.?\d*)%', line)
-                    if match:
-                        self.progress.emit(float(match.group(1)))
-                    # Update count for completed playlist items
-                    if info["type"] == "full_playlist" and ('[download] 100%' in line or 'has already been downloaded' in line):
-                        current_video +=1
-                        self.status.emit(f"⬇️ Completed video {current_video}/{total_videos}", "white")
-
-                stdout, stderr = current_process.communicate() # Get final output
-                
-                if stop_requested: break
-                
-                if current_process.returncode == 0:
-                     self.status.emit(f"✅ Done ({current_video}/{total_videos})", "green")
-                else:
-                    self.status.emit(f"❌ Error: {stderr.strip()[:100]}...", "red")
-            except Exception as e:
-                self.status.emit(f"❌ Exception: {str(e)}", "red")
-        
-        # Signal that the entire process has finished
+        """The core worker method. Runs the whole batch, then signals that it has finished."""
+        self.batch.run()
         self.finished.emit()
 
 class MediaCatcher(QMainWindow):
@@ -191,17 +230,23 @@ class MediaCatcher(QMainWindow):
     def __init__(self):
         super().__init__()
         self.download_thread = None
+        # Samples the download thread's progress board at a fixed rate while downloading
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(PROGRESS_REFRESH_MS)
+        self.progress_timer.timeout.connect(self.refresh_progress)
+        self.imported_urls = [] # URLs from imported list files, kept out of the text box
+        self._import_stream = None
+        self._import_timer = QTimer(self)
+        self._import_timer.timeout.connect(self._import_next_chunk)
         self.init_ui()
         self.apply_theme("Blueberry") # Set default theme
+        QTimer.singleShot(0, self.finish_startup) # Runs once the window has been shown
         
     def init_ui(self):
         """Initializes all UI components and layouts."""
         self.setWindowTitle("Media Catcher")
-        self.setFixedSize(700, 700) # Prevent resizing to maintain layout
-        
-        # --- Application Icon Loading ---
-        # This extensive check ensures the icon is found in various environments, especially Flatpak.
-        self._load_app_icon()
+        self.resize(720, 900)
+        self.setMinimumWidth(700)
         
         # --- Central Widget and Main Layout ---
         central_widget = QWidget()
@@ -216,7 +261,7 @@ class MediaCatcher(QMainWindow):
         title_label.setStyleSheet("font-size: 20px; font-weight: bold; padding: 10px;")
         layout.addWidget(title_label)
         
-        self.entry_url = QTextEdit()
+        self.entry_url = QPlainTextEdit() # Plain text stays fast with thousands of pasted lines
         self.entry_url.setMaximumHeight(100)
         self.entry_url.setPlaceholderText("🔗 Enter URL(s), one per line...")
         layout.addWidget(self.entry_url)
@@ -244,9 +289,60 @@ class MediaCatcher(QMainWindow):
         playlist_layout.addStretch()
         self.checkbox_playlist = QCheckBox("Download entire playlist")
         playlist_layout.addWidget(self.checkbox_playlist)
+        self.checkbox_sync = QCheckBox("Only new items")
+        self.checkbox_sync.stateChanged.connect(self.update_sync_state)
+        playlist_layout.addWidget(self.checkbox_sync)
         playlist_layout.addStretch()
         layout.addLayout(playlist_layout)
 
+        # Download index checkboxes
+        index_layout = QHBoxLayout()
+        index_layout.addStretch()
+        self.checkbox_skip_downloaded = QCheckBox("Skip already downloaded")
+        self.checkbox_skip_downloaded.setChecked(True)
+        index_layout.addWidget(self.checkbox_skip_downloaded)
+        self.checkbox_hardlink = QCheckBox("Hardlink duplicates")
+        index_layout.addWidget(self.checkbox_hardlink)
+        index_layout.addStretch()
+        layout.addLayout(index_layout)
+
+        # Number of parallel downloads
+        workers_layout = QHBoxLayout()
+        workers_layout.addStretch()
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, 8)
+        self.spin_workers.setValue(DEFAULT_MAX_WORKERS)
+        self.spin_workers.setFixedWidth(80)
+        workers_layout.addWidget(QLabel("Parallel downloads:"))
+        workers_layout.addWidget(self.spin_workers)
+        self.combo_engine = QComboBox()
+        self.combo_engine.addItem("yt-dlp process", SubprocessEngine.name)
+        if YoutubeDLEngine.is_available():
+            self.combo_engine.addItem("In-process", YoutubeDLEngine.name)
+        self.combo_engine.setFixedWidth(160)
+        workers_layout.addWidget(QLabel("Engine:"))
+        workers_layout.addWidget(self.combo_engine)
+        workers_layout.addStretch()
+        layout.addLayout(workers_layout)
+
+        # Bandwidth budget of the whole batch and adaptive concurrency
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_layout.addStretch()
+        self.spin_bandwidth = QDoubleSpinBox()
+        self.spin_bandwidth.setRange(0, 1000)
+        self.spin_bandwidth.setDecimals(1)
+        self.spin_bandwidth.setSingleStep(0.5)
+        self.spin_bandwidth.setSuffix(" MiB/s")
+        self.spin_bandwidth.setSpecialValueText("Unlimited") # Shown for 0
+        self.spin_bandwidth.setFixedWidth(120)
+        bandwidth_layout.addWidget(QLabel("Bandwidth limit:"))
+        bandwidth_layout.addWidget(self.spin_bandwidth)
+        self.checkbox_adaptive = QCheckBox("Adapt parallel downloads")
+        self.checkbox_adaptive.setToolTip("Run up to the set number of downloads at once, as many as raise the speed")
+        bandwidth_layout.addWidget(self.checkbox_adaptive)
+        bandwidth_layout.addStretch()
+        layout.addLayout(bandwidth_layout)
+
         # --- Dynamic Options ---
         # Audio Options
         self.audio_options_widget = QWidget()
@@ -270,8 +366,16 @@ class MediaCatcher(QMainWindow):
         # --- Folder and Action Buttons ---
         self.folder_button = QPushButton("Select Output Folder")
         self.folder_button.clicked.connect(self.choose_folder)
+        self.archive_button = QPushButton("Import Archive")
+        self.archive_button.clicked.connect(self.import_archive)
+        self.import_button = QPushButton("Import URLs")
+        self.import_button.clicked.connect(self.import_url_list)
         self.label_output = QLabel(f"Saving to: {output_dir}", alignment=Qt.AlignCenter)
-        layout.addWidget(self.folder_button)
+        folder_layout = QHBoxLayout()
+        folder_layout.addWidget(self.folder_button)
+        folder_layout.addWidget(self.import_button)
+        folder_layout.addWidget(self.archive_button)
+        layout.addLayout(folder_layout)
         layout.addWidget(self.label_output)
 
         button_layout = QHBoxLayout()
@@ -280,26 +384,59 @@ class MediaCatcher(QMainWindow):
         self.stop_button = QPushButton("Stop")
         self.stop_button.clicked.connect(self.stop_download)
         self.stop_button.setEnabled(False)
+        self.pause_button = QPushButton("Pause")
+        self.pause_button.setCheckable(True)
+        self.pause_button.toggled.connect(self.toggle_pause)
+        self.pause_button.setEnabled(False)
         self.clear_button = QPushButton("Clear")
         self.clear_button.clicked.connect(self.clear_and_reset)
         button_layout.addStretch()
         button_layout.addWidget(self.download_button)
+        button_layout.addWidget(self.pause_button)
         button_layout.addWidget(self.stop_button)
         button_layout.addWidget(self.clear_button)
         button_layout.addStretch()
         layout.addLayout(button_layout)
         
         # --- Theme, Progress Bar, and Status ---
-        self.combo_theme = self._create_combo_box(list(THEMES.keys()), "Theme:", layout, "Blueberry", True)
+        self.combo_theme = self._create_combo_box(list(load_themes().keys()), "Theme:", layout, "Blueberry", True)
         self.combo_theme.currentTextChanged.connect(self.on_theme_change)
 
         self.progress_bar = QProgressBar(textVisible=False)
         self.progress_label = QLabel("Progress: 0%", alignment=Qt.AlignCenter)
         self.status_label = QLabel("", alignment=Qt.AlignCenter)
+        # Batch totals from the job metrics, shown once a batch has finished
+        self.summary_label = QLabel("", alignment=Qt.AlignCenter)
+        self.summary_label.setStyleSheet("font-size: 11px; color: gray;")
+        self.summary_label.hide()
         layout.addWidget(self.progress_bar)
         layout.addWidget(self.progress_label)
         layout.addWidget(self.status_label)
-        layout.addStretch()
+        layout.addWidget(self.summary_label)
+
+        # --- Download Queue ---
+        self.queue_model = DownloadQueueModel(self)
+        self.queue_view = QTableView()
+        self.queue_view.setModel(self.queue_model)
+        self.queue_view.setMinimumHeight(120)
+        self.queue_view.setAlternatingRowColors(True)
+        self.queue_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queue_view.setWordWrap(False)
+        self.queue_view.verticalHeader().hide()
+        # Fixed row heights and column modes: the view never measures the contents of all rows
+        self.queue_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.queue_view.verticalHeader().setDefaultSectionSize(22)
+        header = self.queue_view.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+        header.resizeSection(0, 50)
+        header.resizeSection(DownloadQueueModel.STATUS_COLUMN, 210)
+        header.resizeSection(DownloadQueueModel.PROGRESS_COLUMN, 130)
+        # Right-clicking a row pauses, resumes or cancels that job
+        self.queue_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.queue_view.customContextMenuRequested.connect(self.show_job_menu)
+        layout.addWidget(self.queue_view, 1)
 
     def _create_combo_box(self, items, label_text, parent_layout, default_text=None, centered=False):
         """Helper to create a labeled QComboBox and add it to a layout."""
@@ -317,8 +454,16 @@ class MediaCatcher(QMainWindow):
         parent_layout.addLayout(layout)
         return combo
 
+    def finish_startup(self):
+        """Non-critical initialisation, deferred until after the window has been painted."""
+        # --- Application Icon Loading ---
+        # This extensive check ensures the icon is found in various environments, especially Flatpak.
+        self._load_app_icon()
+        self.offer_resume()
+
     def _load_app_icon(self):
         """Loads the application icon, checking multiple paths for compatibility."""
+        from PyQt5.QtGui import QIcon
         icon_paths = [
             "/app/share/icons/hicolor/scalable/apps/io.github.MarkusAureus.MediaCatcher.svg",
             os.path.join(SCRIPT_DIR, "io.github.MarkusAureus.MediaCatcher.svg"),
@@ -335,32 +480,7 @@ class MediaCatcher(QMainWindow):
 
     def apply_theme(self, theme_name):
         """Applies a theme to the application using QSS stylesheets."""
-        theme = THEMES.get(theme_name, THEMES["Blueberry"])
-        is_dark = theme["appearance"] == "Dark"
-        
-        # Stylesheet templates for dark and light modes
-        # QSS allows for CSS-like styling of Qt widgets.
-        base_style = """
-            QMainWindow, QWidget {{ background-color: {bg_color}; color: {text_color}; }}
-            QTextEdit {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; padding: 5px; color: {text_color}; }}
-            QComboBox {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; padding: 5px; color: {text_color}; }}
-            QComboBox::drop-down {{ border: none; }}
-            QComboBox::down-arrow {{ border-left: 5px solid transparent; border-right: 5px solid transparent; border-top: 5px solid {text_color}; margin-right: 5px; }}
-            QCheckBox::indicator:unchecked {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 3px; }}
-            QCheckBox::indicator:checked {{ background-color: {button_color}; border: 1px solid {button_color}; border-radius: 3px; }}
-            QProgressBar {{ background-color: {input_bg}; border: 1px solid #555; border-radius: 5px; text-align: center; }}
-            QProgressBar::chunk {{ background-color: {button_color}; border-radius: 5px; }}
-            QPushButton {{ background-color: {button_color}; color: white; border: none; border-radius: 5px; padding: 8px 16px; font-weight: bold; }}
-            QPushButton:hover {{ background-color: {hover_color}; }}
-            QPushButton:disabled {{ background-color: #555; color: #999; }}
-        """
-        self.setStyleSheet(base_style.format(
-            bg_color=theme["bg_color"],
-            text_color="white" if is_dark else "black",
-            input_bg="#2b2b2b" if is_dark else "white",
-            button_color=theme["button_color"],
-            hover_color=theme["hover_color"]
-        ))
+        self.setStyleSheet(build_stylesheet(theme_name))
         # Specific overrides for certain buttons
         self.stop_button.setStyleSheet("QPushButton { background-color: #dc3545; } QPushButton:hover { background-color: #c82333; }")
         self.clear_button.setStyleSheet("QPushButton { background-color: #444; } QPushButton:hover { background-color: #666; }")
@@ -393,6 +513,12 @@ class MediaCatcher(QMainWindow):
         if self.checkbox_subtitles.isChecked():
             self.combo_quality_video.setCurrentText("Best available")
     
+    def update_sync_state(self):
+        """Sync mode works on whole playlists, so it turns on playlist downloads."""
+        if self.checkbox_sync.isChecked():
+            self.checkbox_playlist.setChecked(True)
+        self.checkbox_playlist.setEnabled(not self.checkbox_sync.isChecked())
+
     def choose_folder(self):
         """Opens a dialog to select the download destination."""
         global output_dir
@@ -400,96 +526,241 @@ class MediaCatcher(QMainWindow):
         if folder:
             output_dir = folder
             self.label_output.setText(f"Saving to: {output_dir}")
+
+    def import_archive(self):
+        """Imports a yt-dlp --download-archive file into the download index."""
+        path, _ = QFileDialog.getOpenFileName(self, "Import Download Archive", output_dir, "Text files (*.txt);;All files (*)")
+        if not path:
+            return
+        try:
+            added = download_index.import_archive(path)
+            self.update_status(f"📥 Imported {added} archived item(s)", "green")
+        except Exception as e: # OSError or sqlite3.Error
+            self.update_status(f"❌ Could not import archive: {e}", "red")
             
+    def import_url_list(self):
+        """Streams the URLs of a .txt/.csv file into the queue, a chunk per event loop turn."""
+        path, _ = QFileDialog.getOpenFileName(self, "Import URL List", output_dir,
+                                              "URL lists (*.txt *.csv);;All files (*)")
+        if not path:
+            return
+        if self.download_thread and self.download_thread.isRunning():
+            self.update_status("⚠️ Wait for the current download to finish before importing", "orange")
+            return
+        if self.queue_model.job_count(): # The table still shows the previous batch
+            self.imported_urls = []
+            self.queue_model.reset()
+        self._import_stream = iter_url_file(path)
+        self.import_button.setEnabled(False)
+        self._import_timer.start(0)
+
+    def _import_next_chunk(self):
+        try:
+            chunk = list(itertools.islice(self._import_stream, IMPORT_CHUNK_LINES))
+        except OSError as e:
+            chunk = []
+            self.update_status(f"❌ Could not read URL list: {e}", "red")
+        self.imported_urls.extend(chunk)
+        self.queue_model.append_urls(chunk)
+        if len(chunk) < IMPORT_CHUNK_LINES: # The file is exhausted
+            self._import_timer.stop()
+            self._import_stream = None
+            self.import_button.setEnabled(True)
+            self.update_status(f"📥 {len(self.imported_urls)} URL(s) queued from lists", "green")
+        
     def clear_and_reset(self):
         """Resets input fields and status labels."""
         self.entry_url.clear()
         self.status_label.setText("")
         self.progress_bar.setValue(0)
         self.progress_label.setText("Progress: 0%")
+        self.summary_label.hide()
+        if not (self.download_thread and self.download_thread.isRunning()):
+            self._import_timer.stop()
+            self._import_stream = None
+            self.import_button.setEnabled(True)
+            self.imported_urls = []
+            self.queue_model.reset()
         
+    def offer_resume(self):
+        """Offers to continue a batch that was interrupted in a previous session."""
+        pending = job_journal.pending()
+        if not pending:
+            return
+        batch = pending[-1]
+        count = len(batch["jobs"]) + len(batch["urls"])
+        answer = QMessageBox.question(self, "Resume Downloads",
+                                      f"{count} download(s) from a previous session did not finish.\nResume them now?")
+        if answer == QMessageBox.Yes:
+            self.launch_download(urls=batch["urls"], resume=batch, **batch["settings"])
+        else:
+            job_journal.compact(discard={batch["batch"]})
+
     def start_download(self):
         """Validates input and starts the DownloadThread."""
-        global is_downloading, stop_requested
-        urls_text = self.entry_url.toPlainText().strip()
-        if not urls_text:
+        urls = [line.strip() for line in self.entry_url.toPlainText().splitlines() if line.strip()]
+        urls += self.imported_urls
+        if not urls:
             self.update_status("❌ Please enter a valid URL", "red")
             return
         
-        is_downloading, stop_requested = True, False
-        self.download_button.setEnabled(False)
-        self.stop_button.setEnabled(True)
-        
-        self.download_thread = DownloadThread(
-            urls=[line.strip() for line in urls_text.splitlines() if line.strip()],
+        self.launch_download(
+            urls=urls,
             mode=self.combo_mode.currentText(),
             download_playlist=self.checkbox_playlist.isChecked(),
             download_subs=self.checkbox_subtitles.isChecked(),
             subtitle_lang=self.combo_sub_lang.currentText().split()[0],
-            output_dir=output_dir
+            output_dir=output_dir,
+            audio_format=self.combo_audio_format.currentText(),
+            audio_quality=self.combo_quality_audio.currentText(),
+            video_quality=self.combo_quality_video.currentText(),
+            skip_downloaded=self.checkbox_skip_downloaded.isChecked(),
+            hardlink_duplicates=self.checkbox_hardlink.isChecked(),
+            sync=self.checkbox_sync.isChecked()
         )
-        self.download_thread.progress.connect(self.update_progress)
+
+    def launch_download(self, **options):
+        """Starts a DownloadThread with the given options and wires it to the UI."""
+        global is_downloading
+        is_downloading = True
+        clear_stop()
+        self.download_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.pause_button.setEnabled(True)
+
+        self.download_thread = DownloadThread(max_workers=self.spin_workers.value(),
+                                              engine=self.combo_engine.currentData(),
+                                              bandwidth_limit=self.spin_bandwidth.value() * 1024 * 1024 or None,
+                                              adaptive_concurrency=self.checkbox_adaptive.isChecked(), **options)
         self.download_thread.status.connect(self.update_status)
+        self.download_thread.job_status.connect(self.update_job_status)
         self.download_thread.finished.connect(self.download_finished)
+        self.imported_urls = [] # Handed to the batch; the next Download must not queue them again
+        self.queue_model.reset(self.download_thread.progress_board) # Rows now follow the batch's jobs
         self.download_thread.start()
+        self.progress_timer.start()
         
+    def shutdown(self):
+        """
+        Stops a running batch before the app quits, like the CLI does on SIGINT/SIGTERM. Downloads
+        run in process groups of their own and would otherwise keep writing after the window is
+        gone. Then lets the long-lived engine workers exit cleanly.
+        """
+        if self.download_thread and self.download_thread.isRunning():
+            request_stop()
+            self.download_thread.wait() # The batch marks its jobs as stopped in the journal
+        shutdown_engines()
+
     def stop_download(self):
-        """Requests the download to stop and terminates the process."""
-        global stop_requested
-        stop_requested = True
-        if current_process:
-            current_process.terminate() # Send SIGTERM
+        """Requests the download to stop and terminates every running process."""
+        request_stop()
         self.update_status("⏹️ Download stopped by user", "orange")
-        self.download_finished() # Reset UI state immediately
-        
-    def update_progress(self, percent):
-        """Updates the progress bar and label."""
-        self.progress_bar.setValue(int(percent))
-        self.progress_label.setText(f"Progress: {percent:.1f}%")
+        self.stop_button.setEnabled(False) # The thread's finished signal resets the rest of the UI
+        self.pause_button.setEnabled(False)
+
+    def toggle_pause(self, paused):
+        """Pauses or resumes the whole batch; running downloads are frozen in place."""
+        self.pause_button.setText("Resume" if paused else "Pause")
+        if not (self.download_thread and self.download_thread.isRunning()):
+            return
+        if paused:
+            self.download_thread.batch.pause_downloads()
+        else:
+            self.download_thread.batch.resume_downloads()
+
+    def show_job_menu(self, position):
+        """Offers pause, resume and cancel for the job under the cursor while a batch is running."""
+        job = self.queue_model.job_at(self.queue_view.indexAt(position).row())
+        if job is None or not (self.download_thread and self.download_thread.isRunning()):
+            return
+        batch = self.download_thread.batch
+        finished = job.state in TERMINAL_STATES or job.state == "stopped"
+        menu = QMenu(self)
+        pause_action = menu.addAction("Pause")
+        pause_action.setEnabled(not finished and not job.cancel_token.paused)
+        resume_action = menu.addAction("Resume")
+        resume_action.setEnabled(not finished and job.cancel_token.paused)
+        cancel_action = menu.addAction("Cancel")
+        cancel_action.setEnabled(not finished and not job.cancel_token.cancelled)
+        action = menu.exec_(self.queue_view.viewport().mapToGlobal(position))
+        if action is pause_action:
+            batch.pause_downloads(job)
+        elif action is resume_action:
+            batch.resume_downloads(job)
+        elif action is cancel_action:
+            batch.cancel_job(job)
+
+    def refresh_progress(self):
+        """Samples the aggregate progress of all jobs and updates the progress bar and label."""
+        if not self.download_thread:
+            return
+        self.sync_queue()
+        first, last = self.queue_view.rowAt(0), self.queue_view.rowAt(self.queue_view.viewport().height() - 1)
+        if first >= 0:
+            self.queue_model.refresh_rows(first, last if last >= 0 else self.queue_model.rowCount() - 1)
+        totals = self.download_thread.progress_board.aggregate()
+        self.progress_bar.setValue(int(totals["percent"]))
+        text = f"Progress: {totals['percent']:.1f}%"
+        if totals["total_bytes"]:
+            text += f"  •  {format_bytes(totals['downloaded_bytes'])} / {format_bytes(totals['total_bytes'])}"
+        if totals["active_jobs"]:
+            text += f"  •  {format_bytes(totals['speed'])}/s  •  ETA {format_eta(totals['eta'])}"
+        stage = self.download_thread.postprocessing.stats()
+        if stage["running"] or stage["queued"]:
+            text += f"  •  ⚙️ {stage['running']} converting, {stage['queued']} queued"
+        self.progress_label.setText(text)
         
+    def show_summary(self, summary):
+        """Fills the summary panel with the totals of a finished batch."""
+        jobs = "  •  ".join(f"{count} {state}" for state, count in sorted(summary["jobs"].items())) or "no jobs"
+        lines = [f"{jobs}  •  {format_bytes(summary['bytes'])} in {format_eta(summary['wall_seconds'])}"]
+        if summary["avg_job_bytes_per_second"]:
+            lines.append(f"avg {format_bytes(summary['avg_job_bytes_per_second'])}/s per job  •  "
+                         f"peak {format_bytes(summary['peak_bytes_per_second'] or 0)}/s  •  "
+                         f"first byte after {summary['ttfb_p50_seconds']:.1f}s (median)")
+        lines.append(f"extraction {summary['extraction_seconds']:.1f}s  •  "
+                     f"post-processing {summary['postprocess_seconds']:.1f}s  •  retries {summary['retries']}")
+        self.summary_label.setText("\n".join(lines))
+        self.summary_label.show()
+
     def update_status(self, message, color):
         """Updates the main status label with a given message and color."""
         self.status_label.setText(message)
         self.status_label.setStyleSheet(f"color: {color};")
+
+    def update_job_status(self, job_id, message, color):
+        """Shows a status update coming from a single job, tagged with its id, and in its queue row."""
+        self.update_status(f"[#{job_id}] {message}", color)
+        self.sync_queue() # The job may have been queued since the last refresh
+        self.queue_model.set_job_message(job_id, message, color)
+
+    def sync_queue(self):
+        """Appends the rows of jobs the batch has queued since the last call."""
+        if self.download_thread:
+            self.queue_model.append_jobs(self.download_thread.batch.jobs_since(self.queue_model.job_count()))
         
     def download_finished(self):
         """Resets the UI state after a download completes or is stopped."""
-        global is_downloading, stop_requested
-        is_downloading, stop_requested = False, False
+        global is_downloading
+        is_downloading = False # The engine's stop flag stays set until the next launch, so stopped jobs stay stopped
+        if self.progress_timer.isActive():
+            self.progress_timer.stop()
+            self.refresh_progress() # Show the final figures
+        if self.download_thread:
+            self.show_summary(self.download_thread.batch.metrics_summary())
         self.download_button.setEnabled(True)
         self.stop_button.setEnabled(False)
+        # Reset the button without toggle_pause(), which would resume the batch that just ended
+        blocker = QSignalBlocker(self.pause_button)
+        self.pause_button.setChecked(False)
+        blocker.unblock()
+        self.pause_button.setText("Pause")
+        self.pause_button.setEnabled(False)
         self.progress_bar.setValue(0)
 
-# === Helper Functions for URL Analysis ===
-
-def is_youtube_url(url):
-    hostname = urlparse(url).hostname or ""
-    return any(domain in hostname for domain in ["youtube.com", "youtu.be"])
-
-def is_playlist_url(url):
-    return "playlist?list=" in url and "watch?v=" not in url
-
-def is_video_from_playlist(url):
-    return "watch?v=" in url and "&list=" in url
-
-def get_video_index_from_url(url):
-    match = re.search(r'[&?]index=(\d+)', url)
-    return int(match.group(1)) if match else 1
-
-def get_playlist_count(playlist_url):
-    """Runs a quick yt-dlp command to get the number of items in a playlist."""
-    try:
-        # --flat-playlist is very fast as it doesn't fetch metadata for each video.
-        result = subprocess.run(["yt-dlp", "--flat-playlist", "-J", playlist_url], 
-                                capture_output=True, text=True, check=True)
-        playlist_data = json.loads(result.stdout)
-        return len(playlist_data.get("entries", []))
-    except (subprocess.CalledProcessError, json.JSONDecodeError, Exception) as e:
-        print(f"Could not get playlist count for {playlist_url}: {e}")
-        return 0 # Return 0 indicates an error or an empty/invalid playlist
-
 # --- Application Entry Point ---
-if __name__ == "__main__":
+def main():
+    """Creates the application and the main window, then runs the Qt event loop."""
     app = QApplication(sys.argv)
     
     # Set metadata for better integration with desktop environments (e.g., Wayland, Flatpak)
@@ -503,5 +774,9 @@ if __name__ == "__main__":
     
     window = MediaCatcher()
     window.show()
+    app.aboutToQuit.connect(window.shutdown)
     
-    sys.exit(app.exec_())
+    return app.exec_()
+
+if __name__ == "__main__":
+    sys.exit(main())
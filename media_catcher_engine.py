@@ -0,0 +1,2889 @@
+#!/usr/bin/env python3
+"""
+Download engine of Media Catcher.
+
+Everything needed to expand, schedule and run downloads lives here without any Qt
+dependency, so the same pipeline drives both the GUI (media-catcher.py) and the
+headless command-line mode (media-catcher-cli.py). Diagnostics are printed to stderr, so
+the JSON lines the command-line mode writes to stdout stay machine-readable.
+"""
+
+# --- Standard Library Imports ---
+import os
+import sys
+import threading
+import re
+import json
+import heapq
+import random
+import hashlib
+import itertools
+import math
+import time
+import shlex
+import shutil
+import signal
+import subprocess
+from queue import Queue, Empty
+from collections import OrderedDict, deque, Counter
+from urllib.parse import urlparse, urlunparse, parse_qs, parse_qsl, urlencode
+# Heavier modules (sqlite3, multiprocessing, concurrent.futures) are imported where
+# they are first needed, so that starting the GUI does not pay for them.
+
+# --- Global Configuration ---
+# Per-user cache directory (inside a Flatpak this is redirected to the app's own cache).
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "media-catcher")
+# Per-user data directory for state that must survive cache cleanups (download index etc.).
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "media-catcher")
+
+# The yt-dlp command line to run; MEDIA_CATCHER_YTDLP can point at another binary or a stand-in
+# (e.g. "python benchmarks/fake_yt_dlp.py").
+YTDLP_COMMAND = shlex.split(os.environ.get("MEDIA_CATCHER_YTDLP") or "yt-dlp")
+
+# --- Global variables for process and state management ---
+# Every child process (yt-dlp, ffmpeg, listing and probing helpers) is started in a process group
+# of its own, so signalling the group also reaches the ffmpeg processes yt-dlp spawns itself.
+active_processes = {} # Running child process -> the job it works for (None for helpers)
+process_lock = threading.Lock()
+stop_requested = False
+STOP_GRACE_SECONDS = 0.1 # Process groups still alive this long after SIGTERM get SIGKILL
+last_stop_latency = None # Seconds from the last request_stop() until every process tree was gone
+
+class CancelToken:
+    """
+    Cancellation and pause state of a batch or of a single job. Job tokens are derived from
+    their batch's token and batch tokens from the global stop_token, so cancelling or pausing
+    a token applies to every token below it. Workers check `cancelled` between steps; the
+    processes of a cancelled or paused job are signalled through the active_processes registry.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._cancelled = threading.Event()
+        self._paused = False
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    @property
+    def paused(self):
+        return self._paused or (self.parent is not None and self.parent.paused)
+
+stop_token = CancelToken() # Root token, cancelled by request_stop()
+
+def request_stop():
+    """
+    Stops all downloads: pending jobs are dropped and every running process tree is terminated,
+    escalating to SIGKILL after STOP_GRACE_SECONDS. Returns at once; the time until the last
+    process tree was gone is stored in last_stop_latency.
+    """
+    global stop_requested
+    stop_requested = True
+    stop_token.cancel()
+    with process_lock:
+        processes = list(active_processes)
+    terminate_process_trees(processes, on_done=_record_stop_latency)
+
+def _record_stop_latency(seconds):
+    global last_stop_latency
+    last_stop_latency = seconds
+
+def clear_stop():
+    """Resets the stop flag (and the root token) before a new batch is started."""
+    global stop_requested, stop_token, last_stop_latency
+    stop_requested = False
+    stop_token = CancelToken()
+    last_stop_latency = None
+
+def start_process(command, job=None, **kwargs):
+    """
+    Starts a child process in a new process group and registers it as active for `job`, so
+    stop, cancel, pause and resume reach it and everything it spawns. Takes Popen's arguments.
+    """
+    if os.name == "posix":
+        kwargs["start_new_session"] = True
+    else:
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    process = subprocess.Popen(command, **kwargs)
+    register_process(process, job)
+    return process
+
+def register_process(process, job=None):
+    """
+    Adds a running process (a Popen or a multiprocessing.Process that leads its own process
+    group) to the registry. A process started for an already cancelled or paused job is
+    terminated or frozen right away, so it cannot slip past a Stop or Pause issued meanwhile.
+    """
+    with process_lock:
+        active_processes[process] = job
+    token = job.cancel_token if job else stop_token
+    if token.cancelled:
+        terminate_process_trees([process])
+    elif token.paused:
+        signal_process_group(process, getattr(signal, "SIGSTOP", None))
+
+def unregister_process(process):
+    with process_lock:
+        active_processes.pop(process, None)
+
+def processes_of(predicate):
+    """Returns the registered processes whose job matches `predicate(job)`."""
+    with process_lock:
+        return [process for process, job in active_processes.items() if job is not None and predicate(job)]
+
+def signal_process_group(process, sig):
+    """
+    Sends a signal to the process group led by `process`. Where process groups and job control
+    are missing (Windows) only termination is possible, and only of the process itself.
+    """
+    if sig is None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, sig)
+        elif sig == signal.SIGTERM:
+            process.terminate()
+    except ProcessLookupError:
+        # No such group: either everything is gone, or a worker that has not reached its
+        # os.setsid() yet, which still runs in our group and is signalled on its own
+        if process_alive(process):
+            try:
+                os.kill(process.pid, sig)
+            except OSError:
+                pass
+    except OSError:
+        pass
+
+def process_alive(process):
+    """True while the process itself (a Popen or a multiprocessing.Process) is running."""
+    return process.poll() is None if hasattr(process, "poll") else process.is_alive()
+
+def process_group_alive(process):
+    """True while any process of the group led by `process` (including a zombie leader) exists."""
+    if os.name != "posix":
+        return process_alive(process)
+    try:
+        os.killpg(process.pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+
+def terminate_process_trees(processes, grace=STOP_GRACE_SECONDS, on_done=None):
+    """
+    Sends SIGTERM to the process group of every given process (after SIGCONT, so paused
+    processes can act on it) and SIGKILL to the groups still alive `grace` seconds later.
+    The escalation runs on a background thread, which calls `on_done(seconds)` once every
+    group is gone. After SIGKILL only the group leaders are waited for: nothing survives
+    SIGKILL, but orphaned members can linger as zombies where init does not reap them.
+    A group counts as alive while its leader runs, even before the leader has made it a group.
+    """
+    started = time.monotonic()
+    for process in processes:
+        signal_process_group(process, getattr(signal, "SIGCONT", None))
+        signal_process_group(process, signal.SIGTERM)
+
+    def escalate():
+        killed = False
+        while True:
+            alive = [process for process in processes
+                     if process_alive(process) or (not killed and process_group_alive(process))]
+            elapsed = time.monotonic() - started
+            if not alive:
+                break
+            if not killed and elapsed >= grace:
+                for process in alive:
+                    signal_process_group(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+                killed = True
+            elif killed and elapsed >= grace + 5:
+                print(f"{len(alive)} process group(s) survived SIGKILL", file=sys.stderr)
+                break
+            time.sleep(0.005)
+        if on_done:
+            on_done(time.monotonic() - started)
+    threading.Thread(target=escalate, name="stop-escalation", daemon=True).start()
+
+# --- Scheduler defaults ---
+DEFAULT_MAX_WORKERS = 3 # Number of yt-dlp processes allowed to run at once
+MAX_JOBS_PER_HOST = 2 # Keeps a single site (e.g. youtube.com) from throttling us
+PRESCAN_WORKERS = 4 # Number of playlists listed at the same time
+SYNC_KNOWN_RUN = 10 # Known items in a row after which a newest-first sync stops listing
+
+# --- Bandwidth defaults ---
+DEFAULT_CONCURRENT_FRAGMENTS = 4 # HLS/DASH fragments fetched at once when no budget caps the job
+MAX_CONCURRENT_FRAGMENTS = 16
+MIN_JOB_RATE = 64 * 1024 # Smallest bandwidth share (bytes/s) a job is started with
+BUDGET_WAIT = 1.0 # Seconds a job waits before asking again for a share of a used-up budget
+GOVERNOR_INTERVAL = 2.0 # Seconds of throughput behind each adaptive concurrency step
+GOVERNOR_HOLD_STEPS = 5 # Steps to wait after an increase that did not raise throughput
+
+# --- Playlist cache defaults ---
+PLAYLIST_CACHE_TTL = 6 * 60 * 60 # Seconds a cached playlist listing stays valid
+PLAYLIST_CACHE_MAX_ENTRIES = 200 # Least recently used listings are evicted beyond this
+FORMAT_CACHE_TTL = 24 * 60 * 60 # Seconds the probed format list of a video stays valid
+FORMAT_CACHE_MAX_ENTRIES = 2000
+CACHE_EVICT_TARGET = 0.9 # Share of max_entries left after an eviction pass
+
+# === Playlist Cache ===
+
+class PlaylistCache:
+    """
+    Persistent cache of flat playlist listings, one JSON file per playlist.
+    Entries are keyed by the canonical playlist ID and expire after `ttl` seconds. The number
+    of files is counted in memory; once it exceeds `max_entries`, expired and least recently
+    used files are evicted down to CACHE_EVICT_TARGET of the bound, so the directory is only
+    scanned every few hundred writes rather than on each one.
+    """
+    def __init__(self, directory, ttl=PLAYLIST_CACHE_TTL, max_entries=PLAYLIST_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._count = None # Files in the directory, counted on the first write
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        """Returns the cached entry list for a playlist, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("key") != key or time.time() - data.get("fetched_at", 0) > self.ttl:
+            return None
+        try:
+            os.utime(path) # Mark as recently used for eviction
+        except OSError:
+            pass
+        return data.get("entries")
+
+    def put(self, key, entries):
+        """Stores the entry list of a playlist and evicts old listings if needed."""
+        data = {"key": key, "fetched_at": time.time(), "entries": entries}
+        path = self._path(key)
+        try:
+            with self._lock:
+                os.makedirs(self.directory, exist_ok=True)
+                if self._count is None:
+                    self._count = sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+                is_new = not os.path.exists(path)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path) # Atomic, so readers never see a partial file
+                if is_new:
+                    self._count += 1
+                if self._count > self.max_entries:
+                    self._evict()
+        except OSError as e:
+            print(f"Could not write cache file {path}: {e}", file=sys.stderr)
+
+    def _evict(self):
+        """Deletes expired listings and the least recently used ones above the eviction target."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort(reverse=True)
+        keep = int(self.max_entries * CACHE_EVICT_TARGET)
+        now = time.time()
+        self._count = len(files)
+        for position, (mtime, path) in enumerate(files):
+            # Reads refresh the mtime, so only files older than the TTL can be expired here
+            if position >= keep or now - mtime > self.ttl:
+                try:
+                    os.remove(path)
+                    self._count -= 1
+                except OSError:
+                    pass
+
+playlist_cache = PlaylistCache(os.path.join(CACHE_DIR, "playlists"))
+# The same store keeps the probed format list of every video
+format_cache = PlaylistCache(os.path.join(CACHE_DIR, "formats"), ttl=FORMAT_CACHE_TTL,
+                             max_entries=FORMAT_CACHE_MAX_ENTRIES)
+
+# === Download Index ===
+
+class DownloadIndex:
+    """
+    SQLite index of completed downloads, keyed by extractor, video ID and variant (the mode and
+    format a file was fetched with). It is consulted before a job starts, so items fetched by an
+    earlier run are skipped without launching yt-dlp at all.
+    Entries imported from a yt-dlp --download-archive file have no known variant and match any.
+    Items that failed permanently (removed, private, ...) are kept too, so they are never retried,
+    as are the subscriptions of sync mode and the playlist items each sync has already handled.
+    """
+    ANY_VARIANT = "*"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        """Opens the database on first use. Must be called with the lock held."""
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    extractor TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    variant TEXT NOT NULL,
+                    path TEXT,
+                    size INTEGER,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (extractor, video_id, variant)
+                )""")
+            # Finished files by size and content hash, for hardlinking identical downloads
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+            # Items that failed permanently, keyed by "<extractor>:<id>" or "url:<canonical url>"
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS failures (
+                    media_key TEXT PRIMARY KEY,
+                    error TEXT,
+                    failed_at REAL NOT NULL
+                )""")
+            # Playlists and channels in sync mode, and the items of each that were already handled
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    playlist_key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    last_synced REAL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS synced_items (
+                    playlist_key TEXT NOT NULL,
+                    media_key TEXT NOT NULL,
+                    synced_at REAL NOT NULL,
+                    PRIMARY KEY (playlist_key, media_key)
+                )""")
+            self._conn.commit()
+        return self._conn
+
+    def lookup(self, extractor, video_id, variant):
+        """
+        Returns the record of a completed download as a dict, or None.
+        Records whose file has since been deleted are dropped and not returned.
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT variant, path, size, completed_at FROM downloads "
+                "WHERE extractor = ? AND video_id = ? AND variant IN (?, ?) ORDER BY variant = ? DESC",
+                (extractor.lower(), video_id, variant, self.ANY_VARIANT, variant)).fetchone()
+            if row and row[1] and not os.path.exists(row[1]):
+                conn.execute("DELETE FROM downloads WHERE extractor = ? AND video_id = ? AND variant = ?",
+                             (extractor.lower(), video_id, row[0]))
+                conn.commit()
+                return None
+        if not row:
+            return None
+        return {"variant": row[0], "path": row[1], "size": row[2], "completed_at": row[3]}
+
+    def record(self, extractor, video_id, variant, path):
+        """Stores a completed download together with its output path and size."""
+        try:
+            size = os.path.getsize(path) if path else None
+        except OSError:
+            size = None
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                         (extractor.lower(), video_id, variant, path, size, time.time()))
+            conn.commit()
+
+    def link_duplicate(self, path):
+        """
+        Replaces `path` with a hardlink to an indexed file of identical content, if there is one,
+        and returns that file's path; otherwise indexes `path` and returns None. Files are hashed
+        only once another file of the same size exists, so unique sizes never cost a read.
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        with self._lock:
+            candidates = self._connection().execute(
+                "SELECT path, sha256 FROM files WHERE size = ? AND path != ?", (size, path)).fetchall()
+        digest = None
+        for other, other_digest in candidates:
+            try:
+                if os.path.samefile(path, other):
+                    return None # Already linked
+            except OSError: # The other file is gone
+                self._execute("DELETE FROM files WHERE path = ?", (other,))
+                continue
+            try:
+                digest = digest or file_sha256(path)
+                if other_digest is None:
+                    other_digest = file_sha256(other)
+                    self._execute("UPDATE files SET sha256 = ? WHERE path = ?", (other_digest, other))
+            except OSError as e:
+                print(f"Could not hash {path} or {other}: {e}", file=sys.stderr)
+                continue
+            if digest != other_digest:
+                continue
+            try:
+                tmp_path = f"{path}.{threading.get_ident()}.link"
+                os.link(other, tmp_path)
+                os.replace(tmp_path, path) # Atomic, so the file never disappears
+            except OSError as e: # E.g. a different file system
+                print(f"Could not hardlink {path} to {other}: {e}", file=sys.stderr)
+                continue
+            self._execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, size, digest))
+            return other
+        self._execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, size, digest))
+        return None
+
+    def _execute(self, query, params):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(query, params)
+            conn.commit()
+
+    def record_failure(self, media_key, error):
+        """Remembers an item that failed permanently (removed, private, ...), so it is not tried again."""
+        self._execute("INSERT OR REPLACE INTO failures VALUES (?, ?, ?)",
+                      (self.media_key_text(media_key), error[:500], time.time()))
+
+    def lookup_failure(self, media_key):
+        """Returns {"error", "failed_at"} if the item is known to be permanently unavailable, else None."""
+        with self._lock:
+            row = self._connection().execute("SELECT error, failed_at FROM failures WHERE media_key = ?",
+                                             (self.media_key_text(media_key),)).fetchone()
+        return {"error": row[0], "failed_at": row[1]} if row else None
+
+    @staticmethod
+    def media_key_text(media_key):
+        """Flattens a job's media_key into the "<extractor>:<id>" text stored in the index."""
+        return f"{media_key[0].lower()}:{media_key[1]}"
+
+    def add_subscription(self, playlist_key, url):
+        """Stores (or refreshes) a synced playlist or channel, so it can be synced again without its URL."""
+        self._execute("INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?)", (playlist_key, url, time.time()))
+
+    def subscriptions(self):
+        """Returns the synced playlists and channels as dicts with 'url' and 'last_synced', oldest first."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT url, last_synced FROM subscriptions ORDER BY last_synced").fetchall()
+        return [{"url": url, "last_synced": last_synced} for url, last_synced in rows]
+
+    def synced_items(self, playlist_key):
+        """Returns the media key texts of the items of a playlist that earlier syncs have handled."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT media_key FROM synced_items WHERE playlist_key = ?", (playlist_key,)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_synced(self, playlist_key, media_key):
+        """Records that a playlist item was handled (downloaded, skipped or permanently unavailable)."""
+        self._execute("INSERT OR REPLACE INTO synced_items VALUES (?, ?, ?)",
+                      (playlist_key, self.media_key_text(media_key), time.time()))
+
+    def import_archive(self, archive_path):
+        """
+        Bulk-imports a yt-dlp download archive ("<extractor> <id>" per line).
+        Returns the number of entries added.
+        """
+        rows = []
+        with open(archive_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    rows.append((parts[0].lower(), parts[1], self.ANY_VARIANT, None, None, time.time()))
+        with self._lock:
+            conn = self._connection()
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO downloads VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+            return conn.total_changes - before
+
+    def export_archive(self, archive_path):
+        """Writes every indexed item in yt-dlp's download archive format. Returns the item count."""
+        with self._lock:
+            rows = self._connection().execute("SELECT DISTINCT extractor, video_id FROM downloads").fetchall()
+        with open(archive_path, "w", encoding="utf-8") as f:
+            for extractor, video_id in rows:
+                f.write(f"{extractor} {video_id}\n")
+        return len(rows)
+
+download_index = DownloadIndex(os.path.join(DATA_DIR, "downloads.db"))
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hashes a file in chunks, so large videos are never read into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# === Job Journal ===
+
+TERMINAL_STATES = ("done", "skipped", "error", "cancelled") # Job states that are never resumed
+
+class JobJournal:
+    """
+    Append-only journal of the download queue, one JSON record per line, so a batch survives
+    the app being closed, stopped or killed. Records are:
+      {"event": "batch", "batch", "settings", "urls"}  - a batch was started
+      {"event": "expanded", "batch", "url"}            - an input URL has been turned into jobs
+      {"event": "job", "batch", "job", "url", "type", "index", "title", "video_key"}
+      {"event": "state", "job", "state", "partial"}    - job state change and its .part file
+    Jobs that never reached a terminal state are resumed after a restart; yt-dlp picks up
+    their .part files because the output template is the same.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _append(self, record):
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+            except OSError as e:
+                print(f"Could not write job journal {self.path}: {e}", file=sys.stderr)
+
+    def start_batch(self, settings, urls):
+        """Records a new batch and returns its id."""
+        batch_id = os.urandom(6).hex()
+        self._append({"event": "batch", "batch": batch_id, "settings": settings, "urls": urls})
+        return batch_id
+
+    def mark_expanded(self, batch_id, url):
+        self._append({"event": "expanded", "batch": batch_id, "url": url})
+
+    def add_job(self, batch_id, job):
+        # job.id restarts in every process, so a resumed batch would reuse the ids of its journal
+        job.journal_id = f"{batch_id}:{os.urandom(6).hex()}"
+        self._append({"event": "job", "batch": batch_id, "job": job.journal_id, "url": job.url,
+                      "type": job.type, "index": job.playlist_index, "title": job.title,
+                      "video_key": job.video_key})
+
+    def set_state(self, job, state, partial=None):
+        if job.journal_id:
+            self._append({"event": "state", "job": job.journal_id, "state": state, "partial": partial})
+
+    def _read(self):
+        """Replays the journal into a list of batches, oldest first."""
+        batches = OrderedDict()
+        jobs = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # A torn last line after a crash
+            event = record.get("event")
+            if event == "batch":
+                batches[record["batch"]] = {"batch": record["batch"], "settings": record["settings"],
+                                            "urls": list(record["urls"]), "jobs": OrderedDict()}
+            elif event == "expanded" and record["batch"] in batches:
+                urls = batches[record["batch"]]["urls"]
+                if record["url"] in urls:
+                    urls.remove(record["url"])
+            elif event == "job" and record["batch"] in batches:
+                job = dict(record, state="queued", partial=None)
+                batches[record["batch"]]["jobs"][record["job"]] = job
+                jobs[record["job"]] = job
+            elif event == "state" and record["job"] in jobs:
+                jobs[record["job"]]["state"] = record["state"]
+                if record.get("partial"):
+                    jobs[record["job"]]["partial"] = record["partial"]
+        return list(batches.values())
+
+    def pending(self):
+        """Returns the batches that still have unexpanded URLs or unfinished jobs, oldest first."""
+        pending = []
+        for batch in self._read():
+            jobs = [job for job in batch["jobs"].values() if job["state"] not in TERMINAL_STATES]
+            if batch["urls"] or jobs:
+                pending.append(dict(batch, jobs=jobs))
+        return pending
+
+    def compact(self, discard=()):
+        """
+        Rewrites the journal with only the pending work, dropping finished batches and
+        the batches listed in `discard`. The file is replaced atomically.
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            records = []
+            for batch in self.pending():
+                if batch["batch"] in discard:
+                    continue
+                records.append({"event": "batch", "batch": batch["batch"], "settings": batch["settings"],
+                                "urls": batch["urls"]})
+                for job in batch["jobs"]:
+                    records.append({key: job[key] for key in
+                                    ("event", "batch", "job", "url", "type", "index", "title", "video_key")})
+                    if job["partial"]:
+                        records.append({"event": "state", "job": job["job"], "state": "stopped",
+                                        "partial": job["partial"]})
+            try:
+                if not records:
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                    return
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in records)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Could not compact job journal {self.path}: {e}", file=sys.stderr)
+
+job_journal = JobJournal(os.path.join(DATA_DIR, "journal.jsonl"))
+
+# === Download Options ===
+# A job's options are described once as a plain dict, then translated either into
+# yt-dlp command-line arguments or into YoutubeDL API parameters, depending on the engine.
+
+AUDIO_QUALITY_MAP = {"320K": "0", "192K": "2", "128K": "5", "64K": "9"} # Label -> yt-dlp VBR quality
+
+def options_to_args(options):
+    """Translates an options dict into a yt-dlp command line."""
+    # --print implies --quiet, so --progress keeps the progress lines coming
+    # A probed extraction result is reused instead of extracting the URL a second time
+    source = ["--load-info-json", options["info_json"]] if options.get("info_json") else [options["url"]]
+    cmd = YTDLP_COMMAND + source + ["-o", options["outtmpl"], "--newline",
+                                    "--progress", "--progress-template", PROGRESS_TEMPLATE, "--print", OUTPUT_TEMPLATE]
+    if options["playlist"] == "all":
+        cmd.append("--ignore-errors") # One broken item must not end the walk; single jobs are retried instead
+    elif options["playlist"] == "first":
+        cmd.extend(["--playlist-items", "1"])
+    elif options["playlist"] == "none":
+        cmd.append("--no-playlist")
+    if options.get("extract_audio"):
+        cmd.extend(["-x", "--audio-format", options["audio_format"]])
+        if options.get("audio_quality"):
+            cmd.extend(["--audio-quality", options["audio_quality"]])
+    if options.get("force_overwrites"):
+        cmd.append("--force-overwrites")
+    if options.get("merge_output_format"):
+        cmd.extend(["--merge-output-format", options["merge_output_format"]])
+    if options.get("format"):
+        cmd.extend(["-f", options["format"]])
+    if options.get("subtitle_lang"):
+        cmd.extend(["--write-auto-sub", "--sub-lang", options["subtitle_lang"], "--convert-subs", "srt"])
+    if options.get("limit_rate"):
+        cmd.extend(["--limit-rate", str(int(options["limit_rate"]))])
+    if options.get("concurrent_fragments"):
+        cmd.extend(["--concurrent-fragments", str(options["concurrent_fragments"])])
+    return cmd
+
+def options_to_params(options):
+    """Translates an options dict into YoutubeDL constructor parameters."""
+    params = {
+        "outtmpl": {"default": options["outtmpl"]},
+        "ignoreerrors": options["playlist"] == "all",
+        "quiet": True,
+        "noprogress": True,
+        "postprocessors": [],
+    }
+    if options["playlist"] == "first":
+        params["playlist_items"] = "1"
+    elif options["playlist"] == "none":
+        params["noplaylist"] = True
+    if options.get("extract_audio"):
+        params["format"] = "bestaudio/best" # Same default as yt-dlp's -x
+        params["postprocessors"].append({"key": "FFmpegExtractAudio",
+                                         "preferredcodec": options["audio_format"],
+                                         "preferredquality": options.get("audio_quality")})
+    if options.get("force_overwrites"):
+        params["overwrites"] = True
+    if options.get("merge_output_format"):
+        params["merge_output_format"] = options["merge_output_format"]
+    if options.get("format"):
+        params["format"] = options["format"]
+    if options.get("subtitle_lang"):
+        params["writeautomaticsub"] = True
+        params["subtitleslangs"] = [options["subtitle_lang"]]
+        params["postprocessors"].append({"key": "FFmpegSubtitlesConvertor", "format": "srt", "when": "before_dl"})
+    if options.get("limit_rate"):
+        params["ratelimit"] = int(options["limit_rate"])
+    if options.get("concurrent_fragments"):
+        params["concurrent_fragment_downloads"] = options["concurrent_fragments"]
+    return params
+
+# === Format Selection ===
+# Instead of asking for fixed YouTube itags, every video job probes the formats the video
+# actually has (once, cached per video) and picks the closest match to the requested height.
+# Streams that fit the output container are preferred, so merging never needs a re-encode.
+
+FORMAT_FIELDS = ("format_id", "ext", "height", "vcodec", "acodec", "tbr", "abr") # Kept per cached format
+MP4_CODECS = ("avc1", "h264", "av01", "mp4a", "aac") # Codecs that can be copied into an .mp4 as they are
+
+def requested_height(video_quality):
+    """Reads the height from a quality label like '137 (1080p)'; None means the best available."""
+    match = re.search(r"(\d+)p\)?$", video_quality or "")
+    return int(match.group(1)) if match else None
+
+def _fits_container(codec, container):
+    return container != "mp4" or (codec or "").startswith(MP4_CODECS)
+
+def _video_rank(fmt, height, container):
+    """Sort key for video formats: closest to the requested height (never above it if possible),
+    then no re-encode needed for the container, then bitrate."""
+    fmt_height = fmt.get("height") or 0
+    if height is None:
+        fit = fmt_height
+    elif fmt_height <= height:
+        fit = fmt_height - height # 0 is a perfect match, lower is worse
+    else:
+        fit = -100000 - fmt_height # Too tall: only when nothing smaller exists, then the smallest
+    return (fit, _fits_container(fmt.get("vcodec"), container), fmt.get("tbr") or 0)
+
+def select_formats(formats, height=None, container="mp4"):
+    """
+    Picks the streams to download from a probed format list.
+    Returns (video_format_id, audio_format_id) for separate streams, (format_id, None) for a
+    single format that already contains both, or None if nothing usable was listed.
+    """
+    def has(fmt, key):
+        return fmt.get(key) not in (None, "none")
+    video_only = [f for f in formats if has(f, "vcodec") and not has(f, "acodec")]
+    audio_only = [f for f in formats if has(f, "acodec") and not has(f, "vcodec")]
+    muxed = [f for f in formats if has(f, "vcodec") and has(f, "acodec")]
+
+    best_muxed = max(muxed, key=lambda f: _video_rank(f, height, container), default=None)
+    if video_only and audio_only:
+        video = max(video_only, key=lambda f: _video_rank(f, height, container))
+        # A muxed format that matches the height at least as well saves the merge altogether
+        if best_muxed is None or _video_rank(best_muxed, height, container)[0] < _video_rank(video, height, container)[0]:
+            audio = max(audio_only, key=lambda f: (_fits_container(f.get("acodec"), container),
+                                                   f.get("abr") or f.get("tbr") or 0))
+            return video["format_id"], audio["format_id"]
+    if best_muxed:
+        return best_muxed["format_id"], None
+    if formats: # Sites that only list plain formats without codec information
+        return formats[-1]["format_id"], None # yt-dlp sorts formats from worst to best
+    return None
+
+def format_selector(video_format, audio_format=None):
+    """
+    yt-dlp format string for a select_formats() result. Format lists are cached for up to
+    FORMAT_CACHE_TTL, so yt-dlp's own choice follows in case a listed stream is gone.
+    """
+    if audio_format:
+        return f"{video_format}+{audio_format}/bestvideo+bestaudio/best"
+    return f"{video_format}/best"
+
+def separate_streams(format_spec):
+    """
+    Turns a merging format string ('137+140/bestvideo+bestaudio/best') into one that downloads
+    the video and the audio as separate files ('137/bestvideo,140/bestaudio'), keeping the
+    fallbacks. Alternatives without a merge are left out, as they leave nothing to merge.
+    """
+    pairs = [alternative.split("+", 1) for alternative in format_spec.split("/") if "+" in alternative]
+    return ",".join("/".join(streams) for streams in zip(*pairs))
+
+# === Progress Reporting ===
+# Workers write progress into a shared ProgressBoard instead of emitting a Qt signal per line.
+# The UI samples the board on a timer, so the GUI thread does a fixed amount of work per second
+# no matter how fast yt-dlp reports.
+
+PROGRESS_REFRESH_MS = 100 # UI sampling interval (10 Hz)
+PROGRESS_PREFIX = "[mc-progress]"
+# Machine-readable progress line; yt-dlp prints "NA" for fields it does not know.
+PROGRESS_TEMPLATE = ("download:" + PROGRESS_PREFIX + " %(progress.status)s|%(progress.downloaded_bytes)s|"
+                     "%(progress.total_bytes)s|%(progress.total_bytes_estimate)s|%(progress.speed)s|%(progress.eta)s|"
+                     "%(progress.fragment_count)s|%(progress.tmpfilename)s")
+
+OUTPUT_PREFIX = "[mc-file]"
+# Printed once per finished file with its extractor, ID and final path.
+OUTPUT_TEMPLATE = "after_move:" + OUTPUT_PREFIX + " %(extractor_key)s|%(id)s|%(filepath)s"
+
+def parse_output_line(line):
+    """Parses a line printed with OUTPUT_TEMPLATE into an output dict, or returns None."""
+    if not line.startswith(OUTPUT_PREFIX):
+        return None
+    fields = line[len(OUTPUT_PREFIX):].strip().split("|", 2)
+    if len(fields) != 3:
+        return None
+    return {"extractor": fields[0], "id": fields[1], "filepath": fields[2]}
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_progress_line(line):
+    """Parses a line printed with PROGRESS_TEMPLATE into a progress dict, or returns None."""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    fields = line[len(PROGRESS_PREFIX):].strip().split("|", 7) # The file name comes last and may contain '|'
+    if len(fields) != 8:
+        return None
+    status, downloaded, total, estimate, speed, eta, fragments, tmpfilename = fields
+    return progress_info(status, _to_number(downloaded), _to_number(total) or _to_number(estimate),
+                         _to_number(speed), _to_number(eta), tmpfilename if tmpfilename != "NA" else None,
+                         _to_number(fragments))
+
+def progress_info(status, downloaded_bytes, total_bytes, speed, eta, tmpfilename=None, fragment_count=None):
+    """
+    Builds the progress dict passed to on_progress callbacks, including the derived percent.
+    fragment_count is only known for fragmented (HLS/DASH) downloads.
+    """
+    percent = None
+    if total_bytes and downloaded_bytes is not None:
+        percent = min(100.0, downloaded_bytes * 100.0 / total_bytes)
+    elif status == "finished":
+        percent = 100.0
+    return {"status": status, "downloaded_bytes": downloaded_bytes, "total_bytes": total_bytes,
+            "speed": speed, "eta": eta, "percent": percent, "tmpfilename": tmpfilename,
+            "fragment_count": fragment_count}
+
+class ProgressBoard:
+    """
+    Shared per-job progress state written by the download workers and sampled by the UI.
+    aggregate() condenses it into one figure for the whole batch.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {} # job id -> latest progress dict, plus an 'active' flag
+        self.total_jobs = 0
+
+    def update(self, job_id, info):
+        with self._lock:
+            state = self._jobs.setdefault(job_id, {"percent": 0.0})
+            state.update((key, value) for key, value in info.items() if value is not None)
+            state["active"] = True
+
+    def finish(self, job_id, succeeded):
+        """Marks a job as no longer transferring; a successful job counts as 100%."""
+        with self._lock:
+            state = self._jobs.setdefault(job_id, {"percent": 0.0})
+            state["active"] = False
+            state["speed"] = None
+            if succeeded:
+                state["percent"] = 100.0
+
+    def snapshot(self):
+        with self._lock:
+            return {job_id: dict(state) for job_id, state in self._jobs.items()}
+
+    def get(self, job_id):
+        """Returns a copy of one job's progress, or None if it has not reported yet."""
+        with self._lock:
+            state = self._jobs.get(job_id)
+            return dict(state) if state else None
+
+    def aggregate(self):
+        """Returns overall percent, combined speed, ETA and byte counts across all jobs."""
+        with self._lock:
+            states = list(self._jobs.values())
+            total_jobs = max(self.total_jobs, len(states), 1)
+        percent = sum(state.get("percent") or 0.0 for state in states) / total_jobs
+        active = [state for state in states if state.get("active")]
+        speed = sum(state.get("speed") or 0.0 for state in active)
+        remaining = sum(max(0.0, (state.get("total_bytes") or 0.0) - (state.get("downloaded_bytes") or 0.0))
+                        for state in active)
+        return {
+            "percent": percent,
+            "speed": speed,
+            "eta": remaining / speed if speed else None,
+            "downloaded_bytes": sum(state.get("downloaded_bytes") or 0.0 for state in states),
+            "total_bytes": sum(state.get("total_bytes") or 0.0 for state in states),
+            "active_jobs": len(active),
+        }
+
+def format_bytes(size):
+    """Formats a byte count with a binary unit, e.g. '12.3 MiB'."""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+# === Job Logs ===
+
+STDERR_BUFFER_LINES = 50 # Lines of yt-dlp stderr kept per job
+
+class JobLog:
+    """
+    Bounded per-job log of yt-dlp's stderr. Only the last `max_lines` lines are kept, so memory
+    stays flat however chatty the child is, and WARNING/ERROR lines are parsed into records.
+    """
+    LINE_RE = re.compile(r'^(ERROR|WARNING):\s*(?:\[([^\]]+)\]\s*)?(.*)$')
+
+    def __init__(self, max_lines=STDERR_BUFFER_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self.records = deque(maxlen=max_lines) # {"level", "extractor", "message", "time"}
+        self.warning_count = 0
+        self.error_count = 0
+        self._lock = threading.Lock()
+
+    def feed(self, line):
+        """Adds one line of output, recording it as a warning or error if it is one."""
+        line = line.rstrip()
+        if not line:
+            return
+        match = self.LINE_RE.match(line)
+        with self._lock:
+            self.lines.append(line)
+            if match:
+                level = match.group(1).lower()
+                if level == "error":
+                    self.error_count += 1
+                else:
+                    self.warning_count += 1
+                self.records.append({"level": level, "extractor": match.group(2),
+                                     "message": match.group(3), "time": time.time()})
+
+    def error_messages(self):
+        """Returns the messages of all ERROR records still in the buffer, oldest first."""
+        with self._lock:
+            return [record["message"] for record in self.records if record["level"] == "error"]
+
+    def last_error(self):
+        """Returns the most relevant failure line: the last ERROR record, else the last line."""
+        with self._lock:
+            for record in reversed(self.records):
+                if record["level"] == "error":
+                    return record["message"]
+            return self.lines[-1] if self.lines else ""
+
+# === Retry Policy ===
+# Failed jobs are classified from yt-dlp's error output. Transient failures are retried with
+# exponential backoff and jitter, rate limiting additionally opens a per-host circuit breaker
+# that holds back every job of that host, and permanent failures are recorded in the download
+# index so later runs skip them. Classes not listed in RETRY_POLICIES are never retried.
+
+# (class, pattern) in order of precedence; matched against every ERROR line of a job
+ERROR_CLASSES = [
+    ("rate_limited", re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit|confirm you.re not a bot", re.IGNORECASE)),
+    ("permanent", re.compile(r"Private video|Video unavailable|video (?:has been|was) removed|"
+                             r"no longer available|account (?:associated with this video )?has been terminated|"
+                             r"copyright|members[- ]only|Join this channel|HTTP Error 404|HTTP Error 410|"
+                             r"Unsupported URL|is not a valid URL|does not exist", re.IGNORECASE)),
+    # Depend on the options or on this machine, so retrying is pointless but the item is not dead
+    ("fatal", re.compile(r"Requested format is not available|ffmpeg not found|ffprobe.* not found|"
+                         r"No space left on device|Permission denied|confirm your age", re.IGNORECASE)),
+    ("transient", re.compile(r"HTTP Error 5\d\d|HTTP Error 403|timed? ?out|Connection (?:reset|refused|aborted)|"
+                             r"Remote end closed|IncompleteRead|fragment|Temporary failure|Name or service not known|"
+                             r"Network is unreachable|unable to download|Got error|giving up after", re.IGNORECASE)),
+]
+RETRY_POLICIES = {
+    # class -> (attempts after the first, base delay, max delay) in seconds
+    "transient": (4, 2.0, 60.0),
+    "rate_limited": (5, 30.0, 600.0),
+    "unknown": (1, 5.0, 5.0),
+}
+BREAKER_COOLDOWN = 60.0 # Seconds a host is held back after rate limiting; doubles while it persists
+BREAKER_MAX_COOLDOWN = 15 * 60.0
+
+def classify_error(messages):
+    """Returns the class of a failure from its error messages: the first ERROR_CLASSES match, else 'unknown'."""
+    text = "\n".join(message for message in messages if message)
+    for error_class, pattern in ERROR_CLASSES:
+        if pattern.search(text):
+            return error_class
+    return "unknown"
+
+def retry_delay(error_class, attempt):
+    """
+    Seconds to wait before retry number `attempt` (1-based) of a failure, or None if the class
+    is not retried or its attempts are used up. The delay is picked at random between half and
+    all of the exponential bound, so jobs that failed together do not all come back at once.
+    """
+    policy = RETRY_POLICIES.get(error_class)
+    if not policy or attempt > policy[0]:
+        return None
+    attempts, base_delay, max_delay = policy
+    bound = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return random.uniform(bound / 2, bound)
+
+class HostCircuitBreaker:
+    """
+    Per-host circuit breaker for rate limiting. trip() opens it for a cooldown that doubles
+    with every consecutive trip; while open, the scheduler starts no job of that host. Once the
+    cooldown is over the breaker is half-open and lets a single job through: success closes it,
+    another rate-limit error opens it again for longer.
+    """
+    def __init__(self, cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._hosts = {} # host -> [consecutive trips, reopens at (time.monotonic())]
+
+    def trip(self, host):
+        """
+        Opens the breaker of a host and returns the cooldown in seconds, or None if it is
+        already open (jobs that were running when it opened do not extend the cooldown).
+        """
+        with self._lock:
+            state = self._hosts.setdefault(host, [0, 0.0])
+            if state[1] > time.monotonic():
+                return None
+            state[0] += 1
+            cooldown = min(self.max_cooldown, self.cooldown * 2 ** (state[0] - 1))
+            state[1] = time.monotonic() + cooldown
+            return cooldown
+
+    def reset(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def blocked_for(self, host):
+        """Seconds until the host may be contacted again; 0 when closed or half-open."""
+        with self._lock:
+            state = self._hosts.get(host)
+            return max(0.0, state[1] - time.monotonic()) if state else 0.0
+
+    def is_half_open(self, host):
+        with self._lock:
+            return host in self._hosts
+
+host_breaker = HostCircuitBreaker()
+
+# === Bandwidth Governor ===
+
+def parse_rate(text):
+    """Parses a rate like yt-dlp's --limit-rate ('500K', '2.5M', '1048576') into bytes per second."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*", text or "", re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r}")
+    return float(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " ")
+
+class BandwidthGovernor:
+    """
+    Bandwidth and concurrency control of one batch.
+
+    A global `budget` in bytes/s is split between the jobs as they start: each gets an equal
+    share of the jobs expected to run at once and passes it to yt-dlp as its rate limit.
+    yt-dlp cannot change the limit of a running download, so shares are fixed per attempt.
+    A job whose share is not free waits until running jobs give theirs back, so the shares
+    never add up to more than the budget; after the concurrency limit changes they converge
+    on the new equal share as the running attempts end. When what would be left is too little
+    for another job, or no job is waiting, the starting job gets all of the free budget.
+    The share also decides the concurrent fragments of HLS/DASH downloads: just enough
+    connections to fill it, judged by the per-connection speed earlier fragmented downloads
+    from the same host reached.
+
+    With `adaptive`, the number of jobs that may run at once is tuned AIMD-style between 1 and
+    `max_workers`: it grows by one per GOVERNOR_INTERVAL while that raises the throughput of
+    the batch, and is halved whenever downloads fail with transient or rate-limit errors.
+    """
+    def __init__(self, budget=None, max_workers=DEFAULT_MAX_WORKERS, adaptive=False):
+        self.budget = budget or None
+        self.max_workers = max(1, max_workers)
+        self.adaptive = adaptive
+        self.limit = max(1, self.max_workers // 2) if adaptive else self.max_workers
+        self._lock = threading.Lock()
+        self._shares = {} # job id -> bytes/s allotted to its running attempt
+        self._connection_speed = {} # host -> bytes/s one fragment connection reached
+        self._congestion = 0 # Transient and rate-limit failures since the last step
+        self._baseline = None # Throughput before the last increase, while it is being judged
+        self._hold = 0 # Steps left before the limit may grow again
+
+    def allot(self, job, waiting=None):
+        """
+        Reserves the bandwidth share of a job that is about to start, with `waiting` jobs still
+        queued behind it (None while more may be added, which assumes every slot will be busy).
+        Returns (rate limit in bytes/s or None, concurrent fragments), or None if the running
+        jobs leave less than the share free and the job has to wait.
+        """
+        with self._lock:
+            if not self.budget:
+                return None, DEFAULT_CONCURRENT_FRAGMENTS
+            running = len(self._shares) + 1
+            expected = self.limit if waiting is None else min(self.limit, running + waiting)
+            expected = max(running, expected)
+            free = self.budget - sum(self._shares.values())
+            share = min(self.budget, max(MIN_JOB_RATE, self.budget / expected))
+            if share > free and self._shares: # Alone, a job always gets the whole budget
+                return None
+            if waiting == 0 or free - share < MIN_JOB_RATE: # No other job could start on the rest
+                share = free
+            self._shares[job.id] = share
+            connection_speed = self._connection_speed.get(job.host)
+        if not connection_speed:
+            return share, DEFAULT_CONCURRENT_FRAGMENTS
+        return share, max(1, min(MAX_CONCURRENT_FRAGMENTS, math.ceil(share / connection_speed)))
+
+    def release(self, job, fragments=None):
+        """
+        Returns the share of a finished attempt and learns the per-connection speed of its host
+        from fragmented downloads. An attempt that reached its share only gives a lower bound.
+        """
+        speed = job.metrics.average_speed()
+        with self._lock:
+            share = self._shares.pop(job.id, None)
+            if not (fragments and job.metrics.fragmented and speed):
+                return
+            observed = speed / fragments
+            previous = self._connection_speed.get(job.host)
+            if share and speed >= 0.9 * share:
+                self._connection_speed[job.host] = max(previous or 0.0, observed)
+            else:
+                self._connection_speed[job.host] = observed if previous is None else 0.7 * previous + 0.3 * observed
+
+    def record_failure(self, error_class):
+        """Counts failures that signal an overloaded link or site for the next step()."""
+        if error_class in ("transient", "rate_limited"):
+            with self._lock:
+                self._congestion += 1
+
+    def step(self, throughput, active_jobs):
+        """
+        Takes one AIMD step from the average throughput (bytes/s) of the last interval and the
+        number of jobs that were running. Returns the new concurrency limit, or None if unchanged.
+        """
+        if not self.adaptive:
+            return None
+        with self._lock:
+            congestion, self._congestion = self._congestion, 0
+            limit = self.limit
+            if congestion: # Multiplicative decrease
+                limit = max(1, self.limit // 2)
+                self._baseline, self._hold = None, GOVERNOR_HOLD_STEPS
+            elif self._baseline is not None and throughput < self._baseline * 1.05:
+                # The last increase did not pay off: the link or the site is the limit
+                limit = max(1, self.limit - 1)
+                self._baseline, self._hold = None, GOVERNOR_HOLD_STEPS
+            elif self._hold:
+                self._hold -= 1
+                self._baseline = None
+            elif active_jobs >= self.limit and self.limit < self.max_workers and not (
+                    self.budget and throughput >= 0.9 * self.budget):
+                limit = self.limit + 1 # Additive increase, judged at the next step
+                self._baseline = throughput
+            else: # Too few jobs to tell, or the budget is already used up
+                self._baseline = None
+            if limit == self.limit:
+                return None
+            self.limit = limit
+            return limit
+
+# === Job Metrics ===
+# Every finished job leaves one JSON line in METRICS_PATH with its phase timings and
+# throughput, so concurrency can be tuned and throttling spotted from real runs. A batch
+# summary can additionally be written as a Prometheus textfile (node_exporter's textfile
+# collector picks it up).
+
+METRICS_PATH = os.path.join(DATA_DIR, "metrics.jsonl")
+METRICS_MAX_BYTES = 5 * 1024 * 1024 # The file is rotated to metrics.jsonl.1 beyond this
+
+class JobMetrics:
+    """
+    Timing and throughput figures of one job. run_job() marks the phases, the engine adds the
+    time it took to start its process, and every progress report feeds observe().
+    """
+    def __init__(self):
+        self.started = None # time.monotonic() marks
+        self.first_progress = None
+        self.first_byte = None
+        self.last_byte = None
+        self.finished = None
+        self.spawn_seconds = None
+        self.peak_speed = 0.0
+        self.exit_code = None
+        self.fragmented = False # An HLS/DASH download, fetched in fragments
+        self._file_bytes = {} # Downloaded bytes per file, as a job may fetch several
+        self._current_file = None # tmpfilename of the file being downloaded
+
+    def start(self):
+        self.started = time.monotonic()
+
+    def observe(self, info):
+        now = time.monotonic()
+        if self.first_progress is None:
+            self.first_progress = now
+        if info.get("downloaded_bytes"):
+            if self.first_byte is None:
+                self.first_byte = now
+            self.last_byte = now
+            # yt-dlp's "finished" report has no tmpfilename; it closes the file whose progress came before it
+            key = info.get("tmpfilename") or self._current_file or len(self._file_bytes)
+            self._file_bytes[key] = info["downloaded_bytes"]
+            self._current_file = key if info.get("status") == "downloading" else None
+        if info.get("speed"):
+            self.peak_speed = max(self.peak_speed, info["speed"])
+        if info.get("fragment_count"):
+            self.fragmented = True
+
+    def average_speed(self):
+        """Bytes per second from the first to the last byte, or None before two progress reports."""
+        if self.first_byte is None or self.last_byte is None or self.last_byte <= self.first_byte:
+            return None
+        return sum(self._file_bytes.values()) / (self.last_byte - self.first_byte)
+
+    def finish(self, exit_code):
+        self.finished = time.monotonic()
+        self.exit_code = exit_code
+
+    def as_dict(self, job):
+        """The metrics record of a job; phases that never happened are None."""
+        def span(start, end):
+            return round(end - start, 3) if start is not None and end is not None else None
+        transfer = span(self.first_byte, self.last_byte)
+        downloaded = sum(self._file_bytes.values())
+        spawn = self.spawn_seconds or 0.0
+        extraction = span(self.started, self.first_progress or self.finished)
+        postprocess = job.timings.get("postprocess")
+        if postprocess is None and self.last_byte is not None: # yt-dlp ran ffmpeg before exiting
+            postprocess = span(self.last_byte, self.finished)
+        return {
+            "time": round(time.time(), 3), "job": job.id, "url": job.url, "host": job.host, "state": job.state,
+            "exit_code": self.exit_code, "attempt": job.attempt,
+            "spawn_seconds": round(self.spawn_seconds, 3) if self.spawn_seconds is not None else None,
+            "extraction_seconds": round(max(0.0, extraction - spawn), 3) if extraction is not None else None,
+            "ttfb_seconds": span(self.started, self.first_byte),
+            "transfer_seconds": transfer,
+            "bytes": int(downloaded),
+            "avg_bytes_per_second": round(downloaded / transfer, 1) if transfer else None,
+            "peak_bytes_per_second": round(self.peak_speed, 1) if self.peak_speed else None,
+            "postprocess_wait_seconds": round(job.timings["queue"], 3) if "queue" in job.timings else None,
+            "postprocess_seconds": round(postprocess, 3) if postprocess is not None else None,
+            "total_seconds": span(self.started, self.finished),
+        }
+
+class MetricsRecorder:
+    """Appends job metrics records to a JSON-lines file, rotating it once it grows too large."""
+    def __init__(self, path, max_bytes=METRICS_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Could not write metrics {self.path}: {e}", file=sys.stderr)
+
+metrics_recorder = MetricsRecorder(METRICS_PATH)
+
+def _percentile(values, fraction):
+    values = sorted(value for value in values if value is not None)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+def summarize_metrics(records, wall_seconds=None):
+    """
+    Condenses the metrics records of a batch into totals, medians and per-host throughput.
+    Failed attempts that were retried count as retries; their bytes and timings count as well.
+    """
+    transferred = [r for r in records if r["transfer_seconds"]]
+    total_bytes = sum(r["bytes"] for r in records)
+    hosts = {}
+    for record in transferred:
+        host = hosts.setdefault(record["host"], [0, 0.0])
+        host[0] += record["bytes"]
+        host[1] += record["transfer_seconds"]
+    return {
+        "jobs": dict(Counter(r["state"] for r in records if r["state"] != "retrying")),
+        "bytes": total_bytes,
+        "wall_seconds": round(wall_seconds, 3) if wall_seconds is not None else None,
+        "bytes_per_second": round(total_bytes / wall_seconds, 1) if wall_seconds else None,
+        "avg_job_bytes_per_second": round(sum(r["bytes"] for r in transferred)
+                                          / sum(r["transfer_seconds"] for r in transferred), 1) if transferred else None,
+        "peak_bytes_per_second": max((r["peak_bytes_per_second"] or 0 for r in records), default=0) or None,
+        "ttfb_p50_seconds": _percentile((r["ttfb_seconds"] for r in records), 0.5),
+        "ttfb_p90_seconds": _percentile((r["ttfb_seconds"] for r in records), 0.9),
+        "spawn_seconds": round(sum(r["spawn_seconds"] or 0 for r in records), 3),
+        "extraction_seconds": round(sum(r["extraction_seconds"] or 0 for r in records), 3),
+        "postprocess_seconds": round(sum(r["postprocess_seconds"] or 0 for r in records), 3),
+        "retries": sum(1 for r in records if r["state"] == "retrying"),
+        "host_bytes_per_second": {host: round(size / seconds, 1) for host, (size, seconds) in hosts.items() if seconds},
+    }
+
+def write_prometheus_textfile(path, summary):
+    """Writes a batch summary in the Prometheus text exposition format, replacing the file atomically."""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"')
+    lines = []
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP media_catcher_{name} {help_text}")
+        lines.append(f"# TYPE media_catcher_{name} gauge")
+        for labels, value in samples:
+            label_text = "{" + ",".join(f'{key}="{escape(val)}"' for key, val in labels.items()) + "}" if labels else ""
+            lines.append(f"media_catcher_{name}{label_text} {value if value is not None else 'NaN'}")
+
+    metric("last_batch_timestamp_seconds", "Time the last batch finished.", [({}, round(time.time(), 3))])
+    metric("last_batch_jobs", "Jobs of the last batch by final state.",
+           [({"state": state}, count) for state, count in sorted(summary["jobs"].items())])
+    metric("last_batch_bytes", "Bytes downloaded by the last batch.", [({}, summary["bytes"])])
+    metric("last_batch_wall_seconds", "Duration of the last batch.", [({}, summary["wall_seconds"])])
+    metric("last_batch_throughput_bytes_per_second", "Throughput of the last batch.",
+           [({"kind": "batch"}, summary["bytes_per_second"]), ({"kind": "job_avg"}, summary["avg_job_bytes_per_second"]),
+            ({"kind": "job_peak"}, summary["peak_bytes_per_second"])])
+    metric("last_batch_ttfb_seconds", "Time to first byte of the jobs of the last batch.",
+           [({"quantile": "0.5"}, summary["ttfb_p50_seconds"]), ({"quantile": "0.9"}, summary["ttfb_p90_seconds"])])
+    metric("last_batch_phase_seconds", "Time spent per phase, summed over the jobs of the last batch.",
+           [({"phase": phase}, summary[f"{phase}_seconds"]) for phase in ("spawn", "extraction", "postprocess")])
+    metric("last_batch_retries", "Retries in the last batch.", [({}, summary["retries"])])
+    metric("last_batch_host_throughput_bytes_per_second", "Average transfer rate per host in the last batch.",
+           [({"host": host}, rate) for host, rate in sorted(summary["host_bytes_per_second"].items())])
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path) # The collector must never read a partial file
+    except OSError as e:
+        print(f"Could not write Prometheus textfile {path}: {e}", file=sys.stderr)
+
+# === Download Engines ===
+# An engine runs one job at a time per call to run(job, options, on_progress) and returns
+# (returncode, error_text). on_progress receives dicts built by progress_info(),
+# yt-dlp's warnings and errors are fed into job.log as they arrive, and every finished
+# file is appended to job.outputs as {"extractor", "id", "filepath"}. probe(url, job) returns
+# the extraction result of one video as JSON text, like yt-dlp -J, and raises if it fails.
+
+DEFAULT_ENGINE = "subprocess"
+
+class SubprocessEngine:
+    """Runs every job in a fresh yt-dlp process and parses its progress output."""
+    name = "subprocess"
+
+    def run(self, job, options, on_progress):
+        spawned = time.monotonic()
+        process = start_process(options_to_args(options), job, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+        job.metrics.spawn_seconds = time.monotonic() - spawned
+        # Drain stderr concurrently so a chatty child can never block on a full pipe
+        stderr_reader = threading.Thread(target=self._drain, args=(process.stderr, job.log), daemon=True)
+        stderr_reader.start()
+        try:
+            # Parse stdout for progress updates
+            for line in process.stdout:
+                if job.cancel_token.cancelled: break
+
+                info = parse_progress_line(line)
+                if info:
+                    on_progress(info)
+                    continue
+                output = parse_output_line(line)
+                if output:
+                    job.outputs.append(output)
+
+            process.stdout.close()
+            process.wait()
+            stderr_reader.join()
+            return process.returncode, job.log.last_error()
+        finally:
+            unregister_process(process)
+
+    @staticmethod
+    def _drain(stream, log):
+        for line in stream:
+            log.feed(line)
+        stream.close()
+
+    def probe(self, url, job=None):
+        return run_helper(YTDLP_COMMAND + ["-J", "--no-playlist", url], job)
+
+    def shutdown(self):
+        pass
+
+class _PipeLogger:
+    """yt-dlp logger for worker processes: forwards warnings and errors to the parent as log lines."""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        self.conn.send(("log", msg if msg.startswith("WARNING:") else f"WARNING: {msg}"))
+
+    def error(self, msg):
+        self.conn.send(("log", msg))
+
+def _youtubedl_worker_main(conn):
+    """
+    Entry point of an in-process engine worker. Receives (kind, url, params, info_json) tasks over a
+    pipe until the parent sends None. "download" tasks report progress hook dicts back and end with
+    yt-dlp's return code; "probe" tasks end with the extraction result as JSON text, like yt-dlp -J.
+    YoutubeDL instances are kept per distinct parameter set, so jobs of the same batch reuse the
+    already initialised extractors and HTTP connection pools.
+    """
+    if os.name == "posix":
+        os.setsid() # Lead a process group, so Stop also reaches the ffmpeg processes yt-dlp starts
+    import yt_dlp # Only after setsid(): the import takes long enough for a Stop to arrive meanwhile
+
+    instances = OrderedDict() # Serialised params -> YoutubeDL, most recently used last
+    last_sent = [0.0]
+    def progress_hook(d):
+        # Chunk-level hooks are thinned out here; the UI samples at a much lower rate anyway
+        now = time.monotonic()
+        if d.get("status") == "downloading" and now - last_sent[0] < PROGRESS_REFRESH_MS / 2000:
+            return
+        last_sent[0] = now
+        conn.send(("progress", {key: d.get(key) for key in
+                                ("status", "downloaded_bytes", "total_bytes", "total_bytes_estimate",
+                                 "speed", "eta", "filename", "tmpfilename", "fragment_count")}))
+    def postprocessor_hook(d):
+        conn.send(("postprocess", {"status": d.get("status"), "postprocessor": d.get("postprocessor")}))
+        if d.get("status") == "finished" and d.get("postprocessor") == "MoveFiles":
+            info = d.get("info_dict") or {}
+            conn.send(("file", {"extractor": info.get("extractor_key"), "id": info.get("id"),
+                                "filepath": info.get("filepath")}))
+
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        kind, url, params, info_json = task
+        # Bandwidth settings change from job to job, so they are applied to the cached instance
+        per_job = {name: params.pop(name, None) for name in ("ratelimit", "concurrent_fragment_downloads")}
+        key = json.dumps(params, sort_keys=True)
+        try:
+            if key in instances:
+                instances.move_to_end(key)
+                ydl = instances[key]
+            else:
+                ydl = yt_dlp.YoutubeDL(dict(params, logger=_PipeLogger(conn), progress_hooks=[progress_hook],
+                                            postprocessor_hooks=[postprocessor_hook]))
+                instances[key] = ydl
+                if len(instances) > 4:
+                    instances.popitem(last=False)[1].close()
+            ydl.params.update(per_job)
+            if kind == "probe":
+                conn.send(("done", json.dumps(ydl.sanitize_info(ydl.extract_info(url, download=False)))))
+                continue
+            ydl._download_retcode = 0 # The return code is sticky across downloads on one instance
+            conn.send(("done", ydl.download_with_info_file(info_json) if info_json else ydl.download([url])))
+        except Exception as e:
+            conn.send(("log", f"ERROR: {e}"))
+            conn.send(("done", 1))
+
+class YoutubeDLEngine:
+    """
+    Runs jobs through the yt_dlp Python API in long-lived worker processes.
+    This avoids the interpreter startup and extractor import cost of a new yt-dlp process per
+    job, and delivers structured progress from progress_hooks instead of parsed text.
+    Workers are started on demand and kept for later jobs and batches.
+    """
+    name = "inprocess"
+
+    def __init__(self):
+        import multiprocessing
+        self._context = multiprocessing.get_context("spawn") # Forking a running Qt app is unsafe
+        self._idle = Queue()
+
+    @staticmethod
+    def is_available():
+        import importlib.util
+        return importlib.util.find_spec("yt_dlp") is not None
+
+    def _acquire_worker(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            parent_conn, child_conn = self._context.Pipe()
+            process = self._context.Process(target=_youtubedl_worker_main, args=(child_conn,),
+                                            name="yt-dlp-worker", daemon=True)
+            process.start()
+            child_conn.close()
+            return process, parent_conn
+
+    def _submit(self, worker, job, task, on_message):
+        """
+        Runs one task on a worker registered for `job` and returns the result of its "done"
+        message, or None if the job was cancelled before the task was sent. Other messages go
+        to on_message. Raises EOFError or OSError if the worker dies; it is not reused then.
+        """
+        process, conn = worker
+        register_process(process, job)
+        try:
+            if job is not None and job.cancel_token.cancelled: # Stopped while the worker was starting; it is being terminated
+                process.join(timeout=1)
+                return None
+            conn.send(task)
+            while True:
+                message = conn.recv()
+                if message[0] == "done":
+                    self._idle.put(worker)
+                    return message[1]
+                on_message(message)
+        except (EOFError, OSError):
+            process.join(timeout=1)
+            raise
+        finally:
+            unregister_process(process)
+
+    def run(self, job, options, on_progress):
+        def on_message(message):
+            if message[0] == "progress":
+                hook = message[1]
+                on_progress(progress_info(hook["status"], hook["downloaded_bytes"],
+                                          hook["total_bytes"] or hook["total_bytes_estimate"],
+                                          hook["speed"], hook["eta"], hook["tmpfilename"],
+                                          hook["fragment_count"]))
+            elif message[0] == "log":
+                job.log.feed(message[1])
+            elif message[0] == "file":
+                job.outputs.append(message[1])
+
+        spawned = time.monotonic()
+        worker = self._acquire_worker()
+        job.metrics.spawn_seconds = time.monotonic() - spawned # Close to 0 when an idle worker is reused
+        try:
+            returncode = self._submit(worker, job, ("download", options["url"], options_to_params(options),
+                                                    options.get("info_json")), on_message)
+        except (EOFError, OSError): # The worker was terminated (e.g. by Stop) or crashed
+            return -1, "Download worker exited unexpectedly"
+        return (-1 if returncode is None else returncode), job.log.last_error()
+
+    def probe(self, url, job=None):
+        log = JobLog()
+        params = options_to_params({"url": url, "outtmpl": "%(title)s.%(ext)s", "playlist": "none"})
+        try:
+            output = self._submit(self._acquire_worker(), job, ("probe", url, params, None),
+                                  lambda message: log.feed(message[1]) if message[0] == "log" else None)
+        except (EOFError, OSError):
+            raise RuntimeError("Download worker exited unexpectedly")
+        if not isinstance(output, str):
+            raise RuntimeError(log.last_error() or "yt-dlp could not extract the video")
+        return output
+
+    def shutdown(self):
+        """Asks every idle worker to exit."""
+        while True:
+            try:
+                process, conn = self._idle.get_nowait()
+            except Empty:
+                break
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join(timeout=2)
+
+_engines = {}
+
+def get_engine(name):
+    """Returns the shared engine instance for a name, falling back to the subprocess engine."""
+    if name == YoutubeDLEngine.name and not YoutubeDLEngine.is_available():
+        print("yt_dlp module not found, falling back to the yt-dlp executable", file=sys.stderr)
+        name = SubprocessEngine.name
+    if name not in _engines:
+        _engines[name] = YoutubeDLEngine() if name == YoutubeDLEngine.name else SubprocessEngine()
+    return _engines[name]
+
+def shutdown_engines():
+    for engine in _engines.values():
+        engine.shutdown()
+
+# === Post-processing Stage ===
+# With deferred post-processing the engines only download the raw streams; audio extraction
+# and stream merging then run as a second pipeline stage with its own ffmpeg pool, so download
+# workers move straight on to the next item instead of waiting for the transcode.
+
+POSTPROCESS_WORKERS = os.cpu_count() or 2 # ffmpeg is CPU-bound, so one process per core
+RAW_OUTTMPL = "%(title)s.f%(format_id)s.%(ext)s" # Raw streams, named like yt-dlp's own intermediates
+# Audio formats as yt-dlp's -x converts them: format -> (extension, encoder, muxer, -q:a for
+# --audio-quality 10 and 0). An encoder of None leaves the codec to the muxer's default.
+AUDIO_CODECS = {"mp3": ("mp3", "libmp3lame", None, (10, 0)), "aac": ("m4a", "aac", "ipod", (0.1, 4)),
+                "wav": ("wav", None, "wav", None)}
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+def final_path(raw_path, ext):
+    """Turns the path of a raw stream ('Title.f251.webm') into the path of the finished file."""
+    base = re.sub(r"\.f[\w-]+\.\w+$", "", raw_path)
+    if base == raw_path:
+        base = os.path.splitext(raw_path)[0]
+    return f"{base}.{ext}"
+
+def audio_quality_args(quality, scale):
+    """
+    ffmpeg options for yt-dlp's --audio-quality: a VBR quality from 0 (best) to 10, mapped onto
+    the encoder's -q:a `scale`, or a bitrate in kbit/s above 10.
+    """
+    if quality is None:
+        return []
+    quality = float(str(quality).rstrip("kK"))
+    if quality > 10:
+        return ["-b:a", f"{quality}k"]
+    if scale is None:
+        return []
+    worst, best = scale
+    return ["-q:a", f"{best + (worst - best) * (quality / 10)}"]
+
+def postprocess_tasks(spec, outputs):
+    """
+    Builds the ffmpeg work for the raw files of one job: the files are grouped by video and
+    every group becomes one task {"extractor", "id", "inputs", "output", "command"}.
+    """
+    groups = OrderedDict()
+    for output in outputs:
+        groups.setdefault((output["extractor"], output["id"]), []).append(output["filepath"])
+    tasks = []
+    for (extractor, video_id), inputs in groups.items():
+        command = ["ffmpeg", "-y", "-nostdin", "-loglevel", "error"]
+        if spec["action"] == "extract_audio":
+            inputs = inputs[:1]
+            extension, encoder, muxer, scale = AUDIO_CODECS[spec["audio_format"]]
+            output = final_path(inputs[0], extension)
+            command += ["-i", inputs[0], "-vn"]
+            if inputs[0].endswith(f".{extension}"): # Already the target codec, which yt-dlp keeps as it is
+                command += ["-c:a", "copy"]
+            elif encoder:
+                command += ["-c:a", encoder] + audio_quality_args(spec.get("audio_quality"), scale)
+            if muxer:
+                command += ["-f", muxer]
+        else: # "merge": the video stream comes first, as requested in the format spec
+            output = final_path(inputs[0], spec["merge_output_format"])
+            for path in inputs:
+                command += ["-i", path]
+            for i in range(len(inputs)):
+                command += ["-map", str(i)]
+            command += ["-c", "copy"]
+        tasks.append({"extractor": extractor, "id": video_id, "inputs": inputs, "output": output,
+                      "command": command + [output]})
+    return tasks
+
+def run_ffmpeg(command, job=None):
+    """Runs one ffmpeg command as a stoppable process of `job`. Returns None on success, else the error text."""
+    process = start_process(command, job, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, encoding='utf-8', errors='replace')
+    try:
+        _, stderr = process.communicate()
+    finally:
+        unregister_process(process)
+    if process.returncode == 0:
+        return None
+    lines = [line for line in stderr.splitlines() if line.strip()]
+    return lines[-1] if lines else f"ffmpeg exited with code {process.returncode}"
+
+class PostProcessingStage:
+    """
+    Second stage of the download pipeline: a pool of POSTPROCESS_WORKERS threads that each
+    drive one ffmpeg process at a time. Jobs are queued with submit() and reported back through
+    their `on_done(job, outputs, error)` callback on a pool thread. The stage keeps per-stage
+    counters (queue depth, busy and waiting time) for telling network- from CPU-bound batches.
+    """
+    def __init__(self, max_workers=POSTPROCESS_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.peak_queued = 0
+        self.busy_seconds = 0.0 # Time spent running ffmpeg, summed over the pool
+        self.wait_seconds = 0.0 # Time jobs spent waiting for a free ffmpeg slot
+
+    def submit(self, job, tasks, on_done):
+        from concurrent.futures import ThreadPoolExecutor
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="postprocess")
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            self._executor.submit(self._run, job, tasks, time.monotonic(), on_done)
+
+    def _run(self, job, tasks, queued_at, on_done):
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += started - queued_at
+        outputs, error = [], None
+        try:
+            for task in tasks:
+                error = "Stopped" if job.cancel_token.cancelled else run_ffmpeg(task["command"], job)
+                if error:
+                    if os.path.exists(task["output"]):
+                        os.remove(task["output"]) # Never leave a half-written file behind
+                    break
+                for path in task["inputs"]:
+                    if path != task["output"] and os.path.exists(path):
+                        os.remove(path)
+                outputs.append({"extractor": task["extractor"], "id": task["id"], "filepath": task["output"]})
+        except Exception as e:
+            error = str(e)
+        finally:
+            elapsed = time.monotonic() - started
+            job.timings.update(queue=started - queued_at, postprocess=elapsed)
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.busy_seconds += elapsed
+        on_done(job, outputs, error)
+
+    def join(self):
+        """Waits until every queued job has been post-processed."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.max_workers, "queued": self.queued, "running": self.running,
+                    "completed": self.completed, "peak_queued": self.peak_queued,
+                    "busy_seconds": self.busy_seconds, "wait_seconds": self.wait_seconds}
+
+# === Download Scheduling ===
+
+class DownloadJob:
+    """
+    A single schedulable unit of work: one video, or one item of an expanded playlist.
+    Every job gets a unique id so progress and status updates can be tagged with it.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, url, job_type="single", playlist_index=None, title=None, video_key=None):
+        self.id = next(DownloadJob._ids)
+        self.url = url
+        self.type = job_type # "single", "playlist_first", "playlist_item" or "full_playlist"
+        # A playlist job's URL names the playlist, so an error of one of its items says nothing about it
+        self.single_item = job_type in ("single", "playlist_item")
+        self.playlist_index = playlist_index
+        self.title = title
+        # (extractor, video id) when it is known without running yt-dlp, else None
+        self.video_key = video_key or (get_video_key(url) if job_type == "single" else None)
+        # Identity used to merge duplicate requests for the same item within a batch
+        self.media_key = self.video_key or ("url", canonical_url(url))
+        self.requesters = [] # Input URLs that asked for this item (several once duplicates are merged)
+        self.host = get_host(url)
+        self.state = "queued"
+        self.log = JobLog()
+        self.outputs = [] # Files produced by the job, reported by the engine
+        self.journal_id = None # "<batch>:<random id>" once the job is recorded in the journal
+        self.partial_path = None # yt-dlp's .part file while downloading
+        self.timings = {} # Seconds spent per pipeline stage: "download", "queue", "postprocess"
+        self.metrics = JobMetrics()
+        self.attempt = 0 # Retries so far
+        self.sync_key = None # Playlist key of the sync that queued the job, if any
+        self.cancel_token = CancelToken(stop_token) # Re-parented to the batch token when queued
+
+    @classmethod
+    def from_record(cls, record):
+        """Recreates a job from its journal record, keeping its journal id."""
+        video_key = tuple(record["video_key"]) if record.get("video_key") else None
+        job = cls(record["url"], record["type"], record.get("index"), record.get("title"), video_key)
+        job.journal_id = record["job"]
+        job.partial_path = record.get("partial")
+        return job
+
+class JobScheduler:
+    """
+    Runs jobs on a bounded pool of worker threads fed from a shared queue.
+    Jobs are queued per host and handed out round-robin, and no host may have more
+    than `max_per_host` jobs running at once. Jobs can be submitted while the pool
+    is already running; call close() once nothing more will be submitted.
+    Failed jobs can be put back with retry() to run again after a delay, without holding
+    a worker meanwhile, and hosts whose `breaker` is open are passed over until it closes.
+    While paused, no new jobs are handed out, and set_limit() lowers the number of jobs
+    that may run at once below `max_workers` (the number of worker threads).
+    """
+    def __init__(self, handler, max_workers=DEFAULT_MAX_WORKERS, max_per_host=MAX_JOBS_PER_HOST, breaker=None):
+        self.handler = handler
+        self.max_workers = max(1, max_workers)
+        self.max_per_host = max(1, max_per_host)
+        self.limit = self.max_workers
+        self.breaker = breaker
+        self._queues = OrderedDict() # host -> deque of pending jobs
+        self._delayed = [] # Heap of (due time, sequence, job) waiting for a retry
+        self._sequence = itertools.count()
+        self._active_hosts = Counter()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._cancelled = False
+        self._paused = False
+        self._threads = []
+
+    def start(self):
+        """Starts the worker threads."""
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"download-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job):
+        """Adds a job to the queue of its host."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Cannot submit jobs to a closed scheduler")
+            self._queues.setdefault(job.host, deque()).append(job)
+            self._cond.notify()
+
+    def retry(self, job, delay):
+        """
+        Queues a job again once `delay` seconds have passed. Allowed after close(), since
+        it is called by the handler of a running job; ignored after cancel().
+        """
+        with self._cond:
+            if self._cancelled:
+                return
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), job))
+            self._cond.notify()
+
+    def close(self):
+        """Marks the queue as complete. Workers exit once it and the pending retries have been drained."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Drops all pending jobs. Jobs that are already running are left to the handler."""
+        with self._cond:
+            self._cancelled = self._closed = True
+            self._queues.clear()
+            self._delayed.clear()
+            self._cond.notify_all()
+
+    def pause(self):
+        """Stops handing out jobs until resume(); running jobs are not affected."""
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def set_limit(self, limit):
+        """Changes how many jobs may run at once (at most max_workers); running jobs are not affected."""
+        with self._cond:
+            self.limit = max(1, min(self.max_workers, limit))
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Blocks until every worker thread has exited or `timeout` has passed. Returns True once all have."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def pending_count(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values()) + len(self._delayed)
+
+    def drop_retries(self):
+        """Removes and returns the jobs still waiting for a retry, e.g. when the batch is stopped."""
+        with self._cond:
+            jobs = [job for due, sequence, job in self._delayed]
+            self._delayed.clear()
+            self._cond.notify_all()
+            return jobs
+
+    def _next_job(self):
+        """
+        Pops the next job whose host is below its cap and not held back by the breaker.
+        Returns (job, None), or (None, seconds until a retry or a breaker is due) when no job
+        can start now. Must be called with the lock held.
+        """
+        if self._paused or sum(self._active_hosts.values()) >= self.limit:
+            return None, None
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            job = heapq.heappop(self._delayed)[2]
+            self._queues.setdefault(job.host, deque()).append(job)
+        wake_in = self._delayed[0][0] - now if self._delayed else None
+        for host in list(self._queues):
+            queue = self._queues[host]
+            cap = self.max_per_host
+            if self.breaker:
+                blocked = self.breaker.blocked_for(host)
+                if blocked:
+                    wake_in = min(wake_in, blocked) if wake_in is not None else blocked
+                    continue
+                if self.breaker.is_half_open(host):
+                    cap = 1 # A single probe job until the host answers again
+            if self._active_hosts[host] >= cap:
+                continue
+            job = queue.popleft()
+            # Rotate the host to the end so other hosts get their turn
+            del self._queues[host]
+            if queue:
+                self._queues[host] = queue
+            return job, None
+        return None, wake_in
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._cancelled:
+                        return
+                    job, wake_in = self._next_job()
+                    if job:
+                        break
+                    # A running job may still put itself back with retry()
+                    if (self._closed and not self._paused and not self._queues and not self._delayed
+                            and not sum(self._active_hosts.values())):
+                        return
+                    self._cond.wait(wake_in)
+                self._active_hosts[job.host] += 1
+            try:
+                self.handler(job)
+            except Exception as e:
+                print(f"Unhandled error in job {job.id} ({job.url}): {e}", file=sys.stderr)
+            finally:
+                with self._cond:
+                    self._active_hosts[job.host] -= 1
+                    self._cond.notify_all()
+
+# === Download Batches ===
+
+def _ignore_status(*args):
+    pass
+
+class DownloadBatch:
+    """
+    One batch of downloads, from input URLs to finished files.
+    Input URLs are expanded into jobs (one per video, or one per playlist item), which
+    are then run concurrently by a JobScheduler. Status changes are reported through the
+    `on_status(message, color)` and `on_job_status(job, message, color)` callbacks, while
+    transfer progress goes into `progress_board` for the caller to sample.
+    The whole batch or single jobs can be paused, resumed and (jobs only) cancelled while
+    it runs; stopping the batch as a whole goes through request_stop().
+    """
+    def __init__(self, urls, mode, download_playlist, download_subs, subtitle_lang, output_dir,
+                 audio_format="mp3", audio_quality="192K", video_quality="Best available",
+                 max_workers=DEFAULT_MAX_WORKERS, max_per_host=MAX_JOBS_PER_HOST, engine=DEFAULT_ENGINE,
+                 skip_downloaded=True, resume=None, defer_postprocessing=True, prometheus_path=None,
+                 hardlink_duplicates=False, sync=False, bandwidth_limit=None, adaptive_concurrency=False,
+                 on_status=_ignore_status, on_job_status=_ignore_status):
+        self.on_status = on_status
+        self.on_job_status = on_job_status
+        self.engine = get_engine(engine) if isinstance(engine, str) else engine # A name or an engine object
+        self.skip_downloaded = skip_downloaded
+        self.hardlink_duplicates = hardlink_duplicates # Replace byte-identical output files with hardlinks
+        self.sync = sync # Queue only the playlist items that earlier syncs have not handled
+        self.urls = urls
+        self.mode = mode
+        self.download_playlist = download_playlist
+        self.download_subs = download_subs
+        self.subtitle_lang = subtitle_lang
+        self.output_dir = output_dir
+        self.audio_format = audio_format
+        self.audio_quality = audio_quality
+        self.video_quality = video_quality
+        self.resume = resume # Pending batch from the job journal to continue, if any
+        # ffmpeg runs in its own stage when it can be called directly, else yt-dlp runs it inline
+        self.defer_postprocessing = defer_postprocessing and ffmpeg_available()
+        self.postprocessing = PostProcessingStage()
+        self.download_seconds = 0.0 # Time spent in the download stage, summed over the workers
+        self.prometheus_path = prometheus_path # Textfile for node_exporter, written when the batch ends
+        self.job_metrics = [] # Metrics records of the finished jobs and of their retried attempts
+        self.started_at = self.finished_at = None
+        self.batch_id = None
+        self.scheduler = None
+        self.cancel_token = CancelToken(stop_token) # Parent of the tokens of all jobs in the batch
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        # Splits `bandwidth_limit` (bytes/s for the whole batch) between the jobs and, with
+        # adaptive_concurrency, decides how many of the max_workers slots are used
+        self.governor = BandwidthGovernor(bandwidth_limit, max_workers, adaptive_concurrency)
+        self._lock = threading.Lock()
+        self.progress_board = ProgressBoard()
+        self._total_jobs = 0
+        self._pending_scans = 0
+        self._all_queued = False # Set once every input URL has been expanded into jobs
+        self._started_jobs = 0
+        self._completed_jobs = 0
+        self.jobs = []
+        self._jobs_by_key = {} # media_key -> job, for merging duplicates
+        self.duplicates = 0 # Requests merged into an already queued job
+        self.hardlinked = 0
+
+    def run(self):
+        """
+        Expands the input URLs into jobs and runs them on the scheduler until all are finished.
+        Playlists are listed concurrently in a small pool while the URLs that need no listing
+        are already downloading; each playlist's items are queued as soon as its scan finishes.
+        """
+        self.variant = self.build_variant()
+        self.started_at = time.monotonic()
+
+        scheduler = JobScheduler(self.run_job, self.max_workers, self.max_per_host, breaker=host_breaker)
+        self.scheduler = scheduler
+        scheduler.set_limit(self.governor.limit)
+        if self.cancel_token.paused: # Paused before the batch got going
+            scheduler.pause()
+        scheduler.start()
+        jobs_done = threading.Event()
+        if self.governor.adaptive:
+            threading.Thread(target=self.govern, args=(jobs_done,), name="bandwidth-governor", daemon=True).start()
+
+        if self.resume:
+            self.batch_id = self.resume["batch"]
+            jobs = [DownloadJob.from_record(record) for record in self.resume["jobs"]]
+            self.on_status(f"🔁 Resuming {len(jobs) + len(self.urls)} unfinished item(s)", "cyan")
+            self.queue_jobs(scheduler, jobs, journaled=True)
+        else:
+            self.batch_id = job_journal.start_batch(self.settings(), self.urls)
+
+        playlist_urls = []
+        repeated_scans = {} # Playlist inputs that repeat an earlier one are listed only once
+        for url in self.urls:
+            if not self.needs_playlist_scan(url):
+                self.queue_jobs(scheduler, self.expand_url(url), url)
+                continue
+            scan_key = (get_playlist_key(url), get_video_index_from_url(url))
+            if scan_key in repeated_scans:
+                repeated_scans[scan_key].append(url)
+            else:
+                repeated_scans[scan_key] = []
+                playlist_urls.append(url)
+
+        if playlist_urls:
+            with self._lock:
+                self._pending_scans = len(playlist_urls)
+            self.on_status(f"🔎 Scanning {len(playlist_urls)} playlist(s)...", "cyan")
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            with ThreadPoolExecutor(max_workers=PRESCAN_WORKERS) as pool:
+                scans = {pool.submit(self.expand_url, url): url for url in playlist_urls}
+                for future in as_completed(scans):
+                    if self.cancel_token.cancelled:
+                        for scan in scans:
+                            scan.cancel()
+                        break
+                    with self._lock:
+                        self._pending_scans -= 1
+                    url = scans[future]
+                    repeats = repeated_scans[(get_playlist_key(url), get_video_index_from_url(url))]
+                    self.queue_jobs(scheduler, future.result(), url, also_requested_by=repeats)
+
+        if self.duplicates:
+            self.on_status(f"🔗 Merged {self.duplicates} duplicate request(s) into queued items", "cyan")
+
+        self._all_queued = True
+        scheduler.close()
+        while not scheduler.join(timeout=0.05):
+            if self.cancel_token.cancelled: # Retries and breaker-held jobs would otherwise keep the batch waiting
+                scheduler.cancel()
+        jobs_done.set()
+        for job in self.jobs:
+            if job.state == "retrying": # Dropped by Stop while waiting for its retry
+                job.state = "stopped"
+                job_journal.set_state(job, job.state, job.partial_path)
+        self.postprocessing.join()
+        self.finished_at = time.monotonic()
+        job_journal.compact() # Drop the batch from the journal once nothing in it is pending
+        if self.prometheus_path:
+            write_prometheus_textfile(self.prometheus_path, self.metrics_summary())
+        if self.postprocessing.completed:
+            self.on_status(self.format_stage_report(), "cyan")
+        if self.cancel_token.cancelled and last_stop_latency is not None:
+            self.on_status(f"⏹️ All downloads stopped in {last_stop_latency * 1000:.0f} ms", "orange")
+        return self.summary()
+
+    def govern(self, done):
+        """
+        Samples the batch's throughput until `done` is set and hands the average of every
+        GOVERNOR_INTERVAL to the governor, applying the concurrency limit it decides on.
+        Time spent paused is left out, so a pause does not read as a collapse in throughput.
+        """
+        samples = []
+        while not done.wait(GOVERNOR_INTERVAL / 4):
+            if self.cancel_token.paused:
+                samples = []
+                continue
+            totals = self.progress_board.aggregate()
+            samples.append((totals["speed"], totals["active_jobs"]))
+            if len(samples) < 4:
+                continue
+            throughput = sum(speed for speed, active in samples) / len(samples)
+            active = round(sum(active for speed, active in samples) / len(samples))
+            samples = []
+            limit = self.governor.step(throughput, active)
+            if limit is not None:
+                self.scheduler.set_limit(limit)
+                self.on_status(f"📶 {limit} parallel download(s) at {format_bytes(throughput)}/s", "cyan")
+
+    def summary(self):
+        """Counts the jobs of the batch by state."""
+        with self._lock:
+            counts = Counter(job.state for job in self.jobs)
+        summary = dict(counts, total=sum(counts.values()))
+        if self.duplicates:
+            summary["duplicates"] = self.duplicates
+        if self.hardlinked:
+            summary["hardlinked"] = self.hardlinked
+        return summary
+
+    def stage_stats(self):
+        """Timing and queue depth of both pipeline stages."""
+        with self._lock:
+            download = {"busy_seconds": self.download_seconds, "workers": self.max_workers,
+                        "concurrency_limit": self.governor.limit}
+        return {"download": download, "postprocess": self.postprocessing.stats()}
+
+    def format_stage_report(self):
+        """
+        Summarises where the batch spent its time. Jobs that waited for a free ffmpeg slot longer
+        than ffmpeg itself took mean post-processing was the bottleneck, otherwise the network was.
+        """
+        stats = self.stage_stats()
+        post = stats["postprocess"]
+        bound = "CPU-bound" if post["wait_seconds"] > post["busy_seconds"] / 2 else "network-bound"
+        return (f"⏱️ Download {stats['download']['busy_seconds']:.1f}s • Post-processing {post['busy_seconds']:.1f}s "
+                f"on {post['workers']} core(s), peak queue {post['peak_queued']} ({bound})")
+
+    def needs_playlist_scan(self, url):
+        """Returns True if the URL has to be listed with yt-dlp before it can be scheduled."""
+        return self.download_playlist and (is_playlist_url(url) or is_video_from_playlist(url))
+
+    def settings(self):
+        """The batch options as constructor keyword arguments, stored in the journal for resuming."""
+        return {"mode": self.mode, "download_playlist": self.download_playlist,
+                "download_subs": self.download_subs, "subtitle_lang": self.subtitle_lang,
+                "output_dir": self.output_dir, "audio_format": self.audio_format,
+                "audio_quality": self.audio_quality, "video_quality": self.video_quality,
+                "skip_downloaded": self.skip_downloaded, "hardlink_duplicates": self.hardlink_duplicates,
+                "sync": self.sync}
+
+    def queue_jobs(self, scheduler, jobs, source_url=None, journaled=False, also_requested_by=()):
+        """
+        Adds freshly expanded jobs to the running scheduler and grows the batch total.
+        A job whose media_key is already queued is not scheduled again: its requesters are
+        added to the existing job instead. New jobs are journaled first, then their input
+        URL (and any repeated inputs listed in `also_requested_by`) is marked as expanded.
+        """
+        requesters = [url for url in (source_url, *also_requested_by) if url]
+        new_jobs = []
+        for job in jobs:
+            existing = self._jobs_by_key.get(job.media_key)
+            if existing is not None:
+                existing.requesters.extend(requesters)
+                self.duplicates += 1
+                continue
+            self._jobs_by_key[job.media_key] = job
+            job.requesters.extend(requesters)
+            job.cancel_token = CancelToken(self.cancel_token)
+            new_jobs.append(job)
+        self.duplicates += len(also_requested_by) # Repeated playlist inputs that were never listed
+        jobs = new_jobs
+
+        if not journaled:
+            for job in jobs:
+                job_journal.add_job(self.batch_id, job)
+            for url in requesters:
+                job_journal.mark_expanded(self.batch_id, url)
+        with self._lock:
+            self.jobs.extend(jobs)
+            self._total_jobs += len(jobs)
+            self.progress_board.total_jobs = self._total_jobs
+        for job in jobs:
+            scheduler.submit(job)
+
+    def jobs_since(self, start):
+        """Returns the jobs queued after the first `start` ones, for views that follow the batch."""
+        with self._lock:
+            return self.jobs[start:]
+
+    def format_total(self):
+        """Formats the batch total, marked with '+' while playlist scans are still running."""
+        with self._lock:
+            return f"{self._total_jobs}+" if self._pending_scans else str(self._total_jobs)
+
+    def expand_url(self, url):
+        """
+        Turns one input URL into a list of jobs.
+        When playlists are enabled, every playlist item becomes its own job.
+        """
+        if is_playlist_url(url) and self.download_playlist and self.sync:
+            return self.sync_playlist(url)
+        elif is_playlist_url(url) and self.download_playlist:
+            entries = get_playlist_entries(url)
+            if entries is None: # Listing failed, let yt-dlp walk the playlist itself
+                return [DownloadJob(url, "full_playlist")]
+            return [self.job_from_entry(entry) for entry in entries]
+        elif is_playlist_url(url) and not self.download_playlist:
+            self.on_status("⚠️ Playlist detected - downloading first video only", "orange")
+            return [DownloadJob(url, "playlist_first")]
+        elif is_video_from_playlist(url) and self.download_playlist:
+            start_index = get_video_index_from_url(url)
+            self.on_status(f"📋 Downloading playlist from video #{start_index}", "cyan")
+            entries = get_playlist_entries(url)
+            if entries is None:
+                return [DownloadJob(url.split('&list=')[0])]
+            return [self.job_from_entry(entry) for entry in entries if entry["index"] >= start_index]
+        else: # Standard video URL or single video from a playlist
+            # The URL is downloaded as given; canonical_url() only serves the job's media_key
+            clean_url = url.split('&list=')[0] if '&list=' in url else url
+            return [DownloadJob(clean_url)]
+
+    def sync_playlist(self, url):
+        """
+        Lists a playlist or channel and returns jobs for only the items no earlier sync has
+        handled. Newest-first listings (channels) are cut off after SYNC_KNOWN_RUN items in a
+        row that are already known, so a sync costs a page or two of listing, not the whole
+        playlist. Items are marked as handled once their job finishes, so failures come back.
+        """
+        playlist_key = get_playlist_key(url)
+        known = download_index.synced_items(playlist_key)
+        newest_first = is_channel_url(url)
+        jobs = []
+        listed = known_run = 0
+        entries = iter_playlist_entries(url)
+        try:
+            for entry in entries:
+                listed += 1
+                job = self.job_from_entry(entry)
+                if download_index.media_key_text(job.media_key) not in known:
+                    known_run = 0
+                    job.sync_key = playlist_key
+                    jobs.append(job)
+                    continue
+                known_run += 1
+                if newest_first and known_run >= SYNC_KNOWN_RUN:
+                    break
+        except (RuntimeError, OSError) as e: # OSError: yt-dlp missing or not executable
+            self.on_status(f"❌ Could not list {url}: {str(e)[:80]}", "red")
+            return []
+        finally:
+            entries.close()
+        download_index.add_subscription(playlist_key, url)
+        self.on_status(f"🔄 {len(jobs)} new item(s) in {url} ({listed} listed, {len(known)} known)", "cyan")
+        return jobs
+
+    @staticmethod
+    def job_from_entry(entry):
+        """Creates the job for one item of a playlist listing."""
+        video_key = (entry["ie_key"], entry["id"]) if entry.get("ie_key") and entry.get("id") else None
+        return DownloadJob(entry["url"], "playlist_item", entry["index"], entry["title"], video_key)
+
+    def build_variant(self):
+        """Describes the mode and format of this batch; part of the download index key."""
+        if self.mode == "Audio":
+            if self.audio_format in ["mp3", "aac"]:
+                return f"audio:{self.audio_format}:{self.audio_quality}"
+            return f"audio:{self.audio_format}"
+        variant = f"video:{self.video_quality}"
+        return variant + f":subs-{self.subtitle_lang}" if self.download_subs else variant
+
+    def build_options(self, job):
+        """
+        Describes the download of a single job as an engine-independent options dict.
+        With deferred post-processing the ffmpeg step is left out of the download and described
+        in options["postprocess"] instead, which the engines ignore.
+        """
+        options = {
+            "url": job.url,
+            "outtmpl": os.path.join(self.output_dir, "%(title)s.%(ext)s"),
+            # Add playlist-specific arguments
+            "playlist": {"playlist_first": "first", "full_playlist": "all"}.get(job.type, "none"),
+        }
+
+        # Add mode-specific arguments
+        if self.mode == "Audio":
+            audio_quality = AUDIO_QUALITY_MAP.get(self.audio_quality, "2") if self.audio_format in ["mp3", "aac"] else None
+            if self.defer_postprocessing:
+                options.update(format="bestaudio/best", outtmpl=os.path.join(self.output_dir, RAW_OUTTMPL),
+                               postprocess={"action": "extract_audio", "audio_format": self.audio_format,
+                                            "audio_quality": audio_quality})
+                return options
+            options.update(extract_audio=True, audio_format=self.audio_format, force_overwrites=True)
+            if audio_quality:
+                options["audio_quality"] = audio_quality
+        else: # Video Mode
+            options["merge_output_format"] = "mp4"
+            selection = self.resolve_formats(job, options)
+            if selection:
+                options["format"] = format_selector(*selection)
+            elif is_youtube_url(job.url): # Probing failed: fall back to the fixed YouTube format codes
+                quality_id = self.video_quality
+                use_itag = quality_id != "Best available" and not self.download_subs
+                options["format"] = f"{quality_id.split()[0]}+140" if use_itag else "bestvideo+bestaudio"
+            else: # For other sites, 'best' is more reliable
+                options["format"] = "best"
+
+            if self.download_subs and is_youtube_url(job.url):
+                # Subtitles are named after the video file, so yt-dlp merges these itself
+                options["subtitle_lang"] = self.subtitle_lang
+            elif self.defer_postprocessing and "+" in options["format"]:
+                # 'a,b' downloads both streams as separate files; the merge happens in the next stage
+                options.update(format=separate_streams(options["format"]), merge_output_format=None,
+                               outtmpl=os.path.join(self.output_dir, RAW_OUTTMPL),
+                               postprocess={"action": "merge", "merge_output_format": "mp4"})
+        return options
+
+    def resolve_formats(self, job, options):
+        """
+        Probes the formats of a single-video job and selects the streams closest to the
+        requested quality. A fresh extraction result is put into options["info_json"] for
+        the download to reuse. Returns the select_formats() result, or None to fall back
+        to generic format selectors (playlists, or when probing fails).
+        """
+        if job.type in ("playlist_first", "full_playlist"):
+            return None
+        formats, info_path = probe_formats(job.url, job=job, engine=self.engine)
+        if info_path:
+            options["info_json"] = info_path
+        return select_formats(formats, requested_height(self.video_quality)) if formats else None
+
+    def run_job(self, job):
+        """Runs one job through the engine on a scheduler worker thread and reports its progress."""
+        if self.cancel_token.cancelled: # Stopped: the job stays pending in the journal
+            return
+        if job.cancel_token.cancelled:
+            self.finish_cancelled(job)
+            return
+        if job.cancel_token.paused: # Paused before it started: check again later without holding a worker
+            self.scheduler.retry(job, 1.0)
+            return
+        if self.skip_downloaded and job.attempt == 0:
+            if job.video_key and download_index.lookup(*job.video_key, self.variant):
+                self.skip_job(job, "⏭️ Already downloaded")
+                return
+            failure = download_index.lookup_failure(job.media_key) if job.single_item else None
+            if failure:
+                self.skip_job(job, f"🚫 Unavailable: {failure['error'][:60]}")
+                return
+        allotment = self.governor.allot(job, self.scheduler.pending_count() if self._all_queued else None)
+        if allotment is None: # The running jobs hold the budget: check again later without holding a worker
+            self.scheduler.retry(job, BUDGET_WAIT)
+            return
+        rate, fragments = allotment
+        if job.attempt == 0:
+            with self._lock:
+                self._started_jobs += 1
+                position = self._started_jobs
+            progress_text = f"({position}/{self.format_total()})"
+        else:
+            progress_text = f"(retry {job.attempt})"
+        job.state = "running"
+        job_journal.set_state(job, job.state, job.partial_path)
+        self.progress_board.update(job.id, {"percent": 0.0})
+        self.on_job_status(job, f"⬇️ Downloading {progress_text}...", "white")
+
+        def on_progress(info):
+            self.progress_board.update(job.id, info)
+            job.metrics.observe(info)
+            if info["tmpfilename"] and info["tmpfilename"] != job.partial_path:
+                job.partial_path = info["tmpfilename"]
+                job_journal.set_state(job, job.state, job.partial_path)
+
+        # --- Execute and Monitor Download ---
+        try:
+            job.metrics.start()
+            started = time.monotonic()
+            options = {}
+            try:
+                options = self.build_options(job) # Video jobs probe their formats here
+                options.update(limit_rate=rate, concurrent_fragments=fragments)
+                returncode, error = self.engine.run(job, options, on_progress)
+            finally:
+                self.governor.release(job, fragments)
+                if options.get("info_json"): # Holds signed stream URLs that expire, so it is never kept
+                    try:
+                        os.remove(options["info_json"])
+                    except OSError:
+                        pass
+            job.timings["download"] = time.monotonic() - started
+            job.metrics.finish(returncode)
+            with self._lock:
+                self.download_seconds += job.timings["download"]
+            self.progress_board.finish(job.id, returncode == 0 and not job.cancel_token.cancelled)
+
+            if self.cancel_token.cancelled:
+                job.state = "stopped"
+                job_journal.set_state(job, job.state, job.partial_path)
+                self.record_metrics(job)
+                return
+            if job.cancel_token.cancelled:
+                self.finish_cancelled(job)
+                return
+
+            if returncode == 0 and options.get("postprocess") and job.outputs:
+                # Hand the raw streams to the ffmpeg stage; this worker moves on to the next job
+                job.state = "postprocessing"
+                job_journal.set_state(job, job.state)
+                self.postprocessing.submit(job, postprocess_tasks(options["postprocess"], job.outputs),
+                                           self.finish_postprocessing)
+                self.on_job_status(job, "⚙️ Queued for post-processing...", "cyan")
+            elif returncode == 0:
+                host_breaker.reset(job.host)
+                self.complete_job(job)
+            else:
+                self.handle_failure(job, error or f"yt-dlp exited with code {returncode}")
+        except Exception as e:
+            job.state = "error"
+            job_journal.set_state(job, job.state)
+            self.progress_board.finish(job.id, False)
+            self.on_job_status(job, f"❌ Exception: {str(e)}", "red")
+            if job.metrics.finished is None:
+                job.metrics.finish(None)
+            self.record_metrics(job, str(e))
+
+    def skip_job(self, job, message):
+        """Finishes a job without running it, e.g. because the index already has it."""
+        job.state = "skipped"
+        job_journal.set_state(job, job.state)
+        if job.sync_key:
+            download_index.mark_synced(job.sync_key, job.media_key)
+        self.progress_board.finish(job.id, True)
+        with self._lock:
+            self._completed_jobs += 1
+            completed = self._completed_jobs
+        self.on_job_status(job, f"{message} ({completed}/{self.format_total()})", "gray")
+        self.record_metrics(job)
+
+    def handle_failure(self, job, error):
+        """
+        Classifies a failed download and either puts the job back on the scheduler after a
+        backoff delay, or marks it as failed. Rate limiting also opens the host's circuit
+        breaker, and permanent failures are recorded in the download index.
+        Playlist jobs are only reported: their errors come from single items, which neither
+        justify a walk over the whole playlist again nor marking the playlist unavailable.
+        """
+        if not job.single_item:
+            job.state = "error"
+            job_journal.set_state(job, job.state)
+            self.on_job_status(job, f"❌ Error: {error[:100]}", "red")
+            self.record_metrics(job, error)
+            return
+        error_class = classify_error(job.log.error_messages() or [error])
+        self.governor.record_failure(error_class)
+        if error_class == "rate_limited":
+            cooldown = host_breaker.trip(job.host)
+            if cooldown:
+                self.on_status(f"🚦 {job.host} is rate limiting, pausing it for {cooldown:.0f}s", "orange")
+        else:
+            host_breaker.reset(job.host) # The host answered, so the breaker can close
+
+        delay = retry_delay(error_class, job.attempt + 1)
+        if delay is not None and not job.cancel_token.cancelled:
+            job.state = "retrying"
+            self.record_metrics(job, error, error_class) # One record per attempt, numbered from 0
+            job.attempt += 1
+            job_journal.set_state(job, job.state, job.partial_path)
+            # A fresh attempt: the log, outputs and metrics of the failed one are not carried over
+            job.log, job.outputs, job.metrics = JobLog(), [], JobMetrics()
+            attempts = RETRY_POLICIES[error_class][0]
+            wait = max(delay, host_breaker.blocked_for(job.host))
+            self.on_job_status(job, f"🔁 {error_class.replace('_', ' ').capitalize()}: {error[:60]} "
+                                    f"- retry {job.attempt}/{attempts} in {wait:.0f}s", "orange")
+            self.scheduler.retry(job, delay)
+            return
+
+        job.state = "error"
+        job_journal.set_state(job, job.state)
+        if error_class == "permanent":
+            download_index.record_failure(job.media_key, error)
+            if job.sync_key: # Never coming back, so later syncs can treat it as handled
+                download_index.mark_synced(job.sync_key, job.media_key)
+        self.on_job_status(job, f"❌ Error: {error[:100]}", "red")
+        self.record_metrics(job, error, error_class)
+
+    def finish_postprocessing(self, job, outputs, error):
+        """Called by the post-processing stage once the ffmpeg work of a job has finished."""
+        if self.cancel_token.cancelled:
+            job.state = "stopped"
+            job_journal.set_state(job, job.state)
+            self.record_metrics(job)
+        elif job.cancel_token.cancelled:
+            self.finish_cancelled(job)
+        elif error:
+            job.state = "error"
+            job_journal.set_state(job, job.state)
+            self.on_job_status(job, f"❌ Post-processing failed: {error[:100]}", "red")
+            self.record_metrics(job, error)
+        else:
+            job.outputs = outputs
+            self.complete_job(job)
+
+    def pause_downloads(self, job=None):
+        """
+        Pauses one job, or the whole batch when `job` is None. Running processes are frozen with
+        SIGSTOP (POSIX only) and keep their connections and .part files; a paused batch also
+        starts no new jobs. A connection the server drops during a long pause shows up as a
+        transient error on resume, and the retry continues from the .part file.
+        """
+        token = job.cancel_token if job else self.cancel_token
+        token.pause()
+        if job is None and self.scheduler:
+            self.scheduler.pause()
+        for process in processes_of(lambda j: j is job or (job is None and j in self.jobs)):
+            signal_process_group(process, getattr(signal, "SIGSTOP", None))
+        for paused in [job] if job else self.jobs:
+            if paused.state == "running":
+                paused.state = "paused"
+                self.on_job_status(paused, "⏸️ Paused", "orange")
+        if job is None:
+            self.on_status("⏸️ Downloads paused", "orange")
+
+    def resume_downloads(self, job=None):
+        """Resumes a job paused with pause_downloads(job), or the whole batch when `job` is None."""
+        token = job.cancel_token if job else self.cancel_token
+        token.resume()
+        if job is None and self.scheduler:
+            self.scheduler.resume()
+        for process in processes_of(lambda j: (j is job or (job is None and j in self.jobs)) and not j.cancel_token.paused):
+            signal_process_group(process, getattr(signal, "SIGCONT", None))
+        for resumed in [job] if job else self.jobs:
+            if resumed.state == "paused" and not resumed.cancel_token.paused:
+                resumed.state = "running"
+                self.on_job_status(resumed, "▶️ Resumed", "white")
+        if job is None:
+            self.on_status("▶️ Downloads resumed", "cyan")
+
+    def cancel_job(self, job):
+        """
+        Cancels a single job: it is dropped if still queued, and its process tree is terminated
+        if running. The job is not resumed with the batch later.
+        """
+        job.cancel_token.cancel()
+        terminate_process_trees(processes_of(lambda j: j is job))
+        if job.state in ("retrying", "queued"):
+            self.on_job_status(job, "🚫 Cancelling...", "gray")
+
+    def finish_cancelled(self, job):
+        job.state = "cancelled"
+        job_journal.set_state(job, job.state)
+        self.progress_board.finish(job.id, False)
+        self.on_job_status(job, "🚫 Cancelled", "gray")
+        self.record_metrics(job)
+
+    def complete_job(self, job):
+        """
+        Marks a job as done and records its files in the download index. With
+        hardlink_duplicates, files identical to one already on disk become hardlinks to it.
+        """
+        job.state = "done"
+        if job.sync_key:
+            download_index.mark_synced(job.sync_key, job.media_key)
+        linked = 0
+        for output in job.outputs:
+            if output["extractor"] and output["id"]:
+                download_index.record(output["extractor"], output["id"], self.variant, output["filepath"])
+            if self.hardlink_duplicates and output["filepath"] and download_index.link_duplicate(output["filepath"]):
+                linked += 1
+        with self._lock:
+            self._completed_jobs += 1
+            self.hardlinked += linked
+            completed = self._completed_jobs
+        job_journal.set_state(job, job.state)
+        note = " • 🔗 identical file hardlinked" if linked else ""
+        self.on_job_status(job, f"✅ Done ({completed}/{self.format_total()}){note}", "green")
+        self.record_metrics(job)
+
+    def record_metrics(self, job, error=None, error_class=None):
+        """
+        Writes the metrics record of a job that reached its final state, or of a failed attempt
+        that is retried (state 'retrying'). record["attempt"] tells the attempts of a job apart.
+        """
+        record = job.metrics.as_dict(job)
+        record.update(batch=self.batch_id, engine=self.engine.name)
+        if error:
+            record["error"] = error[:200]
+        if error_class:
+            record["error_class"] = error_class
+        with self._lock:
+            self.job_metrics.append(record)
+        metrics_recorder.record(record)
+
+    def metrics_summary(self):
+        """Totals of the job metrics recorded so far in this batch."""
+        with self._lock:
+            records = list(self.job_metrics)
+            wall = (self.finished_at or time.monotonic()) - self.started_at if self.started_at else None
+        return summarize_metrics(records, wall)
+
+# === Helper Functions for URL Analysis ===
+
+def get_host(url):
+    """Returns the host of a URL without the 'www.'/'m.' prefix, used for per-host limits."""
+    hostname = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m.", "music."):
+        if hostname.startswith(prefix):
+            return hostname[len(prefix):]
+    return hostname
+
+# Other sites whose video ID is part of the URL: (extractor, pattern matched against host + path)
+VIDEO_URL_PATTERNS = [
+    ("Vimeo", re.compile(r'^(?:player\.)?vimeo\.com/(?:video/)?(\d+)/?$')),
+    ("Dailymotion", re.compile(r'^dailymotion\.com/video/([a-z0-9]+)', re.IGNORECASE)),
+    ("Dailymotion", re.compile(r'^dai\.ly/([a-z0-9]+)', re.IGNORECASE)),
+]
+# Query parameters that only track where a link was shared; they never change the media
+TRACKING_PARAMS = {"fbclid", "gclid", "si", "feature", "pp", "ab_channel"}
+
+def get_video_key(url):
+    """
+    Returns (extractor, video id) for URLs whose ID can be read without running yt-dlp
+    (YouTube watch, short and youtu.be links, and the VIDEO_URL_PATTERNS sites), else None.
+    """
+    parsed = urlparse(url.strip())
+    host = get_host(url.strip())
+    if host == "youtu.be":
+        video_id = parsed.path.strip("/").split("/")[0]
+    elif host in ("youtube.com", "youtube-nocookie.com"):
+        video_id = parse_qs(parsed.query).get("v", [None])[0]
+        if not video_id:
+            match = re.match(r'^/(?:shorts|embed|live|v)/([\w-]+)', parsed.path)
+            video_id = match.group(1) if match else None
+    else:
+        for extractor, pattern in VIDEO_URL_PATTERNS:
+            match = pattern.match(host + parsed.path)
+            if match:
+                return (extractor, match.group(1))
+        return None
+    return ("Youtube", video_id) if video_id else None
+
+def canonical_url(url):
+    """
+    Reduces a video URL to one spelling, so the same item pasted as a youtu.be link, a mobile
+    link or a watch URL with a timestamp is recognised as one. YouTube videos become their
+    watch URL; other URLs lose their fragment and tracking parameters and get a lower-case host.
+    """
+    url = url.strip()
+    video_key = get_video_key(url)
+    if video_key and video_key[0] == "Youtube":
+        return f"https://www.youtube.com/watch?v={video_key[1]}"
+    parsed = urlparse(url)
+    if not parsed.scheme or not parsed.netloc:
+        return url
+    query = [(name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+             if not name.startswith("utm_") and name not in TRACKING_PARAMS]
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or "/", parsed.params,
+                       urlencode(query), ""))
+
+def is_youtube_url(url):
+    hostname = urlparse(url).hostname or ""
+    return any(domain in hostname for domain in ["youtube.com", "youtu.be"])
+
+# YouTube channel pages, optionally with a tab; their uploads are listed newest first
+CHANNEL_PATH_RE = re.compile(r'^/(?:@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+)(?:/(videos|shorts|streams))?/?$')
+
+def is_channel_url(url):
+    return get_host(url.strip()) == "youtube.com" and bool(CHANNEL_PATH_RE.match(urlparse(url.strip()).path))
+
+def is_playlist_url(url):
+    """True for URLs of a whole playlist (a 'list=' parameter on a /playlist page) or of a channel."""
+    parsed = urlparse(url.strip())
+    if is_channel_url(url):
+        return True
+    return parsed.path.rstrip("/").endswith("/playlist") and "list" in parse_qs(parsed.query)
+
+def playlist_listing_url(url):
+    """
+    The URL to list a playlist with. A channel's front page lists its tabs rather than its
+    videos, so it is replaced by its Videos tab.
+    """
+    url = url.strip()
+    if is_channel_url(url) and not CHANNEL_PATH_RE.match(urlparse(url).path).group(1):
+        parsed = urlparse(url)
+        return urlunparse(parsed._replace(path=parsed.path.rstrip("/") + "/videos"))
+    return url
+
+def is_video_from_playlist(url):
+    """True for links to one video that also name the playlist it was opened from."""
+    return get_video_key(url) is not None and "list" in parse_qs(urlparse(url.strip()).query)
+
+def get_video_index_from_url(url):
+    index = parse_qs(urlparse(url.strip()).query).get("index", ["1"])[0]
+    return int(index) if index.isdigit() else 1
+
+def get_playlist_key(url):
+    """
+    Returns the canonical ID of the playlist a URL points to, used as the cache key.
+    URLs carrying a 'list=' parameter map to that list regardless of the video or index.
+    """
+    list_id = parse_qs(urlparse(url).query).get("list", [None])[0]
+    if list_id:
+        return f"{get_host(url)}:{list_id}"
+    return f"{get_host(url)}:{playlist_listing_url(url).rstrip('/')}"
+
+def run_helper(command, job=None):
+    """
+    Runs a short yt-dlp helper command (listing, probing) and returns its stdout, like
+    subprocess.run(check=True). The process is registered like a download, for `job` when it
+    serves one, so Stop, and the job's own pause and cancel, reach it too. Playlist listings
+    run before their jobs exist and are only reached by Stop.
+    """
+    process = start_process(command, job, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            encoding='utf-8', errors='replace')
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        unregister_process(process)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stdout
+
+def get_playlist_entries(playlist_url, use_cache=True):
+    """
+    Lists the items of a playlist as dicts with 'index' (1-based), 'id', 'ie_key', 'url' and 'title'.
+    Listings are served from the on-disk playlist cache while fresh.
+    Returns None if the playlist could not be listed.
+    """
+    key = get_playlist_key(playlist_url)
+    if use_cache:
+        entries = playlist_cache.get(key)
+        if entries is not None:
+            return entries
+
+    try:
+        # --flat-playlist is very fast as it doesn't fetch metadata for each video.
+        playlist_data = json.loads(run_helper(YTDLP_COMMAND + ["--flat-playlist", "-J",
+                                                               playlist_listing_url(playlist_url)]))
+    except (subprocess.CalledProcessError, json.JSONDecodeError, Exception) as e:
+        print(f"Could not list playlist {playlist_url}: {e}", file=sys.stderr)
+        return None
+
+    entries = []
+    for index, entry in enumerate(playlist_data.get("entries") or [], start=1):
+        entry = playlist_entry(entry, index, playlist_url)
+        if entry:
+            entries.append(entry)
+    playlist_cache.put(key, entries)
+    return entries
+
+def playlist_entry(entry, index, playlist_url):
+    """Reduces one flat yt-dlp playlist entry to the dict get_playlist_entries() returns, or None."""
+    if not entry:
+        return None
+    url = entry.get("url") or entry.get("webpage_url")
+    if not url and entry.get("id") and is_youtube_url(playlist_url):
+        url = f"https://www.youtube.com/watch?v={entry['id']}"
+    if not url:
+        return None
+    return {"index": index, "id": entry.get("id"), "ie_key": entry.get("ie_key"), "url": url, "title": entry.get("title")}
+
+def iter_playlist_entries(playlist_url):
+    """
+    Yields the entries of a playlist as yt-dlp pages through it, in the form get_playlist_entries()
+    returns. Closing the generator early kills yt-dlp, so the remaining pages are never fetched.
+    Not cached: sync mode needs the current listing. Raises RuntimeError if the listing fails.
+    """
+    process = start_process(YTDLP_COMMAND + ["--flat-playlist", "--lazy-playlist", "-j",
+                                             playlist_listing_url(playlist_url)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            encoding='utf-8', errors='replace')
+    log = JobLog()
+    stderr_reader = threading.Thread(target=SubprocessEngine._drain, args=(process.stderr, log), daemon=True)
+    stderr_reader.start()
+    listed = 0
+    try:
+        for line in process.stdout:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            listed += 1
+            entry = playlist_entry(entry, entry.get("playlist_index") or listed, playlist_url)
+            if entry:
+                yield entry
+        process.wait()
+        stderr_reader.join()
+        if process.returncode and not listed:
+            raise RuntimeError(log.last_error() or f"yt-dlp exited with code {process.returncode}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        unregister_process(process)
+
+def iter_url_file(path):
+    """
+    Yields the URLs of a .txt or .csv file one at a time, so huge lists never sit in memory
+    as a whole. Text files have one URL per line ('#' starts a comment); in CSV files the
+    first cell of each row that looks like a URL is used, which also skips a header row.
+    """
+    import csv
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.reader(f):
+                url = next((cell.strip() for cell in row if cell.strip().startswith(("http://", "https://"))), None)
+                if url:
+                    yield url
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+
+def get_format_key(url):
+    """Key of a video in the format cache: its (extractor, ID) when known, else the URL."""
+    video_key = get_video_key(url)
+    return ":".join(video_key) if video_key else url
+
+def probe_formats(url, use_cache=True, job=None, engine=None):
+    """
+    Lists the formats of one video as dicts with the FORMAT_FIELDS, cached per video.
+    Returns (formats, info_path). When yt-dlp had to be run, info_path is its full extraction
+    result saved to disk, so the download can load it instead of extracting again; on a cache
+    hit it is None. Returns (None, None) if the video could not be probed.
+    yt-dlp is run through `engine`, the subprocess engine by default.
+    """
+    key = get_format_key(url)
+    if use_cache:
+        formats = format_cache.get(key)
+        if formats is not None:
+            return formats, None
+
+    try:
+        output = (engine or get_engine(SubprocessEngine.name)).probe(url, job)
+        info = json.loads(output)
+    except (subprocess.CalledProcessError, json.JSONDecodeError, Exception) as e:
+        print(f"Could not probe formats of {url}: {e}", file=sys.stderr)
+        return None, None
+
+    formats = [{field: fmt.get(field) for field in FORMAT_FIELDS}
+               for fmt in info.get("formats") or [] if fmt.get("format_id")]
+    format_cache.put(key, formats)
+    info_path = None
+    try:
+        info_dir = os.path.join(CACHE_DIR, "info")
+        os.makedirs(info_dir, exist_ok=True)
+        info_path = os.path.join(info_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".info.json")
+        with open(info_path, "w", encoding="utf-8") as f:
+            f.write(output)
+    except OSError as e:
+        print(f"Could not save extraction result of {url}: {e}", file=sys.stderr)
+        info_path = None
+    return formats, info_path
@@ -0,0 +1,25 @@
+"""
+Shared setup of the engine tests.
+
+The engine resolves its state directories and the yt-dlp command when it is imported, so
+both are pointed at a scratch directory and at benchmarks/fake_yt_dlp.py before any test
+imports it. The user's own index, journal and caches are never touched.
+"""
+
+import os
+import sys
+import shlex
+import shutil
+import atexit
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+FAKE_YTDLP = os.path.join(REPO_DIR, "benchmarks", "fake_yt_dlp.py")
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="media-catcher-tests-")
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+os.environ.update(XDG_DATA_HOME=os.path.join(SCRATCH_DIR, "data"), XDG_CACHE_HOME=os.path.join(SCRATCH_DIR, "cache"),
+                  MEDIA_CATCHER_YTDLP=f"{shlex.quote(sys.executable)} {shlex.quote(FAKE_YTDLP)}")
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
@@ -0,0 +1,58 @@
+import media_catcher_engine as engine
+
+def jobs(count):
+    return [engine.DownloadJob(f"https://example.com/clip{n}") for n in range(count)]
+
+def allotted(governor):
+    return sum(governor._shares.values())
+
+def test_shares_stay_within_the_budget_when_the_limit_grows():
+    governor = engine.BandwidthGovernor(1000000, max_workers=8, adaptive=True)
+    first, second, third, fourth = jobs(4)
+    governor.limit = 2
+    assert governor.allot(first)[0] == 500000
+    assert governor.allot(second)[0] == 500000
+    governor.limit = 3 # An AIMD increase while both are running
+    assert governor.allot(third) is None
+    assert allotted(governor) <= governor.budget
+
+    governor.release(first) # The next job gets the new equal share, not the remainder
+    assert governor.allot(third)[0] == 1000000 / 3
+    assert governor.allot(fourth) is None
+    assert allotted(governor) <= governor.budget
+
+def test_minimum_share_limits_the_number_of_jobs():
+    governor = engine.BandwidthGovernor(100000, max_workers=3)
+    first, second, third = jobs(3)
+    assert governor.allot(first)[0] == 100000 # The rest would be too little for another job
+    assert governor.allot(second) is None
+    assert governor.allot(third) is None
+    assert allotted(governor) == governor.budget
+
+def test_the_last_job_that_fits_takes_the_rest_of_the_budget():
+    governor = engine.BandwidthGovernor(150000, max_workers=3)
+    first, second, third = jobs(3)
+    assert governor.allot(first)[0] == engine.MIN_JOB_RATE
+    assert governor.allot(second)[0] == 150000 - engine.MIN_JOB_RATE
+    assert governor.allot(third) is None
+    assert allotted(governor) == governor.budget
+
+def test_a_job_with_none_waiting_takes_the_rest_of_the_budget():
+    governor = engine.BandwidthGovernor(1000000, max_workers=4)
+    first, second = jobs(2)
+    assert governor.allot(first)[0] == 250000
+    assert governor.allot(second, waiting=0)[0] == 750000
+
+def test_a_lone_job_gets_a_budget_below_the_minimum_share():
+    governor = engine.BandwidthGovernor(10000)
+    assert governor.allot(jobs(1)[0])[0] == 10000
+
+def test_last_jobs_of_a_batch_split_the_whole_budget():
+    governor = engine.BandwidthGovernor(1000000, max_workers=4)
+    first, second = jobs(2)
+    assert governor.allot(first, waiting=1)[0] == 500000
+    assert governor.allot(second, waiting=0)[0] == 500000
+
+def test_unlimited_batches_get_no_rate_limit():
+    governor = engine.BandwidthGovernor(None)
+    assert governor.allot(jobs(1)[0]) == (None, engine.DEFAULT_CONCURRENT_FRAGMENTS)
@@ -0,0 +1,14 @@
+import media_catcher_engine as engine
+
+def test_archive_export_round_trips_through_import(tmp_path):
+    index = engine.DownloadIndex(str(tmp_path / "downloads.db"))
+    index.record("Youtube", "abc", "audio:mp3:192K", str(tmp_path / "a.mp3"))
+    index.record("Youtube", "abc", "video:Best available", str(tmp_path / "a.mp4"))
+    index.record("Vimeo", "123", "audio:wav", str(tmp_path / "b.wav"))
+    archive = tmp_path / "archive.txt"
+    assert index.export_archive(str(archive)) == 2 # One line per item, whatever its variants
+    assert sorted(archive.read_text().splitlines()) == ["vimeo 123", "youtube abc"]
+
+    other = engine.DownloadIndex(str(tmp_path / "other.db"))
+    assert other.import_archive(str(archive)) == 2
+    assert other.lookup("youtube", "abc", "audio:mp3:192K")
@@ -0,0 +1,51 @@
+import media_catcher_engine as engine
+
+FORMATS = [
+    {"format_id": "18", "ext": "mp4", "height": 360, "vcodec": "avc1.42001E", "acodec": "mp4a.40.2", "tbr": 500},
+    {"format_id": "137", "ext": "mp4", "height": 1080, "vcodec": "avc1.640028", "acodec": "none", "tbr": 4000},
+    {"format_id": "248", "ext": "webm", "height": 1080, "vcodec": "vp9", "acodec": "none", "tbr": 3000},
+    {"format_id": "140", "ext": "m4a", "height": None, "vcodec": "none", "acodec": "mp4a.40.2", "abr": 128},
+    {"format_id": "251", "ext": "webm", "height": None, "vcodec": "none", "acodec": "opus", "abr": 160},
+]
+
+def test_select_formats_prefers_streams_that_fit_the_container():
+    assert engine.select_formats(FORMATS, 1080) == ("137", "140")
+    assert engine.select_formats(FORMATS, 360) == ("18", None)
+    assert engine.select_formats([]) is None
+
+def test_selected_formats_fall_back_to_yt_dlp_choice():
+    assert engine.format_selector("137", "140") == "137+140/bestvideo+bestaudio/best"
+    assert engine.format_selector("18") == "18/best"
+    assert engine.separate_streams("137+140/bestvideo+bestaudio/best") == "137/bestvideo,140/bestaudio"
+    assert engine.separate_streams("137+140") == "137,140"
+
+class RecordingEngine(engine.SubprocessEngine):
+    def __init__(self):
+        self.probed = []
+
+    def probe(self, url, job=None):
+        self.probed.append((url, job))
+        return super().probe(url, job)
+
+def test_probe_runs_through_the_batch_engine(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_SIZE", "1000")
+    recording = RecordingEngine()
+    batch = engine.DownloadBatch([], "Video", False, False, "en", str(tmp_path), engine=recording,
+                                 defer_postprocessing=False)
+    job = engine.DownloadJob("https://example.com/video/probed")
+    options = batch.build_options(job)
+    assert recording.probed == [(job.url, job)]
+    assert options["format"].endswith("/bestvideo+bestaudio/best")
+
+def test_stale_cached_formats_still_download(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_SIZE", "1000")
+    url = "https://example.com/video/stale"
+    engine.format_cache.put(engine.get_format_key(url), [ # IDs the video no longer offers
+        {"format_id": "999", "ext": "mp4", "height": 1080, "vcodec": "avc1", "acodec": "none"},
+        {"format_id": "998", "ext": "m4a", "height": None, "vcodec": "none", "acodec": "mp4a"}])
+    batch = engine.DownloadBatch([], "Video", False, False, "en", str(tmp_path), defer_postprocessing=False)
+    job = engine.DownloadJob(url)
+    options = batch.build_options(job)
+    returncode, error = engine.SubprocessEngine().run(job, options, lambda info: None)
+    assert returncode == 0, error
+    assert job.outputs
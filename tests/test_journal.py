@@ -0,0 +1,78 @@
+import itertools
+import json
+
+import media_catcher_engine as engine
+
+def test_compaction_keeps_only_pending_work(tmp_path):
+    journal = engine.JobJournal(str(tmp_path / "journal.jsonl"))
+    batch_id = journal.start_batch({"mode": "Audio"}, ["https://example.com/a", "https://example.com/list"])
+    journal.mark_expanded(batch_id, "https://example.com/a")
+    done, partial, queued = (engine.DownloadJob(f"https://example.com/{name}") for name in ("a", "b", "c"))
+    for job in (done, partial, queued):
+        journal.add_job(batch_id, job)
+    journal.set_state(done, "running")
+    journal.set_state(done, "done")
+    journal.set_state(partial, "running", "/tmp/b.mp3.part")
+    finished_batch = journal.start_batch({"mode": "Audio"}, ["https://example.com/e"])
+    journal.mark_expanded(finished_batch, "https://example.com/e")
+    finished = engine.DownloadJob("https://example.com/e")
+    journal.add_job(finished_batch, finished)
+    journal.set_state(finished, "done")
+    assert finished_batch not in [batch["batch"] for batch in journal.pending()]
+    assert finished.journal_id in (tmp_path / "journal.jsonl").read_text()
+
+    before = journal.pending()
+    journal.compact()
+    after = journal.pending()
+    assert [batch["batch"] for batch in after] == [batch_id]
+    assert finished_batch not in (tmp_path / "journal.jsonl").read_text() # Dropped by the compaction
+    assert after[0]["urls"] == ["https://example.com/list"]
+    assert [job["url"] for job in after[0]["jobs"]] == [partial.url, queued.url]
+    assert [job["partial"] for job in after[0]["jobs"]] == ["/tmp/b.mp3.part", None]
+    assert [job["job"] for job in after[0]["jobs"]] == [job["job"] for job in before[0]["jobs"]]
+    lines = (tmp_path / "journal.jsonl").read_text().splitlines()
+    assert len(lines) == 4 # The batch, two jobs and the .part file of one
+
+    journal.add_job(batch_id, engine.DownloadJob("https://example.com/d")) # Appending works after compaction
+    assert len(journal.pending()[0]["jobs"]) == 3
+
+def test_compaction_removes_a_journal_without_pending_work(tmp_path):
+    journal = engine.JobJournal(str(tmp_path / "journal.jsonl"))
+    batch_id = journal.start_batch({}, ["https://example.com/a"])
+    journal.compact(discard={batch_id})
+    assert not (tmp_path / "journal.jsonl").exists()
+    assert journal.pending() == []
+
+def test_a_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = engine.JobJournal(str(path))
+    batch_id = journal.start_batch({}, ["https://example.com/a"])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"event": "expanded", "batch": batch_id, "url": "https://example.com/a"})[:20])
+    assert journal.pending()[0]["urls"] == ["https://example.com/a"]
+
+def test_jobs_added_after_a_resume_keep_their_own_records(tmp_path, monkeypatch):
+    journal = engine.JobJournal(str(tmp_path / "journal.jsonl"))
+    batch_id = journal.start_batch({}, ["https://example.com/a", "https://example.com/list"])
+    journal.mark_expanded(batch_id, "https://example.com/a")
+    monkeypatch.setattr(engine.DownloadJob, "_ids", itertools.count(1))
+    first_run = [engine.DownloadJob(f"https://example.com/a{n}") for n in range(3)]
+    for job in first_run:
+        journal.add_job(batch_id, job)
+    for job in first_run[:2]:
+        journal.set_state(job, "done")
+
+    monkeypatch.setattr(engine.DownloadJob, "_ids", itertools.count(1)) # A new process resumes the batch
+    resumed = [engine.DownloadJob.from_record(record) for record in journal.pending()[0]["jobs"]]
+    listed = [engine.DownloadJob(f"https://example.com/b{n}") for n in range(3)] # The rest of the input URLs
+    for job in listed:
+        journal.add_job(batch_id, job)
+        journal.set_state(job, "done")
+    assert [job["url"] for job in journal.pending()[0]["jobs"]] == [job.url for job in resumed]
+
+def test_write_errors_are_reported_on_stderr(tmp_path, capsys):
+    journal = engine.JobJournal(str(tmp_path)) # A directory cannot be opened for appending
+    journal.start_batch({}, ["https://example.com/a"])
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "Could not write job journal" in captured.err
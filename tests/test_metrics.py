@@ -0,0 +1,36 @@
+import media_catcher_engine as engine
+
+def progress_line(status, downloaded, tmpfilename="NA", speed="NA"):
+    return f"{engine.PROGRESS_PREFIX} {status}|{downloaded}|1000000|NA|{speed}|NA|NA|{tmpfilename}"
+
+def test_finished_report_counts_the_file_once():
+    metrics = engine.JobMetrics()
+    metrics.start()
+    for line in (progress_line("downloading", 400000, "clip.mp4.part", 250000.0),
+                 progress_line("downloading", 1000000, "clip.mp4.part", 300000.0),
+                 progress_line("finished", 1000000)): # yt-dlp prints no tmpfilename here
+        metrics.observe(engine.parse_progress_line(line))
+    assert metrics.as_dict(engine.DownloadJob("https://example.com/clip"))["bytes"] == 1000000
+    assert metrics.peak_speed == 300000.0
+
+def test_inprocess_hooks_count_each_file_once():
+    metrics = engine.JobMetrics()
+    for tmpfilename in ("clip.f137.mp4.part", "clip.f140.m4a.part"): # Video and audio of one job
+        metrics.observe(engine.progress_info("downloading", 500000, 1000000, 1.0, 1, tmpfilename))
+        metrics.observe(engine.progress_info("downloading", 1000000, 1000000, 1.0, 0, tmpfilename))
+        metrics.observe(engine.progress_info("finished", 1000000, 1000000, None, None))
+    assert sum(metrics._file_bytes.values()) == 2000000
+
+def test_files_reported_only_as_finished_are_all_counted():
+    metrics = engine.JobMetrics()
+    metrics.observe(engine.progress_info("finished", 300, 300, None, None))
+    metrics.observe(engine.progress_info("finished", 700, 700, None, None))
+    assert sum(metrics._file_bytes.values()) == 1000
+
+def test_parse_progress_line_keeps_pipes_in_the_file_name():
+    info = engine.parse_progress_line(progress_line("downloading", 250000, "a|b.mp4.part", "1024.5"))
+    assert info["tmpfilename"] == "a|b.mp4.part"
+    assert info["percent"] == 25.0
+    assert info["speed"] == 1024.5
+    assert info["eta"] is None
+    assert engine.parse_progress_line("[download] 25.0% of 1MiB") is None
@@ -0,0 +1,39 @@
+import os
+
+import media_catcher_engine as engine
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = engine.PlaylistCache(str(tmp_path))
+    cache.put("list:PL1", [{"index": 1}])
+    assert cache.get("list:PL1") == [{"index": 1}]
+    assert cache.get("list:PL2") is None
+
+def test_expired_entries_are_not_returned(tmp_path):
+    cache = engine.PlaylistCache(str(tmp_path), ttl=-1)
+    cache.put("list:PL1", [])
+    assert cache.get("list:PL1") is None
+
+def test_eviction_keeps_the_directory_bounded(tmp_path):
+    cache = engine.PlaylistCache(str(tmp_path), max_entries=10)
+    for i in range(25):
+        cache.put(f"list:PL{i}", [])
+    files = [name for name in os.listdir(tmp_path) if name.endswith(".json")]
+    assert len(files) <= 10
+    assert cache._count == len(files)
+    assert cache.get("list:PL24") == [] # The most recent write survives
+
+def test_directory_is_only_scanned_when_over_the_bound(tmp_path, monkeypatch):
+    cache = engine.PlaylistCache(str(tmp_path), max_entries=100)
+    scans = []
+    original = engine.PlaylistCache._evict
+    monkeypatch.setattr(engine.PlaylistCache, "_evict", lambda self: (scans.append(1), original(self)))
+    for i in range(150):
+        cache.put(f"list:PL{i}", [])
+    # Each pass evicts down to 90 files, so the 150 writes need a handful of passes, not 150
+    assert 1 <= len(scans) <= 6
+
+def test_overwriting_an_entry_does_not_grow_the_count(tmp_path):
+    cache = engine.PlaylistCache(str(tmp_path), max_entries=10)
+    for _ in range(5):
+        cache.put("list:PL1", [])
+    assert cache._count == 1
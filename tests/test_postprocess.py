@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import media_catcher_engine as engine
+
+def extract_audio_task(raw_path, audio_format, audio_quality=None):
+    spec = {"action": "extract_audio", "audio_format": audio_format, "audio_quality": audio_quality}
+    [task] = engine.postprocess_tasks(spec, [{"extractor": "Youtube", "id": "abc", "filepath": raw_path}])
+    return task
+
+@pytest.mark.parametrize("audio_format", sorted(engine.AUDIO_CODECS))
+def test_deferred_audio_gets_the_name_yt_dlp_gives_it(tmp_path, audio_format):
+    ffmpeg = pytest.importorskip("yt_dlp.postprocessor.ffmpeg")
+    task = extract_audio_task(str(tmp_path / "Title.f251.webm"), audio_format)
+    # With -x, yt-dlp downloads 'Title.webm' and converts it to the extension of the codec
+    assert task["output"] == str(tmp_path / f"Title.{ffmpeg.ACODECS[audio_format][0]}")
+    assert task["command"][-1] == task["output"]
+
+@pytest.mark.parametrize("quality", ["0", "2", "5", "9", "192"])
+def test_audio_quality_follows_yt_dlp(quality):
+    ffmpeg = pytest.importorskip("yt_dlp.postprocessor.ffmpeg")
+    postprocessor = ffmpeg.FFmpegExtractAudioPP(None, preferredcodec="aac", preferredquality=quality)
+    for audio_format in ("mp3", "aac"):
+        extension, encoder, muxer, scale = engine.AUDIO_CODECS[audio_format]
+        assert engine.audio_quality_args(quality, scale) == postprocessor._quality_args(encoder)
+
+def test_aac_is_written_to_an_m4a_container():
+    command = extract_audio_task(os.path.join("out", "Title.f251.webm"), "aac", "2")["command"]
+    assert command[command.index("-c:a") + 1] == "aac"
+    assert command[command.index("-f") + 1] == "ipod"
+    assert "-q:a" in command and "-b:a" not in command
+
+def test_audio_already_in_the_target_codec_is_copied():
+    command = extract_audio_task(os.path.join("out", "Title.f140.m4a"), "aac", "2")["command"]
+    assert command[command.index("-c:a") + 1] == "copy"
+    assert "-q:a" not in command
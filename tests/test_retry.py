@@ -0,0 +1,70 @@
+import pytest
+
+import media_catcher_engine as engine
+
+@pytest.mark.parametrize("message, error_class", [
+    ("ERROR: [youtube] abc: HTTP Error 429: Too Many Requests", "rate_limited"),
+    ("ERROR: [youtube] abc: Private video. Sign in if you've been granted access", "permanent"),
+    ("ERROR: [youtube] abc: Requested format is not available", "fatal"),
+    ("ERROR: unable to download video data: HTTP Error 503: Service Unavailable", "transient"),
+    ("ERROR: Something nobody has seen before", "unknown"),
+])
+def test_classify_error(message, error_class):
+    assert engine.classify_error([None, message]) == error_class
+
+def test_retry_delay_backs_off_within_the_policy():
+    attempts, base_delay, max_delay = engine.RETRY_POLICIES["transient"]
+    for attempt in range(1, attempts + 1):
+        bound = min(max_delay, base_delay * 2 ** (attempt - 1))
+        assert bound / 2 <= engine.retry_delay("transient", attempt) <= bound
+    assert engine.retry_delay("transient", attempts + 1) is None
+    assert engine.retry_delay("permanent", 1) is None
+
+def test_circuit_breaker_cooldown_doubles_until_reset():
+    breaker = engine.HostCircuitBreaker(cooldown=0.0, max_cooldown=0.0)
+    assert breaker.trip("example.com") == 0.0
+    assert breaker.is_half_open("example.com") and breaker.blocked_for("example.com") == 0.0
+    breaker.reset("example.com")
+    assert not breaker.is_half_open("example.com")
+
+    breaker = engine.HostCircuitBreaker(cooldown=10.0, max_cooldown=15.0)
+    assert breaker.trip("example.com") == 10.0
+    assert breaker.trip("example.com") is None # Already open
+    assert 9.0 < breaker.blocked_for("example.com") <= 10.0
+    assert breaker.blocked_for("example.org") == 0.0
+
+class RecordingScheduler:
+    def __init__(self):
+        self.retried = []
+
+    def retry(self, job, delay):
+        self.retried.append(job)
+
+def test_every_attempt_leaves_a_metrics_record(tmp_path):
+    batch = engine.DownloadBatch([], "audio", False, False, "en", str(tmp_path))
+    batch.scheduler = RecordingScheduler()
+    job = engine.DownloadJob("https://example.com/clip")
+    batch.handle_failure(job, "ERROR: HTTP Error 503: Service Unavailable")
+    batch.handle_failure(job, "ERROR: HTTP Error 503: Service Unavailable")
+    assert batch.scheduler.retried == [job, job]
+    job.state = "done"
+    batch.record_metrics(job)
+    assert [(r["attempt"], r["state"]) for r in batch.job_metrics] == [(0, "retrying"), (1, "retrying"),
+                                                                       (2, "done")]
+    summary = batch.metrics_summary()
+    assert summary["retries"] == 2 and summary["jobs"] == {"done": 1}
+
+def test_playlist_failures_are_neither_retried_nor_remembered(tmp_path):
+    batch = engine.DownloadBatch([], "audio", False, False, "en", str(tmp_path))
+    batch.scheduler = RecordingScheduler()
+    job = engine.DownloadJob("https://example.com/playlist?list=unlucky", "full_playlist")
+    batch.handle_failure(job, "ERROR: [youtube] abc: Private video")
+    other = engine.DownloadJob("https://example.com/playlist?list=flaky", "playlist_first")
+    batch.handle_failure(other, "ERROR: HTTP Error 503: Service Unavailable")
+    assert batch.scheduler.retried == []
+    assert job.state == other.state == "error"
+    assert engine.download_index.lookup_failure(job.media_key) is None
+
+    single = engine.DownloadJob("https://example.com/clip/gone")
+    batch.handle_failure(single, "ERROR: [fake] gone: Video unavailable")
+    assert engine.download_index.lookup_failure(single.media_key)
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import media_catcher_engine as engine
+
+# Stands in for a freshly spawned worker that is still importing modules before its os.setsid()
+SLOW_SETSID = "import os, time; time.sleep(1.5); os.setsid(); time.sleep(30)"
+
+@pytest.mark.skipif(sys.platform == "win32", reason="process groups are POSIX only")
+def test_stop_reaches_a_worker_before_its_setsid():
+    process = subprocess.Popen([sys.executable, "-c", SLOW_SETSID])
+    done = threading.Event()
+    started = time.monotonic()
+    engine.terminate_process_trees([process], grace=5, on_done=lambda seconds: done.set())
+    assert process.wait(timeout=1) != 0
+    assert done.wait(timeout=1)
+    assert time.monotonic() - started < 1
+
+def test_cancelled_job_is_never_sent_to_a_worker(tmp_path):
+    pytest.importorskip("yt_dlp")
+    youtubedl = engine.YoutubeDLEngine()
+    job = engine.DownloadJob("https://example.com/clip")
+    job.cancel_token.cancel()
+    progress = []
+    options = {"url": job.url, "outtmpl": str(tmp_path / "%(title)s.%(ext)s"), "playlist": "none"}
+    returncode, _ = youtubedl.run(job, options, progress.append)
+    assert returncode != 0 and not progress
+    assert not engine.processes_of(lambda other: other is job)
+    youtubedl.shutdown()
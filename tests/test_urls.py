@@ -0,0 +1,42 @@
+import pytest
+
+import media_catcher_engine as engine
+
+@pytest.mark.parametrize("url", [
+    "https://youtu.be/dQw4w9WgXcQ?t=42",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    " https://www.youtube.com/watch?v=dQw4w9WgXcQ&si=abc#t=10 ",
+])
+def test_youtube_spellings_share_one_canonical_url(url):
+    assert engine.canonical_url(url) == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def test_other_urls_lose_tracking_parameters_and_fragment():
+    assert (engine.canonical_url("HTTPS://Example.COM/media/1?utm_source=x&id=7&fbclid=y#top")
+            == "https://example.com/media/1?id=7")
+    assert engine.canonical_url("not a url") == "not a url"
+
+def test_duplicate_spellings_share_a_media_key_but_keep_their_url():
+    first = engine.DownloadJob("https://youtu.be/dQw4w9WgXcQ?t=42")
+    second = engine.DownloadJob("https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+    assert first.media_key == second.media_key == ("Youtube", "dQw4w9WgXcQ")
+    assert first.url == "https://youtu.be/dQw4w9WgXcQ?t=42"
+
+    other = engine.DownloadJob("https://example.com/clip?utm_medium=social")
+    assert other.media_key == ("url", "https://example.com/clip")
+    assert other.url == "https://example.com/clip?utm_medium=social"
+
+def test_single_videos_are_downloaded_from_the_url_given(tmp_path):
+    batch = engine.DownloadBatch([], "audio", False, False, "en", str(tmp_path))
+    [job] = batch.expand_url("https://example.com/clip?session=abc&utm_source=x")
+    assert job.url == "https://example.com/clip?session=abc&utm_source=x"
+    [job] = batch.expand_url("https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123&index=2")
+    assert job.url == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def test_sync_reports_a_missing_yt_dlp_instead_of_raising(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "YTDLP_COMMAND", [str(tmp_path / "no-such-yt-dlp")])
+    messages = []
+    batch = engine.DownloadBatch([], "audio", True, False, "en", str(tmp_path), sync=True,
+                                 on_status=lambda message, color: messages.append(message))
+    assert batch.sync_playlist("https://www.youtube.com/playlist?list=PL123") == []
+    assert messages and messages[-1].startswith("❌ Could not list")